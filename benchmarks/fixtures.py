@@ -0,0 +1,179 @@
+import io
+import random
+import sd3.rom
+import sd3.tree
+import sd3.cfa.graph
+import sd3.disasm.operands
+from sd3.disasm.attributes import Attr
+from sd3.disasm.addr_modes import AddrMode
+
+# Everything is generated from a seed, so results can be compared across
+# commits without the game ROM.
+SEED = 0x5D3
+
+ROM_SIZE = 0x400000
+
+ROUTINE_ADDR = 0xC10000
+SUBROUTINE_ADDR = 0xC18000
+
+_PARAM_LEN = {
+    AddrMode.none: 0,
+    AddrMode.accumulator: 0,
+    AddrMode.direct: 1,
+    AddrMode.direct_indexed: 1,
+    AddrMode.indirect: 1,
+    AddrMode.indirect_indexed: 1,
+    AddrMode.indirect_long: 1,
+    AddrMode.indirect_long_indexed: 1,
+    AddrMode.stack_relative: 1,
+    AddrMode.pc_relative: 1,
+    AddrMode.absolute: 2,
+    AddrMode.absolute_indexed: 2,
+    AddrMode.absolute_indexed_indirect: 2,
+    AddrMode.block_move: 2,
+    AddrMode.absolute_long: 3,
+    AddrMode.absolute_long_indexed: 3,
+}
+
+# Instructions changing the control flow or P aren't randomly picked
+_SPECIAL_ATTRS = {Attr.branch, Attr.jump, Attr.enter_sub, Attr.return_sub,
+                  Attr.reset_p, Attr.set_p}
+
+_OPCODE_BNE = 0xD0
+_OPCODE_JSR = 0x20
+_OPCODE_RTS = 0x60
+
+
+def get_random(salt=0):
+    return random.Random(SEED + salt)
+
+
+def build_rom(rnd, size=ROM_SIZE):
+    data = bytearray(rnd.getrandbits(8 * size).to_bytes(size, "little"))
+
+    code = build_routine_code(rnd, ROUTINE_ADDR)
+    offset = sd3.rom.HighRomConv.snes_to_rom(ROUTINE_ADDR)
+    data[offset:offset+len(code)] = code
+
+    f = io.BytesIO(data)
+    return sd3.rom.Rom.from_file(f, sd3.rom.HighRomConv)
+
+
+def build_tree(rnd, leaf_count):
+    # Split random leaves until the expected count is reached. Leaves are
+    # picked uniformly, so code lengths are unbalanced like in a Huffman
+    # tree.
+    tree = sd3.tree.Tree.new()
+    leaves = [tree.add_node()]
+
+    while len(leaves) < leaf_count:
+        node = leaves.pop(rnd.randrange(len(leaves)))
+
+        child0 = tree.add_node()
+        child1 = tree.add_node()
+        tree.set_children(node, child0, child1)
+
+        leaves.extend([child0, child1])
+
+    for value, node in enumerate(leaves):
+        tree.set_value(node, value & 0xFF)
+
+    return tree
+
+
+def _get_simple_opcodes():
+    opcodes = []
+
+    for operand in sd3.disasm.operands.get_desc_list():
+        for opcode in operand.opcodes:
+            attrs = set(operand.attrs) | set(opcode.attrs)
+            if attrs & _SPECIAL_ATTRS:
+                continue
+
+            # P is kept to M=0, X=0: 16 bits immediate values
+            if opcode.addr_mode == AddrMode.immediate:
+                dependant = {Attr.m_dependant, Attr.x_dependant}
+                param_len = 2 if attrs & dependant else 1
+            else:
+                param_len = _PARAM_LEN[opcode.addr_mode]
+
+            opcodes.append((opcode.opcode, param_len))
+
+    return sorted(opcodes)
+
+
+def build_routine_code(rnd, addr, instr_count=400):
+    opcodes = _get_simple_opcodes()
+
+    # Pick instructions. Some of them are branches or subroutine calls.
+    instructions = []
+    for _ in range(instr_count):
+        kind = rnd.random()
+        if kind < 0.1:
+            instructions.append((_OPCODE_BNE, 1))
+        elif kind < 0.15:
+            instructions.append((_OPCODE_JSR, 2))
+        else:
+            instructions.append(rnd.choice(opcodes))
+
+    instructions.append((_OPCODE_RTS, 0))
+
+    # Compute instruction addresses
+    addr_list = []
+    next_addr = addr
+    for _, param_len in instructions:
+        addr_list.append(next_addr)
+        next_addr += 1 + param_len
+
+    # Generate code. Branches target a close instruction.
+    code = bytearray()
+    for i, (opcode, param_len) in enumerate(instructions):
+        code.append(opcode)
+
+        if opcode == _OPCODE_BNE:
+            next_instr = addr_list[i] + 2
+            candidates = [a - next_instr for a in addr_list
+                          if -128 <= a - next_instr < 128]
+            code += rnd.choice(candidates).to_bytes(1, "little", signed=True)
+        elif opcode == _OPCODE_JSR:
+            sub_addr = SUBROUTINE_ADDR + 0x10 * rnd.randrange(0x100)
+            code += (sub_addr & 0xFFFF).to_bytes(2, "little")
+        else:
+            code += rnd.getrandbits(8 * param_len).to_bytes(param_len,
+                                                            "little")
+
+    return code
+
+
+def build_cfg(rnd, node_count):
+    graph = sd3.cfa.graph.Graph()
+
+    nodes = []
+    for i in range(node_count):
+        node, _ = graph.add_node("%d" % i)
+        nodes.append(node)
+
+    graph.set_entry(nodes[0])
+    graph.set_exit(nodes[-1])
+
+    # A chain, with forward edges (conditions) and back edges (loops)
+    for i in range(node_count - 1):
+        nodes[i].add_successor(nodes[i + 1])
+
+        if rnd.random() < 0.3 and i + 2 < node_count:
+            dest = rnd.randrange(i + 2, min(i + 8, node_count))
+            nodes[i].add_successor(nodes[dest])
+
+        if rnd.random() < 0.1 and i > 0:
+            dest = rnd.randrange(max(1, i - 8), i + 1)
+            nodes[i].add_successor(nodes[dest])
+
+    return graph
+
+
+def build_dialog(rnd, line_count=4, line_size=24):
+    FIRST_CHAR = 0x20
+    LAST_CHAR = 0x3FF
+
+    return [[rnd.randint(FIRST_CHAR, LAST_CHAR) for _ in range(line_size)]
+            for _ in range(line_count)]
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import timeit
+import logging
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import sd3.gfx
+import sd3.tree
+import sd3.bitutils
+import sd3.disasm.cpu
+import sd3.cfa.dominator
+import benchmarks.fixtures as fixtures
+
+_FORMAT_VERSION = 1
+
+_benchmarks = []
+
+
+class Benchmark:
+    def __init__(self, name, setup, op_count):
+        self.name = name
+        self.setup = setup
+
+        # Number of operations done by a call, to report a time per operation
+        self.op_count = op_count
+
+
+def benchmark(name, op_count=1):
+    def register(setup):
+        _benchmarks.append(Benchmark(name, setup, op_count))
+        return setup
+
+    return register
+
+
+def _get_word_src(rnd, count):
+    words = [rnd.getrandbits(16) for _ in range(count)]
+
+    def build_reader():
+        it = iter(words)
+        return sd3.bitutils.BitReader.from_src(lambda: next(it, None), 16)
+
+    return build_reader
+
+
+_SYMBOL_COUNT = 2000
+
+
+@benchmark("tree.decode", op_count=_SYMBOL_COUNT)
+def _bench_tree_decode(env):
+    tree = fixtures.build_tree(fixtures.get_random(1), 256)
+    build_reader = _get_word_src(fixtures.get_random(2), 2 * _SYMBOL_COUNT)
+
+    def run():
+        reader = build_reader()
+        for _ in range(_SYMBOL_COUNT):
+            tree.decode(reader)
+
+    return run
+
+
+@benchmark("tree.compiled_decode", op_count=_SYMBOL_COUNT)
+def _bench_compiled_tree_decode(env):
+    tree = fixtures.build_tree(fixtures.get_random(1), 256).compile()
+    build_reader = _get_word_src(fixtures.get_random(2), 2 * _SYMBOL_COUNT)
+
+    def run():
+        reader = build_reader()
+        for _ in range(_SYMBOL_COUNT):
+            tree.decode(reader)
+
+    return run
+
+
+_READ_COUNT = 5000
+
+
+@benchmark("bitutils.read_bits", op_count=_READ_COUNT)
+def _bench_read_bits(env):
+    rnd = fixtures.get_random(3)
+    widths = [rnd.randint(1, 16) for _ in range(_READ_COUNT)]
+
+    def run():
+        reader = sd3.bitutils.BitReader.from_rom_u16_big(env.rom, 0xC20000)
+        for width in widths:
+            reader.read_bits(width)
+
+    return run
+
+
+_CHAR_COUNT = 200
+
+
+@benchmark("gfx.read_char", op_count=_CHAR_COUNT)
+def _bench_read_char(env):
+    rnd = fixtures.get_random(4)
+    chars = [rnd.randrange(988) for _ in range(_CHAR_COUNT)]
+    font_reader = sd3.gfx.FontReader(env.rom)
+
+    def run():
+        for idx in chars:
+            font_reader.read_char(idx)
+
+    return run
+
+
+@benchmark("gfx.write_to_img")
+def _bench_write_to_img(env):
+    dialog = fixtures.build_dialog(fixtures.get_random(5))
+    drawer = sd3.gfx.DialogDrawer(env.rom)
+    path = os.path.join(env.tmp_dir, "dialog.png")
+
+    def run():
+        drawer.write_to_img(dialog, path)
+
+    return run
+
+
+@benchmark("disasm.read_routine")
+def _bench_read_routine(env):
+    reader = sd3.disasm.cpu.Reader(env.rom)
+
+    def run():
+        # read_routine updates P
+        p = sd3.disasm.cpu.PRegister(X=0, M=0)
+        reader.read_routine(fixtures.ROUTINE_ADDR, p)
+
+    return run
+
+
+@benchmark("cfa.build_dominator_graph")
+def _bench_build_dominator_graph(env):
+    graph = fixtures.build_cfg(fixtures.get_random(6), 60)
+
+    def run():
+        sd3.cfa.dominator.build_graph(graph)
+
+    return run
+
+
+class _Env:
+    def __init__(self, tmp_dir):
+        self.rom = fixtures.build_rom(fixtures.get_random())
+        self.tmp_dir = tmp_dir
+
+
+def _get_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"],
+                             capture_output=True, text=True, check=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return out.stdout.strip()
+
+
+def _run_benchmark(bench, env, repeat, min_time):
+    run = bench.setup(env)
+
+    # Calibrate the number of calls per measure
+    timer = timeit.Timer(run)
+    number, _ = timer.autorange()
+    while number > 1 and timer.timeit(number) > 2 * min_time:
+        number //= 2
+
+    times = [t / number / bench.op_count
+             for t in timer.repeat(repeat=repeat, number=number)]
+
+    return {
+        "min": min(times),
+        "median": statistics.median(times),
+        "number": number,
+        "repeat": repeat,
+        "op_count": bench.op_count,
+    }
+
+
+def _format_time(value):
+    for unit, scale in [("s", 1), ("ms", 1e-3), ("us", 1e-6)]:
+        if value >= scale:
+            return "%.2f %s" % (value / scale, unit)
+
+    return "%.2f ns" % (value / 1e-9)
+
+
+def _print_result(name, result, ref):
+    line = "%-32s %12s" % (name, _format_time(result["min"]))
+
+    if ref is not None and name in ref:
+        ratio = ref[name]["min"] / result["min"]
+        line += "  x%.2f" % ratio
+
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the benchmark suite")
+    parser.add_argument("-o", "--output", help="JSON output path")
+    parser.add_argument("-c", "--compare",
+                        help="JSON output of a previous run to compare with")
+    parser.add_argument("-f", "--filter",
+                        help="Only run the benchmarks containing this string")
+    parser.add_argument("-r", "--repeat", type=int, default=5,
+                        help="Number of measures per benchmark")
+    parser.add_argument("--min-time", type=float, default=0.2,
+                        help="Minimum duration of a measure in seconds")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    ref = None
+    if args.compare:
+        with open(args.compare) as f:
+            ref = json.load(f)["results"]
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        env = _Env(tmp_dir)
+
+        for bench in _benchmarks:
+            if args.filter and args.filter not in bench.name:
+                continue
+
+            result = _run_benchmark(bench, env, args.repeat, args.min_time)
+            results[bench.name] = result
+
+            _print_result(bench.name, result, ref)
+
+    output = {
+        "version": _FORMAT_VERSION,
+        "commit": _get_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": fixtures.SEED,
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=4, sort_keys=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,11 +5,19 @@ import sys
 import argparse
 import sd3.rom
 import sd3.gfx
+import sd3.tree_registry
 import sd3.seq.reader
+import sd3.seq.cache
+import sd3.seq.index
+import sd3.seq.profiler
 import sd3.tools.seq_operations
 import sd3.tools.jap_tbl
 import sd3.text_dumper
+import sd3.dialog_renderer
 import sd3.disasm.cpu
+import sd3.disasm.routine_db
+import sd3.disasm.sweep
+import sd3.disasm.xrefs
 import sd3.cfa.cfg
 import sd3.cfa.dominator
 import sd3.tools.gen_op_report
@@ -19,9 +27,42 @@ def int_parse(value):
     return int(value, 0)
 
 
+def seq_idx_parse(value):
+    idx = int_parse(value)
+    if not 0 <= idx < sd3.seq.index.SEQ_COUNT:
+        raise argparse.ArgumentTypeError(
+            "sequence index %s not in [0, %X]" % (
+                value, sd3.seq.index.SEQ_COUNT - 1))
+
+    return idx
+
+
+def bank_parse(value):
+    bank = int_parse(value)
+    if not (sd3.disasm.sweep.FIRST_BANK <= bank <=
+            sd3.disasm.sweep.LAST_BANK):
+        raise argparse.ArgumentTypeError(
+            "bank %s not in [%02X, %02X]" % (
+                value, sd3.disasm.sweep.FIRST_BANK,
+                sd3.disasm.sweep.LAST_BANK))
+
+    return bank
+
+
 def open_rom(path):
-    f = open(path, "rb")
-    return sd3.rom.Rom.from_file(f, sd3.rom.HighRomConv)
+    return sd3.rom.Rom.from_path(path, sd3.rom.HighRomConv)
+
+
+def read_routine(args):
+    rom = open_rom(args.rom)
+    routine_db = sd3.disasm.routine_db.RoutineDB.for_rom(rom, args.cache_dir)
+
+    p = sd3.disasm.cpu.PRegister(X=0, M=0)
+    logging.info("Read routine: %X", args.addr)
+    try:
+        return routine_db.get(args.addr, p)
+    finally:
+        routine_db.save()
 
 
 class Cmd:
@@ -99,7 +140,7 @@ class DumpDialog(Cmd):
 
         parser = subparsers.add_parser(name)
         parser.add_argument("rom", help="Source ROM")
-        parser.add_argument("idx", type=int_parse, help="Dialog index")
+        parser.add_argument("idx", type=seq_idx_parse, help="Dialog index")
         parser.add_argument("out", help="Output path")
 
         return name
@@ -111,8 +152,18 @@ class DumpDialog(Cmd):
         observer = DumpDialog.SeqObserver()
 
         rom = open_rom(args.rom)
-        decoder = sd3.seq.reader.Reader(rom)
-        decoder.read_sequence(args.idx, observer)
+        if args.cache_dir:
+            cache = sd3.seq.cache.SequenceCache.for_rom(args.cache_dir, rom)
+            decoder = sd3.seq.cache.CachedReader(rom, cache)
+        else:
+            cache = None
+            decoder = sd3.seq.reader.Reader(rom)
+
+        try:
+            decoder.read_sequence(args.idx, observer)
+        finally:
+            if cache is not None:
+                cache.save()
 
         logging.info("Decoded data")
         logging.info(observer.decoded)
@@ -121,6 +172,144 @@ class DumpDialog(Cmd):
         drawer.write_to_img(observer.decoded, args.out)
 
 
+class RenderDialogs(Cmd):
+    @staticmethod
+    def register_parser(subparsers):
+        name = "render_dialogs"
+
+        parser = subparsers.add_parser(name)
+        parser.add_argument("rom", help="Source ROM")
+        parser.add_argument("out_folder", help="Output folder")
+        parser.add_argument("--first", type=seq_idx_parse, default=0,
+                            help="First dialog index")
+        parser.add_argument("--last", type=seq_idx_parse,
+                            default=sd3.dialog_renderer.SEQ_COUNT - 1,
+                            help="Last dialog index")
+        parser.add_argument("--atlas", action="store_true",
+                            help="Pack the dialogs in one image, with a "
+                                 "JSON index")
+        parser.add_argument("--fragment", type=int_parse,
+                            help="Only render the dialogs referencing this "
+                                 "text sub-block")
+        parser.add_argument("-j", "--jobs", type=int, default=1,
+                            help="Number of decoding processes")
+
+        return name
+
+    @staticmethod
+    def run(args):
+        logging.info("Render dialogs %X to %X from %s",
+                     args.first, args.last, args.rom)
+
+        rom = open_rom(args.rom)
+
+        indexes = range(args.first, args.last + 1)
+        if args.fragment is not None:
+            fragment_index = sd3.text_dumper.get_fragment_index(
+                rom, jobs=args.jobs, cache_dir=args.cache_dir)
+            indexes = [idx for idx
+                       in fragment_index.get_sequences(args.fragment)
+                       if args.first <= idx <= args.last]
+
+        stats = sd3.dialog_renderer.render(
+            rom, args.out_folder,
+            indexes=indexes,
+            jobs=args.jobs, atlas=args.atlas, cache_dir=args.cache_dir)
+
+        logging.info("Summary")
+        logging.info("\tDialogs: %d", stats.seq_count)
+        logging.info("\tRendered: %d", stats.seq_rendered)
+        logging.info("\tError: %d", stats.seq_error)
+        logging.info("\tEmpty: %d", stats.seq_empty)
+
+
+class ListSequences(Cmd):
+    @staticmethod
+    def register_parser(subparsers):
+        name = "list_sequences"
+
+        parser = subparsers.add_parser(name)
+        parser.add_argument("rom", help="Source ROM")
+        parser.add_argument("--aliases", action="store_true",
+                            help="Only list the sequences having aliases")
+
+        return name
+
+    @staticmethod
+    def run(args):
+        rom = open_rom(args.rom)
+        seq_index = sd3.seq.index.SequenceIndex.from_rom(rom)
+
+        for first, end, bank in sd3.seq.index.BANK_RANGES:
+            logging.info("Bank %02X: sequences %04X to %04X",
+                         bank, first, end - 1)
+
+        count = 0
+        for idx, addr in seq_index.iter_unique():
+            aliases = seq_index.get_aliases(addr)[1:]
+            if args.aliases and not aliases:
+                continue
+
+            line = "%04X %06X" % (idx, addr)
+            if aliases:
+                line += " " + " ".join("%04X" % alias for alias in aliases)
+
+            print(line)
+            count += 1
+
+        logging.info("%d sequences listed", count)
+
+
+class ProfileSequences(Cmd):
+    @staticmethod
+    def register_parser(subparsers):
+        name = "profile_sequences"
+
+        parser = subparsers.add_parser(name)
+        parser.add_argument("rom", help="Source ROM")
+        parser.add_argument("out", help="JSON output path")
+        parser.add_argument("--collapsed",
+                            help="Collapsed stacks output path, for "
+                                 "flamegraph tools")
+        parser.add_argument("--first", type=seq_idx_parse, default=0,
+                            help="First sequence index")
+        parser.add_argument("--last", type=seq_idx_parse,
+                            default=sd3.seq.index.SEQ_COUNT - 1,
+                            help="Last sequence index")
+
+        return name
+
+    @staticmethod
+    def run(args):
+        rom = open_rom(args.rom)
+        seq_index = sd3.seq.index.SequenceIndex.from_rom(rom)
+
+        profiler = sd3.seq.profiler.Profiler()
+        reader = sd3.seq.profiler.ProfiledReader(
+            sd3.seq.reader.Reader(rom), profiler)
+
+        indexes = range(args.first, args.last + 1)
+        for idx, seq_addr in seq_index.iter_unique(indexes):
+            try:
+                reader.read_sequence_from_addr(seq_addr,
+                                               sd3.seq.reader.Observer())
+            except sd3.seq.reader.ReadException as e:
+                logging.info("Can't decode %04X (operation %02X)",
+                             idx, e.op_id)
+
+        profiler.write_json(args.out)
+        if args.collapsed:
+            profiler.write_collapsed(args.collapsed)
+
+        logging.info("Slowest operations")
+        ops = sorted(profiler.ops.items(), key=lambda item: item[1].time,
+                     reverse=True)
+        for op_id, stats in ops[:10]:
+            logging.info("\t%02X: %d calls, %.3f ms, %d bits, %d jumps",
+                         op_id, stats.count, stats.time * 1e3, stats.bits,
+                         stats.jumps)
+
+
 class ExtractText(Cmd):
     @staticmethod
     def register_parser(subparsers):
@@ -130,6 +319,11 @@ class ExtractText(Cmd):
         parser.add_argument("rom", help="Source ROM")
         parser.add_argument("table", help="Table path")
         parser.add_argument("out", help="Output path")
+        parser.add_argument("-j", "--jobs", type=int, default=1,
+                            help="Number of decoding processes")
+        parser.add_argument("-f", "--format", default="txt",
+                            choices=sd3.text_dumper.FORMATS,
+                            help="Output format")
 
         return name
 
@@ -139,7 +333,10 @@ class ExtractText(Cmd):
                      args.rom, args.table)
 
         rom = open_rom(args.rom)
-        stats = sd3.text_dumper.dump(rom, args.table, args.out)
+        stats = sd3.text_dumper.dump(rom, args.table, args.out,
+                                     jobs=args.jobs,
+                                     cache_dir=args.cache_dir,
+                                     fmt=args.format)
 
         def percent(part):
             return (part * 100) // stats.seq_count
@@ -158,6 +355,35 @@ class ExtractText(Cmd):
                      stats.seq_empty, percent(stats.seq_empty))
 
 
+class FindFragment(Cmd):
+    @staticmethod
+    def register_parser(subparsers):
+        name = "find_fragment"
+
+        parser = subparsers.add_parser(name)
+        parser.add_argument("rom", help="Source ROM")
+        parser.add_argument("sub_idx", type=int_parse,
+                            help="Text sub-block index")
+        parser.add_argument("-j", "--jobs", type=int, default=1,
+                            help="Number of decoding processes, if the "
+                                 "index must be built")
+
+        return name
+
+    @staticmethod
+    def run(args):
+        rom = open_rom(args.rom)
+        fragment_index = sd3.text_dumper.get_fragment_index(
+            rom, jobs=args.jobs, cache_dir=args.cache_dir)
+
+        indexes = fragment_index.get_sequences(args.sub_idx)
+        for idx in indexes:
+            print("%04X" % idx)
+
+        logging.info("Sub-block %04X referenced by %d sequences",
+                     args.sub_idx, len(indexes))
+
+
 class GetOperationSub(Cmd):
     @staticmethod
     def register_parser(subparsers):
@@ -197,13 +423,8 @@ class DisplaySub(Cmd):
 
     @staticmethod
     def run(args):
-        with open(args.rom, "rb") as f:
-            rom = sd3.rom.Rom.from_file(f, sd3.rom.HighRomConv)
-            cpu_reader = sd3.disasm.cpu.Reader(rom)
-
-            p = sd3.disasm.cpu.PRegister(X=0, M=0)
-            routine = cpu_reader.read_routine(args.addr, p)
-            routine.display()
+        routine = read_routine(args)
+        routine.display()
 
 
 class DrawSub(Cmd):
@@ -221,13 +442,7 @@ class DrawSub(Cmd):
     @staticmethod
     def run(args):
         logging.info("Open file: %s", args.rom)
-        with open(args.rom, "rb") as f:
-            rom = sd3.rom.Rom.from_file(f, sd3.rom.HighRomConv)
-            cpu_reader = sd3.disasm.cpu.Reader(rom)
-
-            p = sd3.disasm.cpu.PRegister(X=0, M=0)
-            logging.info("Read routine: %X", args.addr)
-            routine = cpu_reader.read_routine(args.addr, p)
+        routine = read_routine(args)
 
         logging.info("Build graph")
         cfg = sd3.cfa.cfg.build_graph(routine)
@@ -261,13 +476,7 @@ class DrawSubDom(Cmd):
     @staticmethod
     def run(args):
         logging.info("Open file: %s", args.rom)
-        with open(args.rom, "rb") as f:
-            rom = sd3.rom.Rom.from_file(f, sd3.rom.HighRomConv)
-            cpu_reader = sd3.disasm.cpu.Reader(rom)
-
-            p = sd3.disasm.cpu.PRegister(X=0, M=0)
-            logging.info("Read routine: %X", args.addr)
-            routine = cpu_reader.read_routine(args.addr, p)
+        routine = read_routine(args)
 
         logging.info("Build graph")
         cfg = sd3.cfa.cfg.build_graph(routine)
@@ -279,6 +488,119 @@ class DrawSubDom(Cmd):
         logging.info("Graph saved to %s" % graph_path)
 
 
+class ExploreRoutines(Cmd):
+    @staticmethod
+    def register_parser(subparsers):
+        name = "explore_routines"
+
+        parser = subparsers.add_parser(name)
+        parser.add_argument("rom", help="Source ROM")
+
+        return name
+
+    @staticmethod
+    def run(args):
+        # Disassemble the operation handlers and all the routines they call
+        rom = open_rom(args.rom)
+        routine_db = sd3.disasm.routine_db.RoutineDB.for_rom(rom,
+                                                             args.cache_dir)
+
+        handlers = {sub_addr for _, sub_addr
+                    in sd3.tools.seq_operations.get_op_list(rom)}
+
+        try:
+            for sub_addr in sorted(handlers):
+                p = sd3.disasm.cpu.PRegister(X=0, M=0)
+                routine_db.explore(sub_addr, p)
+        finally:
+            routine_db.save()
+
+        logging.info("%d routines disassembled, %d failed",
+                     len(routine_db.routines), len(routine_db.errors))
+
+        # Only the new routines are indexed
+        xref_index = sd3.disasm.xrefs.XrefIndex.for_rom(rom, args.cache_dir)
+        count = xref_index.update(routine_db)
+        xref_index.save()
+
+        logging.info("%d routines added to the xref index", count)
+
+
+class Xrefs(Cmd):
+    @staticmethod
+    def register_parser(subparsers):
+        name = "xrefs"
+
+        parser = subparsers.add_parser(name)
+        parser.add_argument("rom", help="Source ROM")
+        parser.add_argument("addr", type=int_parse, help="Referenced address")
+        parser.add_argument("--kind",
+                            choices=[kind.name for kind
+                                     in sd3.disasm.xrefs.XrefKind],
+                            help="Only list this kind of reference")
+        parser.add_argument("--update", action="store_true",
+                            help="Index the routines disassembled since the "
+                                 "last explore_routines")
+
+        return name
+
+    @staticmethod
+    def run(args):
+        # The index is built by explore_routines
+        if args.cache_dir is None:
+            logging.warning("No cache folder, the xref index is empty")
+
+        rom = open_rom(args.rom)
+        xref_index = sd3.disasm.xrefs.XrefIndex.for_rom(rom, args.cache_dir)
+
+        if args.update:
+            routine_db = sd3.disasm.routine_db.RoutineDB.for_rom(
+                rom, args.cache_dir)
+            xref_index.update(routine_db)
+            xref_index.save()
+
+        kind = None
+        if args.kind is not None:
+            kind = sd3.disasm.xrefs.XrefKind[args.kind]
+
+        for ref in xref_index.get(args.addr, kind):
+            print("%06X %s" % (ref.source, ref.kind.name))
+
+
+class DisasmBank(Cmd):
+    @staticmethod
+    def register_parser(subparsers):
+        name = "disasm_bank"
+
+        parser = subparsers.add_parser(name)
+        parser.add_argument("rom", help="Source ROM")
+        parser.add_argument("bank", type=bank_parse, help="Bank to sweep")
+        parser.add_argument("-m", type=int, default=0, choices=[0, 1],
+                            help="Initial M flag")
+        parser.add_argument("-x", type=int, default=0, choices=[0, 1],
+                            help="Initial X flag")
+
+        return name
+
+    @staticmethod
+    def run(args):
+        # Instructions also found by explore_routines are marked with '*'
+        rom = open_rom(args.rom)
+        routine_db = sd3.disasm.routine_db.RoutineDB.for_rom(rom,
+                                                             args.cache_dir)
+
+        p = sd3.disasm.cpu.PRegister(X=args.x, M=args.m)
+        index = sd3.disasm.sweep.sweep_bank(rom, args.bank, p, routine_db)
+
+        for idx in range(len(index)):
+            instr = index.get_instruction(idx)
+            if instr is None:
+                print("  %06X .db $%02X" % (index.addrs[idx],
+                                            index.opcodes[idx]))
+            else:
+                print("%s %s" % ("*" if index.is_code(idx) else " ", instr))
+
+
 class GenOperationMap(Cmd):
     @staticmethod
     def register_parser(subparsers):
@@ -318,7 +640,8 @@ class GenOperationReport(Cmd):
             cfg.track_routine = 0xC00760
             cfg.ignore_list = [0xC4403A, 0xC44048]
 
-            sd3.tools.gen_op_report.gen_html_report(rom, cfg, args.output)
+            sd3.tools.gen_op_report.gen_html_report(
+                rom, cfg, args.output, cache_dir=args.cache_dir)
             logging.info("File generated: %s", args.output)
 
 
@@ -343,6 +666,9 @@ def main():
     parser = argparse.ArgumentParser(description="Seiken Densetsu 3 dump tool")
     parser.add_argument("-v", "--verbose", help="Increase output verbosity",
                         action="store_true")
+    parser.add_argument("--cache-dir",
+                        help="Folder where decode trees and decoded "
+                             "sequences are cached")
 
     subparsers = parser.add_subparsers(dest="cmd", help="sub-command help")
 
@@ -359,6 +685,9 @@ def main():
     if args.verbose:
         logging.getLogger().setLevel(logging.DEBUG)
 
+    if args.cache_dir:
+        sd3.tree_registry.set_cache_dir(args.cache_dir)
+
     cmd_map[args.cmd].run(args)
 
 
@@ -1,8 +1,14 @@
+import struct
 from collections import namedtuple
-import sd3.rom
 
 BitReaderSrc = namedtuple("BitReaderSrc", ["bitsrc", "width"])
 
+# RomBitReader loads 32 bits at a time in an accumulator that never holds
+# more than 63 bits. Its state is also exposed as 16 bits words.
+_REFILL = struct.Struct(">I")
+_REFILL_WIDTH = 32
+_WORD_WIDTH = 16
+
 
 class BitReader:
     def __init__(self, src):
@@ -19,14 +25,7 @@ class BitReader:
 
     @staticmethod
     def from_rom_u16_big(rom, addr):
-        # Prepare BitReader input
-        rom_reader = sd3.rom.Rom.from_rom(rom)
-        rom_reader.seek(addr)
-
-        def bitreader_provider():
-            return rom_reader.read_u16(endianess=sd3.rom.BIG_ENDIAN)
-
-        return BitReader.from_src(bitreader_provider, 16)
+        return RomBitReader(rom, addr)
 
     def read_bits(self, remaining):
         value = 0
@@ -49,3 +48,112 @@ class BitReader:
             remaining -= bit_used
 
         return value
+
+    def peek_buffered_bits(self, count):
+        # Only refill when the buffer is empty, so the source is never read
+        # ahead. Returns the peeked bits and their count (<= count).
+        if self.count == 0:
+            self.value = self.src.bitsrc()
+            if self.value is None:
+                return (None, 0)
+
+            self.count = self.src.width
+
+        bit_used = min(self.count, count)
+        return (self.value >> (self.src.width - bit_used), bit_used)
+
+    def skip_bits(self, count):
+        if count > self.count:
+            self.read_bits(count)
+            return
+
+        self.value = (self.value << count) & self.mask
+        self.count -= count
+
+
+class RomBitReader:
+    def __init__(self, rom, addr):
+        self.rom = rom
+        self.start = rom.conv_addr.snes_to_rom(addr)
+
+        # Next byte to load in the accumulator
+        self.offset = self.start
+
+        self.acc = 0
+        self.acc_count = 0
+
+        # The accumulator is padded with zeros after the end of the ROM, so
+        # that peeks near the end work. pad_count is the number of padding
+        # bits at its end: they can't be consumed.
+        self.end = len(rom.data)
+        self.pad_count = 0
+
+    # value and count match the state of a BitReader reading 16 bits words
+    @property
+    def count(self):
+        return self.acc_count % _WORD_WIDTH
+
+    @property
+    def value(self):
+        count = self.count
+        remaining = (self.acc >> (self.acc_count - count)) & ((1 << count) - 1)
+
+        return (remaining << (_WORD_WIDTH - count)) & 0xFFFF
+
+    def _refill(self):
+        data = self.rom.data
+
+        if self.rom.tracer:
+            self.rom.tracer(self.offset,
+                            data[self.offset:self.offset+_REFILL.size])
+
+        if self.offset + _REFILL.size <= self.end:
+            word = _REFILL.unpack_from(data, self.offset)[0]
+        else:
+            tail = data[self.offset:self.offset+_REFILL.size]
+            word = int.from_bytes(bytes(tail).ljust(_REFILL.size, b"\0"),
+                                  "big")
+
+        self.offset += _REFILL.size
+        if self.offset > self.end:
+            self.pad_count = 8 * (self.offset - self.end)
+
+        # Drop the consumed bits to keep the accumulator small
+        self.acc &= (1 << self.acc_count) - 1
+        self.acc = (self.acc << _REFILL_WIDTH) | word
+        self.acc_count += _REFILL_WIDTH
+
+    def _raise_end(self):
+        # Same error as a 16 bits read beyond the end of the ROM
+        raise struct.error("Bit stream read beyond the end of the ROM")
+
+    def read_bits(self, count):
+        while self.acc_count < count:
+            self._refill()
+
+        self.acc_count -= count
+        if self.acc_count < self.pad_count:
+            self._raise_end()
+
+        return (self.acc >> self.acc_count) & ((1 << count) - 1)
+
+    def peek_bits(self, count):
+        while self.acc_count < count:
+            self._refill()
+
+        return (self.acc >> (self.acc_count - count)) & ((1 << count) - 1)
+
+    def peek_buffered_bits(self, count):
+        # Reading ahead in the ROM has no side effect
+        return (self.peek_bits(count), count)
+
+    def skip_bits(self, count):
+        while self.acc_count < count:
+            self._refill()
+
+        self.acc_count -= count
+        if self.acc_count < self.pad_count:
+            self._raise_end()
+
+    def bit_position(self):
+        return 8 * (self.offset - self.start) - self.acc_count
@@ -0,0 +1,75 @@
+import os
+import json
+import pickle
+import struct
+import logging
+import tempfile
+
+# Errors raised by the decoding of a corrupt or truncated file
+_DECODE_ERRORS = (struct.error, ValueError, KeyError, IndexError, TypeError,
+                  EOFError, pickle.UnpicklingError)
+
+
+def write_atomic(path, data):
+    # Write to a temporary file first: the file may be read by other
+    # processes, and an interrupted write doesn't leave a truncated file
+    out_dir = os.path.dirname(path) or "."
+    os.makedirs(out_dir, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=out_dir)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def save_pickle(path, data):
+    write_atomic(path, pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def save_json(path, data):
+    write_atomic(path, json.dumps(data).encode("utf-8"))
+
+
+def load(path, unpack, name):
+    # unpack gives the content of the file, or None if it's invalid. A
+    # missing, invalid or corrupt file is a cache miss: None is returned.
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+
+    try:
+        content = unpack(data)
+    except _DECODE_ERRORS as e:
+        logging.warning("Ignore invalid %s %s: %s", name, path, e)
+        return None
+
+    if content is None:
+        logging.warning("Ignore invalid %s %s", name, path)
+
+    return content
+
+
+def _check_version(data, version):
+    if not isinstance(data, dict) or data.get("version") != version:
+        return None
+
+    return data
+
+
+def load_pickle(path, name, version):
+    # Dictionary saved by save_pickle, with a "version" entry
+    return load(path, lambda data: _check_version(pickle.loads(data), version),
+                name)
+
+
+def load_json(path, name, version):
+    # Dictionary saved by save_json, with a "version" entry
+    return load(path, lambda data: _check_version(json.loads(data), version),
+                name)
@@ -0,0 +1,194 @@
+import os
+import enum
+import json
+import shutil
+import logging
+import numpy as np
+from PIL import Image
+import sd3.gfx
+import sd3.seq.index
+import sd3.text_dumper
+
+SEQ_COUNT = sd3.seq.index.SEQ_COUNT
+
+# Atlas images are at least this width. Wider dialogs get their own row.
+_ATLAS_WIDTH = 2048
+
+_ATLAS_IMG_NAME = "atlas.png"
+_ATLAS_INDEX_NAME = "atlas.json"
+
+
+def get_img_name(idx):
+    return "dialog_%04X.png" % idx
+
+
+class RenderStats:
+    def __init__(self):
+        self.seq_count = 0
+        self.seq_rendered = 0
+        self.seq_empty = 0
+        self.seq_error = 0
+
+
+class _RenderStatus(enum.Enum):
+    rendered = 1
+    empty = 2
+    error = 3
+
+
+class _Renderer:
+    # Renders the decoded sequences. With an atlas, the images are given to
+    # the atlas builder instead of being written.
+    def __init__(self, rom, output_dir, atlas_builder):
+        self.drawer = sd3.gfx.DialogDrawer(rom)
+        self.output_dir = output_dir
+        self.atlas_builder = atlas_builder
+
+    def render(self, record):
+        if record.status == sd3.text_dumper.SequenceStatus.error:
+            logging.info("Can't decode %04X (operation %02X)", record.idx,
+                         record.op_id)
+            return _RenderStatus.error
+
+        logging.info("Rendering %04X", record.idx)
+
+        img = self.drawer.render(record.blocks)
+        if img.width == 0 or img.height == 0:
+            return _RenderStatus.empty
+
+        if self.atlas_builder is not None:
+            self.atlas_builder.add(record.idx, img.size, img.tobytes())
+        else:
+            img.save(os.path.join(self.output_dir, get_img_name(record.idx)))
+
+        return _RenderStatus.rendered
+
+
+class _AtlasBuilder:
+    def __init__(self):
+        self.entries = []
+
+    def add(self, idx, size, pixels):
+        self.entries.append((idx, size, pixels))
+
+    def _get_layout(self):
+        # Images are placed on rows, from left to right
+        width = max([_ATLAS_WIDTH] +
+                    [size[0] for _, size, _ in self.entries])
+
+        layout = []
+        x, y = 0, 0
+        row_height = 0
+
+        for _, size, _ in self.entries:
+            if x + size[0] > width:
+                x = 0
+                y += row_height
+                row_height = 0
+
+            layout.append((x, y))
+
+            x += size[0]
+            row_height = max(row_height, size[1])
+
+        return (width, y + row_height, layout)
+
+    def save(self, output_dir, aliases):
+        if not self.entries:
+            logging.warning("No dialog rendered, atlas not written")
+            return
+
+        atlas_width, atlas_height, layout = self._get_layout()
+        pixels = np.zeros((atlas_height, atlas_width, 3), dtype=np.uint8)
+
+        index = []
+        for (idx, size, data), (x, y) in zip(self.entries, layout):
+            width, height = size
+
+            img = np.frombuffer(data, dtype=np.uint8)
+            pixels[y:y+height, x:x+width] = img.reshape(height, width, 3)
+
+            for alias in [idx] + aliases.get(idx, []):
+                index.append({
+                    "idx": alias,
+                    "x": x,
+                    "y": y,
+                    "width": width,
+                    "height": height,
+                })
+
+        index.sort(key=lambda entry: entry["idx"])
+
+        img = Image.frombuffer("RGB", (atlas_width, atlas_height), pixels,
+                               "raw", "RGB", 0, 1)
+        img.save(os.path.join(output_dir, _ATLAS_IMG_NAME))
+
+        with open(os.path.join(output_dir, _ATLAS_INDEX_NAME), "w") as f:
+            json.dump({"image": _ATLAS_IMG_NAME, "dialogs": index}, f,
+                      indent=4)
+
+
+class _DialogRenderer:
+    def __init__(self, rom, output_dir, indexes, jobs, atlas, cache_dir):
+        self.rom = rom
+        self.output_dir = output_dir
+        self.indexes = list(indexes)
+        self.jobs = jobs
+        self.atlas = atlas
+        self.cache_dir = cache_dir
+
+    def run(self):
+        stats = RenderStats()
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        atlas_builder = _AtlasBuilder() if self.atlas else None
+        renderer = _Renderer(self.rom, self.output_dir, atlas_builder)
+
+        # Sequences sharing an address are decoded and rendered once
+        seq_index = sd3.seq.index.SequenceIndex.from_rom(self.rom)
+        requested = set(self.indexes)
+        aliases = {}
+
+        for record in sd3.text_dumper.iter_sequences(
+                self.rom, self.indexes, jobs=self.jobs,
+                cache_dir=self.cache_dir):
+            alias_list = [alias for alias
+                          in seq_index.get_aliases(record.addr)
+                          if alias != record.idx and alias in requested]
+            if alias_list:
+                aliases[record.idx] = alias_list
+
+            status = renderer.render(record)
+
+            stats.seq_count += 1 + len(alias_list)
+            if status == _RenderStatus.empty:
+                stats.seq_empty += 1 + len(alias_list)
+                continue
+            elif status == _RenderStatus.error:
+                stats.seq_error += 1 + len(alias_list)
+                continue
+
+            stats.seq_rendered += 1 + len(alias_list)
+
+            if atlas_builder is not None:
+                continue
+
+            img_path = os.path.join(self.output_dir, get_img_name(record.idx))
+            for alias in alias_list:
+                shutil.copyfile(img_path, os.path.join(self.output_dir,
+                                                       get_img_name(alias)))
+
+        if atlas_builder is not None:
+            atlas_builder.save(self.output_dir, aliases)
+
+        return stats
+
+
+def render(rom, output_dir, indexes=None, jobs=1, atlas=False,
+           cache_dir=None):
+    if indexes is None:
+        indexes = range(SEQ_COUNT)
+
+    renderer = _DialogRenderer(rom, output_dir, indexes, jobs, atlas,
+                               cache_dir)
+    return renderer.run()
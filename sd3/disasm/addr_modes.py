@@ -23,6 +23,32 @@ class AddrMode(enum.Enum):
     block_move = 16
 
 
+# Computation of the jump target of an instruction
+class TargetKind(enum.Enum):
+    none = 0
+    # Next instruction address + parameter
+    relative = 1
+    # Parameter in the bank of the instruction
+    bank = 2
+    # Parameter is the address
+    long = 3
+    # Target read from memory: unknown
+    indirect = 4
+
+
+def get_target(kind, addr, param, next_addr):
+    if kind is TargetKind.relative:
+        return next_addr + param
+    elif kind is TargetKind.bank:
+        return (addr & 0xFF0000) | param
+    elif kind is TargetKind.long:
+        return param
+    elif kind is TargetKind.indirect:
+        return None
+
+    raise Exception("Not implemented")
+
+
 def _get_str_index(opcode):
     if Attr.indexed_x in opcode.attrs:
         return "X"
@@ -32,34 +58,67 @@ def _get_str_index(opcode):
         raise Exception("Opcode not indexed")
 
 
+def _read_u8(rom):
+    return rom.read_u8()
+
+
+def _read_i8(rom):
+    return rom.read_i8()
+
+
+def _read_u16(rom):
+    return rom.read_u16()
+
+
+def _read_u24(rom):
+    v = 0
+    for i in range(3):
+        v |= rom.read_u8() << (8 * i)
+
+    return v
+
+
+_PARAM_READERS = {
+    1: _read_u8,
+    2: _read_u16,
+    3: _read_u24,
+}
+
+
 class AddrModeBase:
-    def __init__(self, mode):
+    # param_len is None when the mode has no parameter
+    def __init__(self, mode, param_len=None, target_kind=TargetKind.none):
         self.mode = mode
+        self.param_len = param_len
+        self.target_kind = target_kind
+
+    def get_param_len(self, opcode, p):
+        return self.param_len
 
-    def _read_u24(self, rom):
-        v = 0
-        for i in range(3):
-            v |= rom.read_u8() << (8 * i)
+    def get_param_reader(self, param_len):
+        if param_len is None:
+            return None
 
-        return v
+        return _PARAM_READERS[param_len]
 
     def read_param(self, rom, opcode, p):
-        raise Exception("Not implemented")
+        param_len = self.get_param_len(opcode, p)
+        if param_len is None:
+            return (None, None)
+
+        return (self.get_param_reader(param_len)(rom), param_len)
 
     def to_str(self, opcode, param, param_len):
         raise Exception("Not implemented")
 
     def get_jump_target(self, addr, param, next_addr):
-        raise Exception("Not implemented")
+        return get_target(self.target_kind, addr, param, next_addr)
 
 
 class AddrModeNone(AddrModeBase):
     def __init__(self):
         super().__init__(AddrMode.none)
 
-    def read_param(self, rom, opcode, p):
-        return (None, None)
-
     def to_str(self, opcode, param, param_len):
         return None
 
@@ -68,7 +127,7 @@ class AddrModeImmediate(AddrModeBase):
     def __init__(self):
         super().__init__(AddrMode.immediate)
 
-    def _check_len(self, opcode, p):
+    def get_param_len(self, opcode, p):
         if Attr.m_dependant in opcode.attrs and p.M == 0:
             return 2
 
@@ -77,15 +136,6 @@ class AddrModeImmediate(AddrModeBase):
 
         return 1
 
-    def read_param(self, rom, opcode, p):
-        param_len = self._check_len(opcode, p)
-        if param_len == 2:
-            return (rom.read_u16(), param_len)
-        elif param_len == 1:
-            return (rom.read_u8(), param_len)
-        else:
-            raise Exception("Unexpected length")
-
     def to_str(self, opcode, param, param_len):
         if param_len == 2:
             return "#$%04X" % param
@@ -97,24 +147,16 @@ class AddrModeImmediate(AddrModeBase):
 
 class AddrModeDirect(AddrModeBase):
     def __init__(self):
-        super().__init__(AddrMode.direct)
-
-    def read_param(self, rom, opcode, p):
-        return (rom.read_u8(), 1)
+        super().__init__(AddrMode.direct, 1,
+                         TargetKind.relative)
 
     def to_str(self, opcode, param, param_len):
         return "$%02X" % param
 
-    def get_jump_target(self, addr, param, next_addr):
-        return next_addr + param
-
 
 class AddrModeDirectIndexed(AddrModeBase):
     def __init__(self):
-        super().__init__(AddrMode.direct_indexed)
-
-    def read_param(self, rom, opcode, p):
-        return (rom.read_u8(), 1)
+        super().__init__(AddrMode.direct_indexed, 1)
 
     def to_str(self, opcode, param, param_len):
         str_index = _get_str_index(opcode)
@@ -123,10 +165,7 @@ class AddrModeDirectIndexed(AddrModeBase):
 
 class AddrModeIndirect(AddrModeBase):
     def __init__(self):
-        super().__init__(AddrMode.indirect)
-
-    def read_param(self, rom, opcode, p):
-        return (rom.read_u8(), 1)
+        super().__init__(AddrMode.indirect, 1)
 
     def to_str(self, opcode, param, param_len):
         return "($%02X)" % param
@@ -134,10 +173,7 @@ class AddrModeIndirect(AddrModeBase):
 
 class AddrModeIndirectLong(AddrModeBase):
     def __init__(self):
-        super().__init__(AddrMode.indirect_long)
-
-    def read_param(self, rom, opcode, p):
-        return (rom.read_u8(), 1)
+        super().__init__(AddrMode.indirect_long, 1)
 
     def to_str(self, opcode, param, param_len):
         return "[$%02X]" % param
@@ -145,10 +181,7 @@ class AddrModeIndirectLong(AddrModeBase):
 
 class AddrModeIndirectIndexed(AddrModeBase):
     def __init__(self):
-        super().__init__(AddrMode.indirect_indexed)
-
-    def read_param(self, rom, opcode, p):
-        return (rom.read_u8(), 1)
+        super().__init__(AddrMode.indirect_indexed, 1)
 
     def to_str(self, opcode, param, param_len):
         str_index = _get_str_index(opcode)
@@ -157,10 +190,7 @@ class AddrModeIndirectIndexed(AddrModeBase):
 
 class AddrModeIndirectLongIndexed(AddrModeBase):
     def __init__(self):
-        super().__init__(AddrMode.indirect_long_indexed)
-
-    def read_param(self, rom, opcode, p):
-        return (rom.read_u8(), 1)
+        super().__init__(AddrMode.indirect_long_indexed, 1)
 
     def to_str(self, opcode, param, param_len):
         str_index = _get_str_index(opcode)
@@ -169,24 +199,16 @@ class AddrModeIndirectLongIndexed(AddrModeBase):
 
 class AddrModeAbsolute(AddrModeBase):
     def __init__(self):
-        super().__init__(AddrMode.absolute)
-
-    def read_param(self, rom, opcode, p):
-        return (rom.read_u16(), 2)
+        super().__init__(AddrMode.absolute, 2,
+                         TargetKind.bank)
 
     def to_str(self, opcode, param, param_len):
         return "$%04X" % param
 
-    def get_jump_target(self, addr, param, next_addr):
-        return (addr & 0xFF0000) | param
-
 
 class AddrModeAbsoluteIndexed(AddrModeBase):
     def __init__(self):
-        super().__init__(AddrMode.absolute_indexed)
-
-    def read_param(self, rom, opcode, p):
-        return (rom.read_u16(), 2)
+        super().__init__(AddrMode.absolute_indexed, 2)
 
     def to_str(self, opcode, param, param_len):
         str_index = _get_str_index(opcode)
@@ -195,24 +217,16 @@ class AddrModeAbsoluteIndexed(AddrModeBase):
 
 class AddrModeAbsoluteLong(AddrModeBase):
     def __init__(self):
-        super().__init__(AddrMode.absolute_long)
-
-    def read_param(self, rom, opcode, p):
-        return (self._read_u24(rom), 3)
+        super().__init__(AddrMode.absolute_long, 3,
+                         TargetKind.long)
 
     def to_str(self, opcode, param, param_len):
         return "$%06X" % param
 
-    def get_jump_target(self, addr, param, next_addr):
-        return param
-
 
 class AddrModeAbsoluteLongIndexed(AddrModeBase):
     def __init__(self):
-        super().__init__(AddrMode.absolute_long_indexed)
-
-    def read_param(self, rom, opcode, p):
-        return (self._read_u24(rom), 3)
+        super().__init__(AddrMode.absolute_long_indexed, 3)
 
     def to_str(self, opcode, param, param_len):
         str_index = _get_str_index(opcode)
@@ -221,36 +235,25 @@ class AddrModeAbsoluteLongIndexed(AddrModeBase):
 
 class AddrModeAbsoluteIndexedIndirect(AddrModeBase):
     def __init__(self):
-        super().__init__(AddrMode.absolute_indexed_indirect)
-
-    def read_param(self, rom, opcode, p):
-        return (rom.read_u16(), 2)
+        super().__init__(AddrMode.absolute_indexed_indirect, 2,
+                         TargetKind.indirect)
 
     def to_str(self, opcode, param, param_len):
         str_index = _get_str_index(opcode)
         return "($%04X),%s" % (param, str_index)
 
-    def get_jump_target(self, addr, param, next_addr):
-        return None
-
 
 class AddrModeAccumulator(AddrModeBase):
     def __init__(self):
         super().__init__(AddrMode.accumulator)
 
-    def read_param(self, rom, opcode, p):
-        return (None, None)
-
     def to_str(self, opcode, param, param_len):
         return "A"
 
 
 class AddrModeStackRelative(AddrModeBase):
     def __init__(self):
-        super().__init__(AddrMode.stack_relative)
-
-    def read_param(self, rom, opcode, p):
-        return (rom.read_u8(), 1)
+        super().__init__(AddrMode.stack_relative, 1)
 
     def to_str(self, opcode, param, param_len):
         return "$%02X,S" % param
@@ -258,26 +261,21 @@ class AddrModeStackRelative(AddrModeBase):
 
 class AddrModePcRelative(AddrModeBase):
     def __init__(self):
-        super().__init__(AddrMode.pc_relative)
+        super().__init__(AddrMode.pc_relative, 1,
+                         TargetKind.relative)
 
-    def read_param(self, rom, opcode, p):
-        return (rom.read_i8(), 1)
+    def get_param_reader(self, param_len):
+        return _read_i8
 
     def to_str(self, opcode, param, param_len):
         v = struct.pack("b", param)
         v = struct.unpack("B", v)[0]
         return "$%02X" % v
 
-    def get_jump_target(self, addr, param, next_addr):
-        return next_addr + param
-
 
 class AddrModeBlockMove(AddrModeBase):
     def __init__(self):
-        super().__init__(AddrMode.block_move)
-
-    def read_param(self, rom, opcode, p):
-        return (rom.read_u16(), 2)
+        super().__init__(AddrMode.block_move, 2)
 
     def to_str(self, opcode, param, param_len):
         return "$%02X,$%02X" % (param & 0xFF, param >> 8)
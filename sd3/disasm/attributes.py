@@ -14,3 +14,15 @@ class Attr(enum.Enum):
     branch = 9
     jump = 10
     unconditional = 11
+
+
+# Bit of each attribute in an attribute mask
+ATTR_BITS = {attr: 1 << attr.value for attr in Attr}
+
+
+def get_attr_mask(attrs):
+    mask = 0
+    for attr in attrs:
+        mask |= ATTR_BITS[attr]
+
+    return mask
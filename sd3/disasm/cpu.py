@@ -1,8 +1,22 @@
 import logging
+from collections import namedtuple
 import sd3.disasm.operands
 import sd3.disasm.addr_modes
 import sd3.disasm.routine
-from sd3.disasm.attributes import Attr
+from sd3.disasm.attributes import Attr, ATTR_BITS, get_attr_mask
+from sd3.disasm.addr_modes import get_target
+
+# Decoding of an opcode in a P state. param_len and read_param are None when
+# the opcode has no parameter.
+DecodeEntry = namedtuple("DecodeEntry",
+                         ["opcode", "addr_mode", "param_len", "read_param",
+                          "attr_mask", "target_kind"])
+
+_P_MASK = get_attr_mask([Attr.reset_p, Attr.set_p])
+_ENTER_SUB_BIT = ATTR_BITS[Attr.enter_sub]
+_RETURN_SUB_BIT = ATTR_BITS[Attr.return_sub]
+_BRANCH_BIT = ATTR_BITS[Attr.branch]
+_JUMP_BIT = ATTR_BITS[Attr.jump]
 
 
 class PRegister:
@@ -14,6 +28,14 @@ class PRegister:
         return PRegister(X=self.X, M=self.M)
 
 
+def get_p_state(p):
+    return (p.M << 1) | p.X
+
+
+def _get_p_from_state(state):
+    return PRegister(X=state & 1, M=state >> 1)
+
+
 class Opcode:
     def __init__(self, mnemonic, operand_attrs, opcode_desc):
         self.mnemonic = mnemonic
@@ -22,12 +44,15 @@ class Opcode:
         self.attrs = list(operand_attrs)
         self.attrs.extend(opcode_desc.attrs)
 
+        self.attr_mask = get_attr_mask(self.attrs)
+
 
 class Reader:
     def __init__(self, rom):
         self.rom = rom
         self._build_opcode_map()
         self._build_addr_modes_map()
+        self._build_decode_table()
 
     def _build_opcode_map(self):
         self.opcode_map = {}
@@ -58,13 +83,6 @@ class Reader:
 
         return self.addr_modes_map
 
-    def _get_opcode(self):
-        code = self.rom.read_u8()
-        if code not in self.opcode_map:
-            raise Exception("Opcode %02X unknown" % code)
-
-        return self.opcode_map[code]
-
     def _get_addr_mode(self, opcode):
         mode_id = opcode.addr_mode
         if mode_id not in self.addr_modes_map:
@@ -72,20 +90,54 @@ class Reader:
 
         return self.addr_modes_map[mode_id]
 
+    def _build_decode_table(self):
+        # One table of 256 entries per (M, X) state, indexed by opcode.
+        # Unknown opcodes are None.
+        self.decode_table = []
+
+        for state in range(4):
+            p = _get_p_from_state(state)
+            table = [None] * 0x100
+
+            for code, opcode in self.opcode_map.items():
+                addr_mode = self._get_addr_mode(opcode)
+                param_len = addr_mode.get_param_len(opcode, p)
+
+                table[code] = DecodeEntry(
+                    opcode, addr_mode, param_len,
+                    addr_mode.get_param_reader(param_len),
+                    opcode.attr_mask, addr_mode.target_kind)
+
+            self.decode_table.append(table)
+
+    def get_decode_table(self, p):
+        return self.decode_table[get_p_state(p)]
+
     def _read_instruction(self, p):
+        # Returns the instruction and its decode entry
         instr = sd3.disasm.routine.Instruction()
 
         instr.addr = self.rom.tell()
-        instr.opcode = self._get_opcode()
-        instr.addr_mode = self._get_addr_mode(instr.opcode)
 
-        param, param_len = instr.addr_mode.read_param(
-            self.rom, instr.opcode, p)
+        code = self.rom.read_u8()
+        entry = self.decode_table[get_p_state(p)][code]
+        if entry is None:
+            raise Exception("Opcode %02X unknown" % code)
+
+        instr.opcode = entry.opcode
+        instr.addr_mode = entry.addr_mode
+        instr.param_len = entry.param_len
 
-        instr.param = param
-        instr.param_len = param_len
+        if entry.read_param is not None:
+            instr.param = entry.read_param(self.rom)
 
-        return instr
+        return (instr, entry)
+
+    @staticmethod
+    def _get_target(instr, entry):
+        next_addr = instr.addr + 1 + instr.param_len
+        return get_target(entry.target_kind, instr.addr, instr.param,
+                          next_addr)
 
     def read_routine(self, addr, p):
         routine = sd3.disasm.routine.Routine(addr)
@@ -95,36 +147,39 @@ class Reader:
 
         while True:
             # Build instruction
-            instr = self._read_instruction(p)
+            instr, entry = self._read_instruction(p)
             routine.add_instruction(instr)
 
+            attr_mask = entry.attr_mask
+
             # The instruction can update P. Request update.
-            instr.update_p(p)
+            if attr_mask & _P_MASK:
+                instr.update_p(p)
 
-            if instr.has_attr(Attr.enter_sub):
-                target = instr.get_jump_target()
+            if attr_mask & _ENTER_SUB_BIT:
+                target = self._get_target(instr, entry)
                 if not target:
                     logging.debug("Ignore jump")
                     continue
 
                 routine.add_subroutine(target, p)
-            elif instr.has_attr(Attr.return_sub):
+            elif attr_mask & _RETURN_SUB_BIT:
                 next_jump = routine.get_next_jump()
                 if next_jump:
                     logging.debug("Jump to %06X", next_jump)
                     self.rom.seek(next_jump)
                 else:
                     break
-            elif instr.has_attr(Attr.branch):
-                target = instr.get_jump_target()
+            elif attr_mask & _BRANCH_BIT:
+                target = self._get_target(instr, entry)
 
                 new_jump = routine.add_jump(target)
                 if new_jump:
                     logging.debug("Make branch to %06X as pending", target)
                 else:
                     logging.debug("Branch to %06X ignored", target)
-            elif instr.has_attr(Attr.jump):
-                target = instr.get_jump_target()
+            elif attr_mask & _JUMP_BIT:
+                target = self._get_target(instr, entry)
                 is_new_jump = routine.add_jump(target)
                 if is_new_jump:
                     logging.debug("Jump to %06X", target)
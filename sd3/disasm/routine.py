@@ -1,9 +1,13 @@
 from collections import namedtuple
-from sd3.disasm.attributes import Attr
+from sd3.disasm.attributes import Attr, ATTR_BITS, get_attr_mask
 from sd3.disasm.addr_modes import AddrMode
 
 RoutineDesc = namedtuple("RoutineDesc", ["addr", "p"])
 
+_JUMP_MASK = get_attr_mask([Attr.enter_sub, Attr.branch, Attr.jump])
+_RESET_P_BIT = ATTR_BITS[Attr.reset_p]
+_SET_P_BIT = ATTR_BITS[Attr.set_p]
+
 
 class Instruction:
     def __init__(self):
@@ -42,12 +46,10 @@ class Instruction:
         return self.addr + 1 + self.param_len
 
     def has_attr(self, attr):
-        return attr in self.opcode.attrs
+        return (self.opcode.attr_mask & ATTR_BITS[attr]) != 0
 
     def get_jump_target(self):
-        jump_attrs = {Attr.enter_sub, Attr.branch, Attr.jump}
-
-        if not jump_attrs.intersection(self.opcode.attrs):
+        if not self.opcode.attr_mask & _JUMP_MASK:
             raise Exception("%s is not a jump instruction" %
                             self.opcode.mnemonic)
 
@@ -59,12 +61,14 @@ class Instruction:
         M_BIT = 0b00100000
         X_BIT = 0b00010000
 
-        if self.has_attr(Attr.reset_p):
+        attr_mask = self.opcode.attr_mask
+
+        if attr_mask & _RESET_P_BIT:
             if self.param & M_BIT:
                 p.M = 0
             elif self.param & X_BIT:
                 p.X = 0
-        elif self.has_attr(Attr.set_p):
+        elif attr_mask & _SET_P_BIT:
             if self.param & M_BIT:
                 p.M = 1
             elif self.param & X_BIT:
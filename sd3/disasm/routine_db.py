@@ -0,0 +1,136 @@
+import os
+import hashlib
+import logging
+import sd3.cache_utils
+import sd3.disasm.addr_modes
+import sd3.disasm.attributes
+import sd3.disasm.cpu
+import sd3.disasm.operands
+import sd3.disasm.routine
+
+# The disassembled routines depend on the ROM and on the disassembler code:
+# editing these modules invalidates the saved database
+_DISASM_MODULES = [
+    sd3.disasm.addr_modes,
+    sd3.disasm.attributes,
+    sd3.disasm.cpu,
+    sd3.disasm.operands,
+    sd3.disasm.routine,
+]
+
+_FORMAT_VERSION = 1
+
+
+def get_disasm_version():
+    sha1 = hashlib.sha1()
+
+    for module in _DISASM_MODULES:
+        with open(module.__file__, "rb") as f:
+            sha1.update(f.read())
+
+    return sha1.hexdigest()
+
+
+def _get_key(addr, p):
+    return (addr, p.X, p.M)
+
+
+class RoutineDB:
+    # Routines are disassembled once per (address, X, M). The routines are
+    # shared: they must not be modified.
+    def __init__(self, rom, path=None):
+        self.reader = sd3.disasm.cpu.Reader(rom)
+        self.path = path
+
+        self.routines = {}
+
+        # Message of the routines that can't be disassembled
+        self.errors = {}
+
+        self.dirty = False
+
+        if path is not None:
+            self._load()
+
+    @staticmethod
+    def for_rom(rom, cache_dir=None):
+        path = None
+        if cache_dir is not None:
+            name = "routines-%s-%s.pickle" % (rom.get_sha1(),
+                                              get_disasm_version())
+            path = os.path.join(cache_dir, name)
+
+        return RoutineDB(rom, path)
+
+    def _load(self):
+        data = sd3.cache_utils.load_pickle(self.path, "routine database",
+                                           _FORMAT_VERSION)
+        if data is None:
+            return
+
+        self.routines = data["routines"]
+        self.errors = data["errors"]
+
+        logging.info("Loaded %d routines from %s", len(self.routines),
+                     self.path)
+
+    def save(self):
+        if self.path is None or not self.dirty:
+            return
+
+        data = {
+            "version": _FORMAT_VERSION,
+            "routines": self.routines,
+            "errors": self.errors,
+        }
+
+        sd3.cache_utils.save_pickle(self.path, data)
+        self.dirty = False
+
+    def get(self, addr, p):
+        key = _get_key(addr, p)
+
+        routine = self.routines.get(key)
+        if routine is not None:
+            return routine
+
+        error = self.errors.get(key)
+        if error is not None:
+            raise Exception(error)
+
+        # read_routine updates P
+        try:
+            routine = self.reader.read_routine(addr, p.clone())
+        except Exception as e:
+            self.errors[key] = str(e)
+            self.dirty = True
+            raise
+
+        self.routines[key] = routine
+        self.dirty = True
+
+        return routine
+
+    def explore(self, addr, p):
+        # Disassemble the routine and all the routines it calls
+        pending = [(addr, p.clone())]
+        visited = set()
+
+        while pending:
+            addr, p = pending.pop()
+
+            key = _get_key(addr, p)
+            if key in visited:
+                continue
+            visited.add(key)
+
+            try:
+                routine = self.get(addr, p)
+            except Exception as e:
+                logging.warning("Can't read routine %06X: %s", addr, e)
+                continue
+
+            for desc in routine.subroutines.values():
+                pending.append((desc.addr, desc.p))
+
+        return len(visited)
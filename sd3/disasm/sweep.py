@@ -0,0 +1,173 @@
+import array
+import bisect
+import sd3.disasm.cpu
+import sd3.disasm.routine
+from sd3.disasm.attributes import Attr, get_attr_mask
+from sd3.disasm.addr_modes import AddrMode
+
+# Instruction flags. Code instructions were also found by the recursive
+# disassembly. Data entries are single bytes that can't be an instruction.
+FLAG_CODE = 0x1
+FLAG_DATA = 0x2
+
+BANK_SIZE = 0x10000
+
+# HiROM: the ROM is mapped to the banks C0 to FF
+FIRST_BANK = 0xC0
+LAST_BANK = 0xFF
+
+_P_MASK = get_attr_mask([Attr.reset_p, Attr.set_p])
+
+
+class SweepIndex:
+    # Instructions of an address range, in parallel arrays sorted by address.
+    # Lookups are bisections.
+    def __init__(self, addrs, opcodes, params, lengths, flags, reader):
+        self.addrs = addrs
+        self.opcodes = opcodes
+        self.params = params
+        self.lengths = lengths
+        self.flags = flags
+
+        self.reader = reader
+
+    def __len__(self):
+        return len(self.addrs)
+
+    def find(self, addr):
+        # Index of the instruction containing addr, or None
+        idx = bisect.bisect_right(self.addrs, addr) - 1
+        if idx < 0 or addr >= self.addrs[idx] + self.lengths[idx]:
+            return None
+
+        return idx
+
+    def is_code(self, idx):
+        return bool(self.flags[idx] & FLAG_CODE)
+
+    def is_data(self, idx):
+        return bool(self.flags[idx] & FLAG_DATA)
+
+    def get_instruction(self, idx):
+        # Instruction at idx, or None for data
+        if self.is_data(idx):
+            return None
+
+        opcode = self.reader.opcode_map[self.opcodes[idx]]
+        addr_mode = self.reader.addr_modes_map[opcode.addr_mode]
+
+        instr = sd3.disasm.routine.Instruction()
+        instr.addr = self.addrs[idx]
+        instr.opcode = opcode
+        instr.addr_mode = addr_mode
+
+        param_len = self.lengths[idx] - 1
+        if param_len > 0:
+            instr.param = self.params[idx]
+            instr.param_len = param_len
+
+        return instr
+
+
+def _get_known_instructions(routine_db, start, end):
+    # Instructions found by the recursive disassembly. An address read with
+    # several P values keeps the first one.
+    known = {}
+    if routine_db is None:
+        return known
+
+    for routine in routine_db.routines.values():
+        for instr in routine.instructions:
+            if start <= instr.addr < end:
+                known.setdefault(instr.addr, instr)
+
+    return known
+
+
+def sweep(rom, start, end, p, routine_db=None):
+    # Decode every byte of [start, end) as code, starting with P. The
+    # instructions of routine_db are trusted: they are flagged as code and
+    # the sweep resynchronises on them.
+    if not (FIRST_BANK << 16 <= start <= end <= (LAST_BANK + 1) << 16):
+        raise Exception("Range %06X-%06X isn't mapped to the ROM" %
+                        (start, end))
+
+    if routine_db is not None:
+        reader = routine_db.reader
+    else:
+        reader = sd3.disasm.cpu.Reader(rom)
+
+    known = _get_known_instructions(routine_db, start, end)
+    buf = rom.read_buf_at(start, end - start)
+    size = len(buf)
+
+    addrs = array.array("I")
+    opcodes = array.array("B")
+    params = array.array("i")
+    lengths = array.array("B")
+    flags = array.array("B")
+
+    p = p.clone()
+    offset = 0
+
+    while offset < size:
+        addr = start + offset
+        code = buf[offset]
+
+        instr = known.get(addr)
+        if instr is not None:
+            param_len = instr.param_len or 0
+            param = instr.param or 0
+            flag = FLAG_CODE
+            attr_mask = instr.opcode.attr_mask
+        else:
+            entry = reader.decode_table[sd3.disasm.cpu.get_p_state(p)][code]
+
+            param_len = 0
+            if entry is not None:
+                param_len = entry.param_len or 0
+
+            end_offset = offset + 1 + param_len
+            if (entry is None or end_offset > size or
+                    any(a in known for a in range(addr + 1,
+                                                  addr + 1 + param_len))):
+                addrs.append(addr)
+                opcodes.append(code)
+                params.append(0)
+                lengths.append(1)
+                flags.append(FLAG_DATA)
+
+                offset += 1
+                continue
+
+            signed = entry.addr_mode.mode == AddrMode.pc_relative
+            param = int.from_bytes(buf[offset+1:end_offset], "little",
+                                   signed=signed)
+            flag = 0
+            attr_mask = entry.attr_mask
+
+            if attr_mask & _P_MASK:
+                instr = sd3.disasm.routine.Instruction()
+                instr.opcode = entry.opcode
+                instr.param = param
+
+        if attr_mask & _P_MASK:
+            instr.update_p(p)
+
+        addrs.append(addr)
+        opcodes.append(code)
+        params.append(param)
+        lengths.append(1 + param_len)
+        flags.append(flag)
+
+        offset += 1 + param_len
+
+    return SweepIndex(addrs, opcodes, params, lengths, flags, reader)
+
+
+def sweep_bank(rom, bank, p, routine_db=None):
+    if not FIRST_BANK <= bank <= LAST_BANK:
+        raise Exception("Bank %02X isn't mapped to the ROM" % bank)
+
+    start = bank << 16
+    return sweep(rom, start, start + BANK_SIZE, p, routine_db)
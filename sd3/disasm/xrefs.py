@@ -0,0 +1,157 @@
+import os
+import enum
+from collections import namedtuple
+import sd3.cache_utils
+import sd3.disasm.routine_db
+from sd3.disasm.attributes import Attr, ATTR_BITS
+from sd3.disasm.addr_modes import AddrMode
+
+_FORMAT_VERSION = 1
+
+
+class XrefKind(enum.Enum):
+    call = 1
+    branch = 2
+    jump = 3
+    data = 4
+
+
+# source is the address of the referencing instruction
+Xref = namedtuple("Xref", ["source", "kind"])
+
+_ENTER_SUB_BIT = ATTR_BITS[Attr.enter_sub]
+_BRANCH_BIT = ATTR_BITS[Attr.branch]
+_JUMP_BIT = ATTR_BITS[Attr.jump]
+
+# The data bank isn't tracked: absolute addresses are taken in the bank of
+# the instruction
+_BANK_DATA_MODES = {
+    AddrMode.absolute,
+    AddrMode.absolute_indexed,
+    AddrMode.absolute_indexed_indirect,
+}
+
+_LONG_DATA_MODES = {
+    AddrMode.absolute_long,
+    AddrMode.absolute_long_indexed,
+}
+
+
+def _get_data_target(instr):
+    mode = instr.addr_mode.mode
+
+    if mode in _BANK_DATA_MODES:
+        return (instr.addr & 0xFF0000) | instr.param
+    elif mode in _LONG_DATA_MODES:
+        return instr.param
+
+    return None
+
+
+def get_xref(instr):
+    # (target, Xref) of an instruction, or None
+    attr_mask = instr.opcode.attr_mask
+
+    if attr_mask & _ENTER_SUB_BIT:
+        kind = XrefKind.call
+    elif attr_mask & _BRANCH_BIT:
+        kind = XrefKind.branch
+    elif attr_mask & _JUMP_BIT:
+        kind = XrefKind.jump
+    else:
+        kind = None
+
+    if kind is not None:
+        target = instr.get_jump_target()
+        if target is not None:
+            return (target, Xref(instr.addr, kind))
+
+    # Indirect jumps read their target from a table
+    target = _get_data_target(instr)
+    if target is not None:
+        return (target, Xref(instr.addr, XrefKind.data))
+
+    return None
+
+
+class XrefIndex:
+    # References to each address, built from the routines of a RoutineDB.
+    # Routines are indexed once: updating the index only reads the routines
+    # disassembled since the previous update.
+    def __init__(self, path=None):
+        self.path = path
+
+        # Keys of the indexed routines
+        self.routines = set()
+
+        self.targets = {}
+
+        self.dirty = False
+
+        if path is not None:
+            self._load()
+
+    @staticmethod
+    def for_rom(rom, cache_dir=None):
+        path = None
+        if cache_dir is not None:
+            name = "xrefs-%s-%s.pickle" % (
+                rom.get_sha1(), sd3.disasm.routine_db.get_disasm_version())
+            path = os.path.join(cache_dir, name)
+
+        return XrefIndex(path)
+
+    def _load(self):
+        data = sd3.cache_utils.load_pickle(self.path, "xref index",
+                                           _FORMAT_VERSION)
+        if data is None:
+            return
+
+        self.routines = data["routines"]
+        self.targets = data["targets"]
+
+    def save(self):
+        if self.path is None or not self.dirty:
+            return
+
+        data = {
+            "version": _FORMAT_VERSION,
+            "routines": self.routines,
+            "targets": self.targets,
+        }
+
+        sd3.cache_utils.save_pickle(self.path, data)
+        self.dirty = False
+
+    def add_routine(self, key, routine):
+        if key in self.routines:
+            return False
+
+        for instr in routine.instructions:
+            xref = get_xref(instr)
+            if xref is None:
+                continue
+
+            target, ref = xref
+            self.targets.setdefault(target, set()).add(ref)
+
+        self.routines.add(key)
+        self.dirty = True
+
+        return True
+
+    def update(self, routine_db):
+        # Index the new routines of routine_db. Returns their number.
+        count = 0
+        for key, routine in routine_db.routines.items():
+            if self.add_routine(key, routine):
+                count += 1
+
+        return count
+
+    def get(self, addr, kind=None):
+        refs = self.targets.get(addr, ())
+        if kind is not None:
+            refs = [ref for ref in refs if ref.kind == kind]
+
+        return sorted(refs, key=lambda ref: (ref.source, ref.kind.value))
@@ -0,0 +1,85 @@
+import os
+import hashlib
+import logging
+import sd3.cache_utils
+import sd3.seq.cache
+import sd3.seq.index
+
+_INDEX_VERSION = 2
+
+
+def _get_handlers_version():
+    # Editing a handler can change the decodable sequences and so their
+    # references
+    sha1 = hashlib.sha1()
+
+    for op_id, version in sorted(
+            sd3.seq.cache.get_handler_versions().items()):
+        sha1.update(bytes([op_id]))
+        sha1.update(version)
+
+    return sha1.hexdigest()
+
+
+def get_index_path(cache_dir, rom):
+    return os.path.join(cache_dir, "fragments-%s.json" % rom.get_sha1())
+
+
+class FragmentIndex:
+    # Gives the sequences referencing each text sub-block, aliases included
+    def __init__(self, sequences=None):
+        self.sequences = sequences if sequences is not None else {}
+
+    def add_record(self, record, seq_index):
+        if not record.fragments:
+            return
+
+        aliases = seq_index.get_aliases(record.addr)
+        for sub_idx, _ in record.fragments:
+            self.sequences.setdefault(sub_idx, set()).update(aliases)
+
+    def get_sequences(self, sub_idx):
+        return sorted(self.sequences.get(sub_idx, []))
+
+    def get_fragments(self):
+        return sorted(self.sequences.keys())
+
+    @staticmethod
+    def load(path):
+        # The references depend on the decoder and on the handlers: an
+        # index built by another version is ignored
+        data = sd3.cache_utils.load_json(path, "fragment index",
+                                         _INDEX_VERSION)
+        if data is None:
+            return None
+
+        if (data.get("decoder") != sd3.seq.cache.get_decoder_version() or
+                data.get("handlers") != _get_handlers_version()):
+            logging.warning("Ignore outdated fragment index %s", path)
+            return None
+
+        return FragmentIndex({int(sub_idx, 16): set(indexes)
+                              for sub_idx, indexes
+                              in data["fragments"].items()})
+
+    def save(self, path):
+        data = {
+            "version": _INDEX_VERSION,
+            "decoder": sd3.seq.cache.get_decoder_version(),
+            "handlers": _get_handlers_version(),
+            "fragments": {"%04X" % sub_idx: sorted(indexes)
+                          for sub_idx, indexes
+                          in sorted(self.sequences.items())},
+        }
+
+        sd3.cache_utils.save_json(path, data)
+
+
+class Indexer:
+    # Builds the index from the records of an extraction
+    def __init__(self, rom):
+        self.seq_index = sd3.seq.index.SequenceIndex.from_rom(rom)
+        self.index = FragmentIndex()
+
+    def add(self, record):
+        self.index.add_record(record, self.seq_index)
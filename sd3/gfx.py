@@ -1,4 +1,5 @@
-from PIL import Image, ImageDraw
+import numpy as np
+from PIL import Image
 
 _FONT_START_CHAR = 0x20
 
@@ -15,6 +16,12 @@ _FONT_CHAR_COUNT = 988
 
 _IMG_COLUMN_COUNT = 16
 
+_CHAR_COLOR = (255, 255, 255)
+_GRID_COLOR = (0, 0, 255)
+
+# Shift of each pixel of a line, the leftmost pixel is the MSB
+_LINE_SHIFTS = np.arange(_FONT_CHAR_WIDTH - 1, -1, -1, dtype=np.uint16)
+
 
 class Tile:
     def __init__(self, width, height):
@@ -34,14 +41,15 @@ class Tile:
     def get_raw_content(self):
         return self.tile
 
-    def to_img(self):
-        img = Image.new("RGB", (_FONT_CHAR_WIDTH, _FONT_CHAR_DISPLAY_HEIGHT))
-        draw = ImageDraw.Draw(img)
+    def to_array(self):
+        glyph = np.array(self.tile, dtype=np.uint8)
+        return glyph.reshape(self.width, self.height)
 
-        _DrawUtils.draw_char(draw, self, 0, 0)
+    def to_img(self):
+        fb = _FrameBuffer(_FONT_CHAR_WIDTH, _FONT_CHAR_DISPLAY_HEIGHT)
+        fb.blit(_scale_glyph(self.to_array()), 0, 0, _CHAR_COLOR)
 
-        del draw
-        return img
+        return fb.to_img()
 
 
 class _FontCharReader:
@@ -104,24 +112,70 @@ class _FontCharReader:
         return self.tile
 
 
-class _DrawUtils:
-    @staticmethod
-    def draw_char(draw, char, start_x, start_y):
-        char_color = (255, 255, 255)
+def decode_font(raw, count):
+    # Vectorized version of _FontCharReader: the glyphs are decoded
+    # together. The result is indexed by [char][x][y], like Tile.
+    PAIR_COUNT = 12
+
+    chars = np.frombuffer(raw, dtype=np.uint8,
+                          count=count * _FONT_CHAR_SIZE)
+    chars = chars.reshape(count, _FONT_CHAR_SIZE).astype(np.uint16)
+
+    # Lines 0 to 6 and 8 to 12 are stored in byte pairs: 8 bits, then 6
+    # bits (MSB). The 2 remaining bits of each pair are gathered to build
+    # lines 7 and 13.
+    high = chars[:, 0:2*PAIR_COUNT:2]
+    low = chars[:, 1:2*PAIR_COUNT:2]
+
+    pair_lines = (high << 6) | (low >> 2)
+    extra = low & 0b11
+
+    lines = np.empty((count, _FONT_CHAR_HEIGHT), dtype=np.uint16)
+    lines[:, 0:7] = pair_lines[:, 0:7]
+    lines[:, 8:13] = pair_lines[:, 7:12]
+
+    extra_shifts = 2 * np.arange(6, -1, -1, dtype=np.uint16)
+    lines[:, 7] = np.bitwise_or.reduce(extra[:, 0:7] << extra_shifts, axis=1)
+
+    # The last line gets 10 bits from the pairs and 4 from the last byte,
+    # then is shifted to the right like in _FontCharReader
+    next_line = np.bitwise_or.reduce(
+        extra[:, 7:12] << extra_shifts[2:], axis=1)
+    lines[:, 13] = ((next_line << 4) | chars[:, 2*PAIR_COUNT]) >> 2
+
+    bits = lines[:, np.newaxis, :] >> _LINE_SHIFTS[np.newaxis, :, np.newaxis]
+    return (bits & 1).astype(np.uint8)
+
+
+class _FrameBuffer:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
 
-        for x in range(_FONT_CHAR_WIDTH):
-            for y in range(_FONT_CHAR_HEIGHT):
-                value = char[x, y]
-                if value == 0:
-                    continue
+        self.pixels = np.zeros((height, width, 3), dtype=np.uint8)
 
-                pixel_x = start_x + x
-                pixel_y = start_y + y * 2
+    def fill_rect(self, x, y, width, height, color):
+        self.pixels[y:y+height, x:x+width] = color
 
-                draw.point([(pixel_x, pixel_y)], char_color)
+    def paste(self, tile, x, y):
+        height, width, _ = tile.shape
+        self.pixels[y:y+height, x:x+width] = tile
 
-                draw.point([(pixel_x, pixel_y)], char_color)
-                draw.point([(pixel_x, pixel_y+1)], char_color)
+    def blit(self, mask, x, y, color):
+        height, width = mask.shape
+
+        area = self.pixels[y:y+height, x:x+width]
+        area[mask != 0] = color
+
+    def to_img(self):
+        return Image.frombuffer("RGB", (self.width, self.height),
+                                self.pixels, "raw", "RGB", 0, 1)
+
+
+def _scale_glyph(glyph):
+    # Convert a [x][y] glyph to the displayed rows: each line is drawn
+    # twice
+    return np.repeat(glyph.T, 2, axis=0)
 
 
 class FontImgBuilder:
@@ -146,73 +200,41 @@ class FontImgBuilder:
         self.width = 1 + (_FONT_CHAR_WIDTH + 1) * self.column_count
         self.height = 1 + (_FONT_CHAR_DISPLAY_HEIGHT + 1) * self.row_count
 
-    def _draw_grid(self, draw):
-        grid_color = (0, 0, 255)
-
+    def _draw_grid(self, fb):
         # Draw right and bottom borders. The two others will be built
         # with the vertical and horizontal lines
-        top_right = (self.width-1, 0)
-        bottom_left = (0, self.height-1)
-        bottom_right = (self.width-1, self.height-1)
-
-        draw.line([bottom_left, bottom_right], grid_color)
-        draw.line([top_right, bottom_right], grid_color)
+        fb.fill_rect(self.width-1, 0, 1, self.height, _GRID_COLOR)
+        fb.fill_rect(0, self.height-1, self.width, 1, _GRID_COLOR)
 
         # Draw horizontal lines
         for i in range(self.row_count):
-            origin_x = 0
             origin_y = (_FONT_CHAR_DISPLAY_HEIGHT+1) * i
-
-            end_x = self.width-1
-            end_y = origin_y
-
-            draw.line([(origin_x, origin_y), (end_x, end_y)], grid_color)
+            fb.fill_rect(0, origin_y, self.width, 1, _GRID_COLOR)
 
         # Draw vertical lines
         for i in range(self.column_count):
             origin_x = (_FONT_CHAR_WIDTH+1) * i
-            origin_y = 0
-
-            end_x = origin_x
-            end_y = self.height-1
-
-            draw.line([(origin_x, origin_y), (end_x, end_y)], grid_color)
-
-    def _draw_char(self, draw, i, char):
-        char_color = (255, 255, 255)
+            fb.fill_rect(origin_x, 0, 1, self.height, _GRID_COLOR)
 
-        row_idx = i // self.column_count
-        column_idx = i % self.column_count
-
-        for x in range(_FONT_CHAR_WIDTH):
-            for y in range(_FONT_CHAR_HEIGHT):
-                value = char[x, y]
-                if value == 0:
-                    continue
-
-                p_x = 1 + column_idx * (_FONT_CHAR_WIDTH + 1) + x
-                p_y = 1 + row_idx * (_FONT_CHAR_HEIGHT + 1) + y
-                draw.point([(p_x, p_y)], char_color)
-                draw.point([(p_x, p_y+1)], char_color)
-
-    def dump_to_file(self, path):
-        img = Image.new("RGB", (self.width, self.height))
-        draw = ImageDraw.Draw(img)
+    def render(self):
+        fb = _FrameBuffer(self.width, self.height)
 
-        self._draw_grid(draw)
+        self._draw_grid(fb)
 
+        atlas = self.font_reader.read_atlas()
         for i in range(_FONT_CHAR_COUNT):
-            char = self.font_reader.read_char(i)
-
             row_idx = i // self.column_count
             column_idx = i % self.column_count
 
             start_x = 1 + column_idx * (_FONT_CHAR_WIDTH + 1)
             start_y = 1 + row_idx * (_FONT_CHAR_DISPLAY_HEIGHT + 1)
 
-            _DrawUtils.draw_char(draw, char, start_x, start_y)
+            fb.blit(_scale_glyph(atlas[i]), start_x, start_y, _CHAR_COLOR)
+
+        return fb.to_img()
 
-        del draw
+    def dump_to_file(self, path):
+        img = self.render()
         img.save(path)
 
 
@@ -220,15 +242,42 @@ class FontReader:
     def __init__(self, rom):
         self.rom = rom
 
-    def read_char(self, idx):
-        # Read
+        # All the glyphs, decoded on first use
+        self.atlas = None
+
+    def read_atlas(self):
+        if self.atlas is None:
+            raw = self.rom.read_buf_at(_FONT_ADDRESS,
+                                       _FONT_CHAR_SIZE * _FONT_CHAR_COUNT)
+            self.atlas = decode_font(raw, _FONT_CHAR_COUNT)
+
+        return self.atlas
+
+    def _read_char_after_font(self, idx):
+        # Characters after the font can still be used in a text: decode
+        # the data that follows
         addr = _FONT_ADDRESS + _FONT_CHAR_SIZE * idx
-        self.rom.seek(addr)
-        raw_char = self.rom.read_buf(_FONT_CHAR_SIZE)
+        raw_char = self.rom.read_buf_at(addr, _FONT_CHAR_SIZE)
 
         reader = _FontCharReader(raw_char)
         return reader.decode()
 
+    def read_char(self, idx):
+        if idx >= _FONT_CHAR_COUNT:
+            return self._read_char_after_font(idx)
+
+        tile = Tile(_FONT_CHAR_WIDTH, _FONT_CHAR_HEIGHT)
+        tile.tile = self.read_atlas()[idx].ravel().tolist()
+
+        return tile
+
+    def read_glyph(self, idx):
+        # Same as read_char, as a [x][y] array
+        if idx >= _FONT_CHAR_COUNT:
+            return self._read_char_after_font(idx).to_array()
+
+        return self.read_atlas()[idx]
+
     def read_char_gen(self):
         for idx in range(_FONT_CHAR_COUNT):
             tile = self.read_char(idx)
@@ -239,11 +288,53 @@ class FontReader:
         img_builder.dump_to_file(path)
 
 
+class GlyphCache:
+    # Characters rendered as they are displayed in a dialog. A cache can be
+    # shared by several drawers of the same ROM.
+    def __init__(self, font_reader):
+        self.font_reader = font_reader
+        self.tiles = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def _render(self, idx):
+        shape = (_FONT_CHAR_DISPLAY_HEIGHT, _FONT_CHAR_DISPLAY_WIDTH, 3)
+        tile = np.zeros(shape, dtype=np.uint8)
+
+        mask = _scale_glyph(self.font_reader.read_glyph(idx))
+        tile[:, :_FONT_CHAR_WIDTH][mask != 0] = _CHAR_COLOR
+
+        return tile
+
+    def get(self, idx):
+        tile = self.tiles.get(idx)
+        if tile is None:
+            self.misses += 1
+
+            tile = self._render(idx)
+            self.tiles[idx] = tile
+        else:
+            self.hits += 1
+
+        return tile
+
+    def fill(self):
+        for idx in range(_FONT_CHAR_COUNT):
+            if idx not in self.tiles:
+                self.tiles[idx] = self._render(idx)
+
+
 class DialogDrawer:
-    def __init__(self, rom):
+    def __init__(self, rom, glyph_cache=None):
         self.rom = rom
         self.font_reader = FontReader(self.rom)
 
+        if glyph_cache is None:
+            glyph_cache = GlyphCache(self.font_reader)
+
+        self.glyph_cache = glyph_cache
+
     @staticmethod
     def _get_char_count(txt):
         width = 0
@@ -265,7 +356,7 @@ class DialogDrawer:
         return (width * _FONT_CHAR_DISPLAY_WIDTH,
                 height * _FONT_CHAR_DISPLAY_HEIGHT)
 
-    def _write_txt(self, draw, txt, line):
+    def _write_txt(self, fb, txt, line):
         start_x = 0
         start_y = line * _FONT_CHAR_DISPLAY_HEIGHT
 
@@ -273,17 +364,20 @@ class DialogDrawer:
             if char < _FONT_START_CHAR:
                 continue
 
-            tile = self.font_reader.read_char(char - _FONT_START_CHAR)
-            _DrawUtils.draw_char(draw, tile, start_x, start_y)
+            tile = self.glyph_cache.get(char - _FONT_START_CHAR)
+            fb.paste(tile, start_x, start_y)
 
             start_x += _FONT_CHAR_DISPLAY_WIDTH
 
-    def write_to_img(self, dialog, path):
-        dim = self._get_img_dim(dialog)
-        img = Image.new("RGB", dim, "black")
-        draw = ImageDraw.Draw(img)
+    def render(self, dialog):
+        width, height = self._get_img_dim(dialog)
+        fb = _FrameBuffer(width, height)
 
         for i, txt in enumerate(dialog):
-            self._write_txt(draw, txt, i)
+            self._write_txt(fb, txt, i)
 
+        return fb.to_img()
+
+    def write_to_img(self, dialog, path):
+        img = self.render(dialog)
         img.save(path)
@@ -1,4 +1,8 @@
+import io
+import mmap
 import struct
+import hashlib
+import numpy as np
 
 
 _U8_SIZE = 1
@@ -8,6 +12,12 @@ _U16_SIZE = 2
 BIG_ENDIAN = 0
 LITTLE_ENDIAN = 1
 
+_I8 = struct.Struct("b")
+_U16 = {
+    LITTLE_ENDIAN: struct.Struct("<H"),
+    BIG_ENDIAN: struct.Struct(">H"),
+}
+
 
 class HighRomConv:
     _ADDR_OFFSET = 0xC00000
@@ -21,6 +31,24 @@ class HighRomConv:
         return addr + HighRomConv._ADDR_OFFSET
 
 
+def _map_file(f):
+    # Map the file if possible: pages are shared between all the processes
+    # opening the same ROM. File-like objects without a descriptor are read.
+    try:
+        fileno = f.fileno()
+    except (AttributeError, io.UnsupportedOperation):
+        fileno = None
+
+    if fileno is not None:
+        try:
+            return memoryview(mmap.mmap(fileno, 0, access=mmap.ACCESS_READ))
+        except (ValueError, OSError):
+            pass
+
+    f.seek(0)
+    return memoryview(f.read())
+
+
 class Rom:
     def __init__(self):
         self.data = None
@@ -29,12 +57,20 @@ class Rom:
         self.conv_addr = None
         self.tracer = None
 
+        # Set when the ROM is opened from a path, so other processes can
+        # map it too
+        self.path = None
+
+        self.sha1 = None
+
+        # Pointer tables already read, shared by the copies of the ROM
+        self.ptr_tables = {}
+
     @staticmethod
     def from_file(f, conv_addr, tracer=None):
         rom = Rom()
 
-        f.seek(0)
-        rom.data = f.read()
+        rom.data = _map_file(f)
         rom.addr = 0
 
         rom.conv_addr = conv_addr
@@ -42,6 +78,15 @@ class Rom:
 
         return rom
 
+    @staticmethod
+    def from_path(path, conv_addr, tracer=None):
+        # The mapping stays valid once the file is closed
+        with open(path, "rb") as f:
+            rom = Rom.from_file(f, conv_addr, tracer)
+
+        rom.path = path
+        return rom
+
     @staticmethod
     def from_rom(src):
         rom = Rom()
@@ -51,32 +96,53 @@ class Rom:
 
         rom.conv_addr = src.conv_addr
         rom.tracer = src.tracer
+        rom.path = src.path
+        rom.sha1 = src.sha1
+        rom.ptr_tables = src.ptr_tables
 
         return rom
 
+    def get_sha1(self):
+        if self.sha1 is None:
+            self.sha1 = hashlib.sha1(self.data).hexdigest()
+
+        return self.sha1
+
     def seek(self, addr):
         self.addr = self.conv_addr.snes_to_rom(addr)
 
     def tell(self):
         return self.conv_addr.rom_to_snes(self.addr)
 
+    def _trace(self, offset, count):
+        self.tracer(offset, self.data[offset:offset+count])
+
     def read_u8(self):
-        value = self.read_buf(_U8_SIZE)
-        return struct.unpack("B", value)[0]
+        if self.tracer:
+            self._trace(self.addr, _U8_SIZE)
+
+        value = self.data[self.addr]
+        self.addr += _U8_SIZE
+
+        return value
 
     def read_i8(self):
-        value = self.read_buf(_U8_SIZE)
-        return struct.unpack("b", value)[0]
+        if self.tracer:
+            self._trace(self.addr, _I8_SIZE)
+
+        value = _I8.unpack_from(self.data, self.addr)[0]
+        self.addr += _I8_SIZE
+
+        return value
 
     def read_u16(self, endianess=LITTLE_ENDIAN):
-        value = self.read_buf(_U16_SIZE)
+        if self.tracer:
+            self._trace(self.addr, _U16_SIZE)
 
-        if endianess == LITTLE_ENDIAN:
-            fmt = "<H"
-        else:
-            fmt = ">H"
+        value = _U16[endianess].unpack_from(self.data, self.addr)[0]
+        self.addr += _U16_SIZE
 
-        return struct.unpack(fmt, value)[0]
+        return value
 
     def read_buf(self, count):
         buf = self.data[self.addr:self.addr+count]
@@ -88,8 +154,49 @@ class Rom:
 
         return buf
 
+    # Positional readers: they don't move the read cursor
+    def read_u8_at(self, addr):
+        offset = self.conv_addr.snes_to_rom(addr)
+        if self.tracer:
+            self._trace(offset, _U8_SIZE)
+
+        return self.data[offset]
+
+    def read_u16_at(self, addr, endianess=LITTLE_ENDIAN):
+        offset = self.conv_addr.snes_to_rom(addr)
+        if self.tracer:
+            self._trace(offset, _U16_SIZE)
+
+        return _U16[endianess].unpack_from(self.data, offset)[0]
+
+    def read_buf_at(self, addr, count):
+        offset = self.conv_addr.snes_to_rom(addr)
+        if self.tracer:
+            self._trace(offset, count)
+
+        return self.data[offset:offset+count]
+
     def read_addr_from_ptr(self, tbl_base, ptr_idx, target_bank):
         addr = tbl_base + _U16_SIZE * ptr_idx
         self.seek(addr)
 
         return (target_bank << 16) | self.read_u16()
+
+    def read_ptr_table(self, tbl_base, count, target_bank):
+        # Same as read_addr_from_ptr for the count first pointers
+        buf = self.read_buf_at(tbl_base, _U16_SIZE * count)
+        ptrs = np.frombuffer(buf, dtype="<u2").astype(np.uint32)
+
+        return ptrs | np.uint32(target_bank << 16)
+
+    def get_ptr_table(self, tbl_base, count, target_bank):
+        # Cached read_ptr_table. The table is read-only, as it is shared.
+        key = (tbl_base, count, target_bank)
+
+        table = self.ptr_tables.get(key)
+        if table is None:
+            table = self.read_ptr_table(tbl_base, count, target_bank)
+            table.setflags(write=False)
+            self.ptr_tables[key] = table
+
+        return table
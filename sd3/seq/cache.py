@@ -0,0 +1,296 @@
+import os
+import array
+import struct
+import inspect
+import hashlib
+import logging
+from collections import namedtuple
+import sd3.bitutils
+import sd3.cache_utils
+import sd3.seq.ops
+import sd3.seq.reader
+import sd3.text
+import sd3.tree
+
+# Decoded sequences only depend on the ROM and on the decoder code. The
+# decoder version is the hash of the modules implementing it, so editing
+# them invalidates the cache. Operation handlers have their own version:
+# editing one only invalidates the sequences using it.
+_DECODER_MODULES = [
+    sd3.bitutils,
+    sd3.seq.reader,
+    sd3.text,
+    sd3.tree,
+]
+
+_MAGIC = b"SD3S"
+_FORMAT_VERSION = 4
+
+_HEADER = struct.Struct("<4sHH")
+_HANDLER = struct.Struct("<B20s")
+_ENTRY = struct.Struct("<IHHHH")
+_BLOCK = struct.Struct("<H")
+_OP = struct.Struct("<BIH")
+_FRAGMENT = struct.Struct("<HH")
+
+# Stored instead of the failing operation id for sequences decoded
+# without error
+_NO_ERROR = 0xFFFF
+
+# ops are (op_id, bit_position, block_count) tuples, block_count being the
+# number of blocks decoded before the operation. fragments are the
+# (sub_idx, block_count) of the referenced text sub-blocks.
+CachedSequence = namedtuple("CachedSequence",
+                            ["blocks", "op_id", "ops", "fragments"])
+
+
+# Public parts of the operations module building the dispatch table
+_DISPATCH_OBJECTS = [
+    sd3.seq.ops.OpKind,
+    sd3.seq.ops.OpTable,
+    sd3.seq.ops.compile_op_table,
+    sd3.seq.ops.get_op_map,
+]
+
+
+def _get_source_sha1(obj):
+    return hashlib.sha1(inspect.getsource(obj).encode("utf-8")).digest()
+
+
+
+def get_decoder_version():
+    sha1 = hashlib.sha1()
+
+    for module in _DECODER_MODULES:
+        with open(module.__file__, "rb") as f:
+            sha1.update(f.read())
+
+    # The private functions of the operations module are helpers shared by
+    # the handlers
+    for name, obj in sorted(vars(sd3.seq.ops).items()):
+        if (name.startswith("_") and inspect.isfunction(obj) and
+                obj.__module__ == sd3.seq.ops.__name__):
+            sha1.update(_get_source_sha1(obj))
+
+    for obj in _DISPATCH_OBJECTS:
+        sha1.update(_get_source_sha1(obj))
+
+    return sha1.hexdigest()
+
+
+def get_handler_versions():
+    return {op_id: _get_source_sha1(source) for op_id, source
+            in sd3.seq.ops.get_handler_sources().items()}
+
+
+class SequenceCache:
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.dirty = False
+
+        self.handler_versions = get_handler_versions()
+
+        self._load()
+
+    @staticmethod
+    def for_rom(cache_dir, rom):
+        name = "seq-%s-%s.bin" % (rom.get_sha1(), get_decoder_version())
+        return SequenceCache(os.path.join(cache_dir, name))
+
+    def _load(self):
+        loaded = sd3.cache_utils.load(self.path, self._unpack,
+                                      "sequence cache")
+        if loaded is None:
+            return
+
+        self.entries, changed_ops, invalidated_count = loaded
+
+        logging.info("Loaded %d sequences from %s, %d invalidated",
+                     len(self.entries), self.path, invalidated_count)
+
+        # The handler versions are updated on save
+        if changed_ops:
+            self.dirty = True
+
+    def _unpack(self, data):
+        # (entries, changed operations, invalidated count), or None
+        magic, version, handler_count = _HEADER.unpack_from(data, 0)
+        if magic != _MAGIC or version != _FORMAT_VERSION:
+            return None
+
+        offset = _HEADER.size
+
+        # Find the handlers edited since the cache was saved
+        changed_ops = set(self.handler_versions.keys())
+        for _ in range(handler_count):
+            op_id, handler_version = _HANDLER.unpack_from(data, offset)
+            offset += _HANDLER.size
+
+            if self.handler_versions.get(op_id) == handler_version:
+                changed_ops.discard(op_id)
+
+        if changed_ops:
+            logging.info("Handlers changed for operations %s",
+                         ", ".join("%02X" % op_id
+                                   for op_id in sorted(changed_ops)))
+
+        entries = {}
+        invalidated_count = 0
+        while offset < len(data):
+            (seq_addr, op_id, block_count, op_count,
+             fragment_count) = _ENTRY.unpack_from(data, offset)
+            offset += _ENTRY.size
+
+            blocks = []
+            for _ in range(block_count):
+                length = _BLOCK.unpack_from(data, offset)[0]
+                offset += _BLOCK.size
+
+                block = array.array("H")
+                block.frombytes(data[offset:offset+length*block.itemsize])
+                offset += length * block.itemsize
+
+                blocks.append(block.tolist())
+
+            ops = []
+            for _ in range(op_count):
+                ops.append(_OP.unpack_from(data, offset))
+                offset += _OP.size
+
+            fragments = []
+            for _ in range(fragment_count):
+                fragments.append(_FRAGMENT.unpack_from(data, offset))
+                offset += _FRAGMENT.size
+
+            if op_id == _NO_ERROR:
+                op_id = None
+
+            if any(op[0] in changed_ops for op in ops):
+                invalidated_count += 1
+                continue
+
+            entries[seq_addr] = CachedSequence(blocks, op_id, ops, fragments)
+
+        return (entries, changed_ops, invalidated_count)
+
+    def get(self, seq_addr):
+        return self.entries.get(seq_addr)
+
+    def put(self, seq_addr, entry):
+        self.entries[seq_addr] = entry
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+
+        out = bytearray(_HEADER.pack(_MAGIC, _FORMAT_VERSION,
+                                     len(self.handler_versions)))
+
+        for op_id in sorted(self.handler_versions.keys()):
+            out += _HANDLER.pack(op_id, self.handler_versions[op_id])
+        for seq_addr in sorted(self.entries.keys()):
+            entry = self.entries[seq_addr]
+
+            op_id = _NO_ERROR if entry.op_id is None else entry.op_id
+            out += _ENTRY.pack(seq_addr, op_id, len(entry.blocks),
+                               len(entry.ops), len(entry.fragments))
+
+            for block in entry.blocks:
+                out += _BLOCK.pack(len(block))
+                out += array.array("H", block).tobytes()
+
+            for op in entry.ops:
+                out += _OP.pack(*op)
+
+            for fragment in entry.fragments:
+                out += _FRAGMENT.pack(*fragment)
+
+        sd3.cache_utils.write_atomic(self.path, out)
+        self.dirty = False
+
+
+class _RecordObserver(sd3.seq.reader.Observer):
+    def __init__(self, observer):
+        self.observer = observer
+        self.decoded = []
+        self.ops = []
+        self.fragments = []
+
+    def op_started(self, op_id, bit_position):
+        self.ops.append((op_id, bit_position, len(self.decoded)))
+        self.observer.op_started(op_id, bit_position)
+
+    def text_decoded(self, decoded):
+        self.decoded.append(decoded)
+        self.observer.text_decoded(decoded)
+
+    def fragment_referenced(self, sub_idx):
+        self.fragments.append((sub_idx, len(self.decoded)))
+        self.observer.fragment_referenced(sub_idx)
+
+
+def _replay_block(observer, entry, block_fragments, block_idx):
+    for sub_idx in block_fragments.get(block_idx, []):
+        observer.fragment_referenced(sub_idx)
+
+    observer.text_decoded(list(entry.blocks[block_idx]))
+
+
+class CachedReader:
+    def __init__(self, rom, cache):
+        self.rom = rom
+        self.cache = cache
+
+        # The decoder is only built if a sequence isn't in the cache
+        self.reader = None
+
+    def get_sequence_addr(self, idx):
+        return sd3.seq.reader.get_sequence_addr(self.rom, idx)
+
+    def read_sequence(self, idx, observer):
+        seq_addr = self.get_sequence_addr(idx)
+        return self.read_sequence_from_addr(seq_addr, observer)
+
+    def _decode(self, seq_addr, observer):
+        if self.reader is None:
+            self.reader = sd3.seq.reader.Reader(self.rom)
+
+        record = _RecordObserver(observer)
+        try:
+            self.reader.read_sequence_from_addr(seq_addr, record)
+        except sd3.seq.reader.ReadException as e:
+            self.cache.put(seq_addr, CachedSequence(
+                record.decoded, e.op_id, record.ops, record.fragments))
+            raise
+
+        self.cache.put(seq_addr, CachedSequence(
+            record.decoded, None, record.ops, record.fragments))
+
+    def read_sequence_from_addr(self, seq_addr, observer):
+        entry = self.cache.get(seq_addr)
+        if entry is None:
+            self._decode(seq_addr, observer)
+            return
+
+        # Replay the notifications in the decode order. The fragments of a
+        # block are referenced just before it.
+        block_fragments = {}
+        for sub_idx, block_count in entry.fragments:
+            block_fragments.setdefault(block_count, []).append(sub_idx)
+
+        block_idx = 0
+        for op_id, bit_position, block_count in entry.ops:
+            while block_idx < block_count:
+                _replay_block(observer, entry, block_fragments, block_idx)
+                block_idx += 1
+
+            observer.op_started(op_id, bit_position)
+
+        while block_idx < len(entry.blocks):
+            _replay_block(observer, entry, block_fragments, block_idx)
+            block_idx += 1
+
+        if entry.op_id is not None:
+            raise sd3.seq.reader.ReadException(entry.op_id)
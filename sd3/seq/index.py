@@ -0,0 +1,90 @@
+import numpy as np
+
+SEQ_COUNT = 0x1000
+
+PTR_BASE = 0xF80000
+
+# The pointer table gives 16 bits addresses. The bank depends on the
+# sequence index: (first index, end index, bank).
+BANK_RANGES = [
+    (0x000, 0x600, 0xF9),
+    (0x600, 0xA00, 0xFA),
+    (0xA00, 0xC00, 0xFB),
+    (0xC00, 0x1000, 0xF8),
+]
+
+
+def get_range(idx):
+    for first, end, bank in BANK_RANGES:
+        if first <= idx < end:
+            return (first, end, bank)
+
+    raise Exception("Invalid sequence index %X" % idx)
+
+
+def get_range_table(rom, first, end, bank):
+    # Addresses of the sequences of a bank range
+    return rom.get_ptr_table(PTR_BASE + 2 * first, end - first, bank)
+
+
+def get_addr(rom, idx):
+    first, end, bank = get_range(idx)
+    return int(get_range_table(rom, first, end, bank)[idx - first])
+
+
+class SequenceIndex:
+    def __init__(self, addrs):
+        self.addrs = addrs
+
+        # Sequences sharing an address are aliases. The first index of an
+        # address is its main index.
+        _, first_idx, inverse = np.unique(addrs, return_index=True,
+                                          return_inverse=True)
+        self.main_idx = first_idx[inverse]
+
+        self.aliases = {}
+        for idx, addr in enumerate(addrs.tolist()):
+            self.aliases.setdefault(addr, []).append(idx)
+
+    @staticmethod
+    def from_rom(rom):
+        addrs = np.empty(SEQ_COUNT, dtype=np.uint32)
+        for first, end, bank in BANK_RANGES:
+            addrs[first:end] = get_range_table(rom, first, end, bank)
+
+        return SequenceIndex(addrs)
+
+    def __len__(self):
+        return len(self.addrs)
+
+    def get_addr(self, idx):
+        return int(self.addrs[idx])
+
+    def get_aliases(self, addr):
+        # All the indexes of an address, main index first
+        return self.aliases.get(addr, [])
+
+    def get_main_idx(self, idx):
+        return int(self.main_idx[idx])
+
+    @staticmethod
+    def get_bank(idx):
+        return get_range(idx)[2]
+
+    def iter_unique(self, indexes=None):
+        # Give (idx, addr) for the first index of each address, in index
+        # order
+        if indexes is None:
+            indexes = np.arange(len(self.addrs))
+        else:
+            indexes = np.fromiter(indexes, dtype=np.int64)
+            if len(indexes) and (indexes.min() < 0 or
+                                 indexes.max() >= len(self.addrs)):
+                raise ValueError("Sequence indexes must be in [0, %X]" %
+                                 (len(self.addrs) - 1))
+
+        _, first = np.unique(self.addrs[indexes], return_index=True)
+        first.sort()
+
+        for idx in indexes[first]:
+            yield (int(idx), int(self.addrs[idx]))
@@ -1,30 +1,63 @@
+import enum
+import functools
+from collections import namedtuple
 import sd3.text
 
 
 _CODE_TXT = [0x58, 0x5E]
 
+_OP_COUNT = 0x100
+
+
+class OpKind(enum.Enum):
+    # The operation only skips arg_count values of the control stream
+    fixed = 1
+    # The handler must be called
+    handler = 2
+
+
+OpEntry = namedtuple("OpEntry", ["kind", "arg_count", "handler"])
+
 
 def _read_n_bytes(n, seq_reader):
     for _ in range(n):
         seq_reader()
 
 
+def _fixed_length(arg_count):
+    # The operation only skips arg_count values. The decorated handler has
+    # an empty body: the values are skipped by the reader, or by this
+    # wrapper when the handler is called.
+    def register(func):
+        @functools.wraps(func)
+        def handler(op_id, seq_reader, observer):
+            _read_n_bytes(arg_count, seq_reader)
+
+        handler.arg_count = arg_count
+        return handler
+
+    return register
+
+
 def sub_C43E81(op_id, seq_reader, observer):
     raise Exception("Subroutine C43E81 unimplemented (from op 0x%02X)" % op_id)
 
 
+@_fixed_length(0)
 def sub_C43F02(op_id, seq_reader, observer):
     pass
 
 
+@_fixed_length(3)
 def sub_C43B03(op_id, seq_reader, observer):
-    _read_n_bytes(3, seq_reader)
+    pass
 
 
 def sub_C43784(op_id, seq_reader, observer):
     raise Exception("Subroutine C43784 unimplemented (from op 0x%02X)" % op_id)
 
 
+@_fixed_length(0)
 def sub_C44105(op_id, seq_reader, observer):
     pass
 
@@ -33,120 +66,147 @@ def sub_C43804(op_id, seq_reader, observer):
     raise Exception("Subroutine C43804 unimplemented (from op 0x%02X)" % op_id)
 
 
+@_fixed_length(3)
 def sub_C43B87(op_id, seq_reader, observer):
-    _read_n_bytes(3, seq_reader)
+    pass
 
 
 def sub_C43688(op_id, seq_reader, observer):
     raise Exception("Subroutine C43688 unimplemented (from op 0x%02X)" % op_id)
 
 
+@_fixed_length(1)
 def sub_C43D89(op_id, seq_reader, observer):
-    _read_n_bytes(1, seq_reader)
+    pass
 
 
+@_fixed_length(1)
 def sub_C4390B(op_id, seq_reader, observer):
-    _read_n_bytes(1, seq_reader)
+    pass
 
 
+@_fixed_length(0)
 def sub_C4410C(op_id, seq_reader, observer):
     pass
 
 
+@_fixed_length(1)
 def sub_C43927(op_id, seq_reader, observer):
-    _read_n_bytes(1, seq_reader)
+    pass
 
 
+@_fixed_length(0)
 def sub_C43F0E(op_id, seq_reader, observer):
     pass
 
 
+@_fixed_length(3)
 def sub_C43B0E(op_id, seq_reader, observer):
-    _read_n_bytes(3, seq_reader)
+    pass
 
 
+@_fixed_length(0)
 def sub_C43391(op_id, seq_reader, observer):
     pass
 
 
+@_fixed_length(1)
 def sub_C43A13(op_id, seq_reader, observer):
-    _read_n_bytes(1, seq_reader)
+    pass
 
 
+@_fixed_length(1)
 def sub_C43D14(op_id, seq_reader, observer):
-    _read_n_bytes(1, seq_reader)
+    pass
 
 
 def sub_C43E14(op_id, seq_reader, observer):
     raise Exception("Subroutine C43E14 unimplemented (from op 0x%02X)" % op_id)
 
 
+@_fixed_length(1)
 def sub_C43516(op_id, seq_reader, observer):
-    _read_n_bytes(1, seq_reader)
+    pass
 
 
+@_fixed_length(0)
 def sub_C43A97(op_id, seq_reader, observer):
     pass
 
 
+@_fixed_length(0)
 def sub_C44198(op_id, seq_reader, observer):
     pass
 
 
+@_fixed_length(3)
 def sub_C43B19(op_id, seq_reader, observer):
-    _read_n_bytes(3, seq_reader)
+    pass
 
 
+@_fixed_length(1)
 def sub_C43613(op_id, seq_reader, observer):
-    _read_n_bytes(1, seq_reader)
+    pass
 
 
+@_fixed_length(2)
 def sub_C43896(op_id, seq_reader, observer):
-    _read_n_bytes(2, seq_reader)
+    pass
 
 
+@_fixed_length(1)
 def sub_C43F1C(op_id, seq_reader, observer):
-    _read_n_bytes(1, seq_reader)
+    pass
 
 
+@_fixed_length(1)
 def sub_C43E9D(op_id, seq_reader, observer):
-    _read_n_bytes(1, seq_reader)
+    pass
 
 
+@_fixed_length(1)
 def sub_C434A0(op_id, seq_reader, observer):
-    _read_n_bytes(1, seq_reader)
+    pass
 
 
+@_fixed_length(0)
 def sub_C43978(op_id, seq_reader, observer):
     pass
 
 
+@_fixed_length(3)
 def sub_C43B24(op_id, seq_reader, observer):
-    _read_n_bytes(3, seq_reader)
+    pass
 
 
+@_fixed_length(0)
 def sub_C439A6(op_id, seq_reader, observer):
     pass
 
 
+@_fixed_length(0)
 def sub_C43CA6(op_id, seq_reader, observer):
     pass
 
 
+@_fixed_length(0)
 def sub_C43328(op_id, seq_reader, observer):
     pass
 
 
+@_fixed_length(0)
 def sub_C43A27(op_id, seq_reader, observer):
     pass
 
 
+@_fixed_length(1)
 def sub_C43AAA(op_id, seq_reader, observer):
-    _read_n_bytes(1, seq_reader)
+    pass
 
 
+@_fixed_length(2)
 def sub_C440A6(op_id, seq_reader, observer):
-    _read_n_bytes(2, seq_reader)
+    pass
 
 
 def sub_C435A9(op_id, seq_reader, observer):
@@ -157,12 +217,14 @@ def sub_C43724(op_id, seq_reader, observer):
     raise Exception("Subroutine C43724 unimplemented (from op 0x%02X)" % op_id)
 
 
+@_fixed_length(1)
 def sub_C433AE(op_id, seq_reader, observer):
-    _read_n_bytes(1, seq_reader)
+    pass
 
 
+@_fixed_length(3)
 def sub_C43B2F(op_id, seq_reader, observer):
-    _read_n_bytes(3, seq_reader)
+    pass
 
 
 def sub_C437AE(op_id, seq_reader, observer):
@@ -173,20 +235,23 @@ def sub_C4382E(op_id, seq_reader, observer):
     raise Exception("Subroutine C4382E unimplemented (from op 0x%02X)" % op_id)
 
 
+@_fixed_length(1)
 def sub_C43537(op_id, seq_reader, observer):
-    _read_n_bytes(1, seq_reader)
+    pass
 
 
 def sub_C43A39(op_id, seq_reader, observer):
     raise Exception("Subroutine C43A39 unimplemented (from op 0x%02X)" % op_id)
 
 
+@_fixed_length(3)
 def sub_C43B3A(op_id, seq_reader, observer):
-    _read_n_bytes(3, seq_reader)
+    pass
 
 
+@_fixed_length(1)
 def sub_C43FBA(op_id, seq_reader, observer):
-    _read_n_bytes(1, seq_reader)
+    pass
 
 
 def sub_C4363D(op_id, seq_reader, observer):
@@ -204,24 +269,29 @@ def sub_C4363D(op_id, seq_reader, observer):
         raise Exception("Decode error (maybe skipping text)")
 
 
+@_fixed_length(1)
 def sub_C43443(op_id, seq_reader, observer):
-    _read_n_bytes(1, seq_reader)
+    pass
 
 
+@_fixed_length(0)
 def sub_C439C4(op_id, seq_reader, observer):
     pass
 
 
+@_fixed_length(3)
 def sub_C43B45(op_id, seq_reader, observer):
-    _read_n_bytes(3, seq_reader)
+    pass
 
 
+@_fixed_length(0)
 def sub_C43C46(op_id, seq_reader, observer):
     pass
 
 
+@_fixed_length(1)
 def sub_C43BC6(op_id, seq_reader, observer):
-    _read_n_bytes(1, seq_reader)
+    pass
 
 
 def sub_C435C7(op_id, seq_reader, observer):
@@ -232,64 +302,78 @@ def sub_C438C3(op_id, seq_reader, observer):
     raise Exception("Subroutine C438C3 unimplemented (from op 0x%02X)" % op_id)
 
 
+@_fixed_length(1)
 def sub_C434CB(op_id, seq_reader, observer):
-    _read_n_bytes(1, seq_reader)
+    pass
 
 
+@_fixed_length(0)
 def sub_C43CCC(op_id, seq_reader, observer):
     pass
 
 
+@_fixed_length(1)
 def sub_C43DCD(op_id, seq_reader, observer):
-    _read_n_bytes(1, seq_reader)
+    pass
 
 
+@_fixed_length(3)
 def sub_C43B50(op_id, seq_reader, observer):
-    _read_n_bytes(3, seq_reader)
+    pass
 
 
+@_fixed_length(1)
 def sub_C43AD1(op_id, seq_reader, observer):
-    _read_n_bytes(1, seq_reader)
+    pass
 
 
+@_fixed_length(1)
 def sub_C43D52(op_id, seq_reader, observer):
-    _read_n_bytes(1, seq_reader)
+    pass
 
 
 def sub_C436D3(op_id, seq_reader, observer):
     raise Exception("Subroutine C436D3 unimplemented (from op 0x%02X)" % op_id)
 
 
+@_fixed_length(0)
 def sub_C43354(op_id, seq_reader, observer):
     pass
 
 
+@_fixed_length(0)
 def sub_C43355(op_id, seq_reader, observer):
     pass
 
 
+@_fixed_length(1)
 def sub_C439D4(op_id, seq_reader, observer):
-    _read_n_bytes(1, seq_reader)
+    pass
 
 
+@_fixed_length(2)
 def sub_C44056(op_id, seq_reader, observer):
-    _read_n_bytes(2, seq_reader)
+    pass
 
 
+@_fixed_length(1)
 def sub_C43458(op_id, seq_reader, observer):
-    _read_n_bytes(1, seq_reader)
+    pass
 
 
+@_fixed_length(1)
 def sub_C43F5A(op_id, seq_reader, observer):
-    _read_n_bytes(1, seq_reader)
+    pass
 
 
+@_fixed_length(3)
 def sub_C43B5B(op_id, seq_reader, observer):
-    _read_n_bytes(3, seq_reader)
+    pass
 
 
+@_fixed_length(2)
 def sub_C4355B(op_id, seq_reader, observer):
-    _read_n_bytes(2, seq_reader)
+    pass
 
 
 def sub_C437DA(op_id, seq_reader, observer):
@@ -300,56 +384,68 @@ def sub_C438E5(op_id, seq_reader, observer):
     raise Exception("Subroutine C438E5 unimplemented (from op 0x%02X)" % op_id)
 
 
+@_fixed_length(3)
 def sub_C43B66(op_id, seq_reader, observer):
-    _read_n_bytes(3, seq_reader)
+    pass
 
 
+@_fixed_length(1)
 def sub_C43E67(op_id, seq_reader, observer):
-    _read_n_bytes(1, seq_reader)
+    pass
 
 
 def sub_C435ED(op_id, seq_reader, observer):
     raise Exception("Subroutine C435ED unimplemented (from op 0x%02X)" % op_id)
 
 
+@_fixed_length(1)
 def sub_C434EF(op_id, seq_reader, observer):
-    _read_n_bytes(1, seq_reader)
+    pass
 
 
+@_fixed_length(3)
 def sub_C43B71(op_id, seq_reader, observer):
-    _read_n_bytes(3, seq_reader)
+    pass
 
 
+@_fixed_length(0)
 def sub_C43CF5(op_id, seq_reader, observer):
     pass
 
 
+@_fixed_length(0)
 def sub_C43C76(op_id, seq_reader, observer):
     pass
 
 
+@_fixed_length(1)
 def sub_C43475(op_id, seq_reader, observer):
-    _read_n_bytes(1, seq_reader)
+    pass
 
 
+@_fixed_length(3)
 def sub_C43AF8(op_id, seq_reader, observer):
-    _read_n_bytes(3, seq_reader)
+    pass
 
 
+@_fixed_length(1)
 def sub_C43779(op_id, seq_reader, observer):
-    _read_n_bytes(1, seq_reader)
+    pass
 
 
+@_fixed_length(3)
 def sub_C43B7C(op_id, seq_reader, observer):
-    _read_n_bytes(3, seq_reader)
+    pass
 
 
+@_fixed_length(1)
 def sub_C433FE(op_id, seq_reader, observer):
-    _read_n_bytes(1, seq_reader)
+    pass
 
 
-def get_op_map(rom):
-    op_map = {
+def get_handlers():
+    # The text operations aren't included: their handler needs the ROM
+    return {
         0x00: sub_C43328,
         0x01: sub_C43354,
         0x02: sub_C43978,
@@ -606,9 +702,41 @@ def get_op_map(rom):
         0xFF: sub_C43E9D,
     }
 
+
+def get_handler_sources():
+    # Give the function or class implementing each operation
+    sources = get_handlers()
+    for txt_op in _CODE_TXT:
+        sources[txt_op] = sd3.text.Reader
+
+    return sources
+
+
+def get_op_map(rom):
+    op_map = get_handlers()
+
     # Register text decoder
     txt_reader = sd3.text.Reader(rom)
     for txt_op in _CODE_TXT:
         op_map[txt_op] = txt_reader
 
     return op_map
+
+
+class OpTable:
+    def __init__(self, op_map):
+        self.entries = []
+        for op_id in range(_OP_COUNT):
+            handler = op_map[op_id]
+            arg_count = getattr(handler, "arg_count", None)
+
+            if arg_count is not None:
+                entry = OpEntry(OpKind.fixed, arg_count, handler)
+            else:
+                entry = OpEntry(OpKind.handler, None, handler)
+
+            self.entries.append(entry)
+
+
+def compile_op_table(rom):
+    return OpTable(get_op_map(rom))
@@ -0,0 +1,202 @@
+import json
+import time
+import sd3.seq.reader
+
+# The profiler only wraps the observer given to a reader: an unprofiled
+# reader runs unchanged.
+#
+# Times are measured between op_started notifications: the time of an
+# operation includes the read of the next operation id. Bits are the
+# control stream bits used by the operation, its id included.
+
+
+class OpStats:
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.bits = 0
+        self.jumps = 0
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "time": self.time,
+            "bits": self.bits,
+            "jumps": self.jumps,
+        }
+
+
+class SequenceStats:
+    def __init__(self):
+        self.time = 0.0
+        self.op_count = 0
+        self.bits = 0
+        self.jumps = 0
+        self.error_op_id = None
+
+    def to_dict(self):
+        return {
+            "time": self.time,
+            "op_count": self.op_count,
+            "bits": self.bits,
+            "jumps": self.jumps,
+            "error_op_id": self.error_op_id,
+        }
+
+
+class Profiler:
+    def __init__(self):
+        self.ops = {}
+        self.sequences = {}
+
+        # Number of jumps to each text sub-block
+        self.fragments = {}
+
+        # Time per (sequence address, operation id), for collapsed stacks
+        self.stacks = {}
+
+    def get_op_stats(self, op_id):
+        stats = self.ops.get(op_id)
+        if stats is None:
+            stats = OpStats()
+            self.ops[op_id] = stats
+
+        return stats
+
+    def get_sequence_stats(self, seq_addr):
+        stats = self.sequences.get(seq_addr)
+        if stats is None:
+            stats = SequenceStats()
+            self.sequences[seq_addr] = stats
+
+        return stats
+
+    def add_op(self, seq_addr, op_id, elapsed, bits):
+        stats = self.get_op_stats(op_id)
+        stats.count += 1
+        stats.time += elapsed
+        stats.bits += bits
+
+        seq_stats = self.get_sequence_stats(seq_addr)
+        seq_stats.op_count += 1
+        seq_stats.bits += bits
+
+        key = (seq_addr, op_id)
+        self.stacks[key] = self.stacks.get(key, 0.0) + elapsed
+
+    def add_jump(self, seq_addr, op_id, sub_idx):
+        self.get_op_stats(op_id).jumps += 1
+        self.get_sequence_stats(seq_addr).jumps += 1
+        self.fragments[sub_idx] = self.fragments.get(sub_idx, 0) + 1
+
+    def to_dict(self):
+        return {
+            "ops": {"%02X" % op_id: stats.to_dict()
+                    for op_id, stats in sorted(self.ops.items())},
+            "sequences": {"%06X" % seq_addr: stats.to_dict()
+                          for seq_addr, stats
+                          in sorted(self.sequences.items())},
+            "fragments": {"%04X" % sub_idx: count
+                          for sub_idx, count
+                          in sorted(self.fragments.items())},
+        }
+
+    def write_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=4)
+
+    def write_collapsed(self, path):
+        # One "frame;frame value" line per stack, as read by flamegraph
+        # tools. Values are microseconds.
+        with open(path, "w") as f:
+            for (seq_addr, op_id), elapsed in sorted(self.stacks.items()):
+                f.write("seq_%06X;op_%02X %d\n" %
+                        (seq_addr, op_id, round(elapsed * 1e6)))
+
+
+class _SequenceRun:
+    def __init__(self, profiler, seq_addr):
+        self.profiler = profiler
+        self.seq_addr = seq_addr
+
+        self.op_id = None
+        self.op_start = None
+        self.op_bit_position = None
+
+    def _end_op(self, now, bit_position):
+        if self.op_id is None:
+            return
+
+        bits = 0
+        if bit_position is not None:
+            bits = bit_position - self.op_bit_position
+
+        self.profiler.add_op(self.seq_addr, self.op_id,
+                             now - self.op_start, bits)
+        self.op_id = None
+
+    def op_started(self, op_id, bit_position):
+        now = time.perf_counter()
+        self._end_op(now, bit_position)
+
+        if op_id != 0:
+            self.op_id = op_id
+            self.op_start = now
+            self.op_bit_position = bit_position
+
+    def sub_jump(self, sub_idx):
+        self.profiler.add_jump(self.seq_addr, self.op_id, sub_idx)
+
+    def end(self, error_op_id):
+        # The bits of a failed operation are unknown
+        self._end_op(time.perf_counter(), None)
+
+        if error_op_id is not None:
+            stats = self.profiler.get_sequence_stats(self.seq_addr)
+            stats.error_op_id = error_op_id
+
+
+class _ProfileObserver(sd3.seq.reader.Observer):
+    def __init__(self, observer, run):
+        self.observer = observer
+        self.run = run
+
+    def op_started(self, op_id, bit_position):
+        self.run.op_started(op_id, bit_position)
+        self.observer.op_started(op_id, bit_position)
+
+    def text_decoded(self, decoded):
+        self.observer.text_decoded(decoded)
+
+    def fragment_referenced(self, sub_idx):
+        self.run.sub_jump(sub_idx)
+        self.observer.fragment_referenced(sub_idx)
+
+
+class ProfiledReader:
+    def __init__(self, reader, profiler):
+        self.reader = reader
+        self.profiler = profiler
+        self.run = None
+
+    def read_sequence(self, idx, observer):
+        seq_addr = self.reader.get_sequence_addr(idx)
+        return self.read_sequence_from_addr(seq_addr, observer)
+
+    def read_sequence_from_addr(self, seq_addr, observer):
+        self.run = _SequenceRun(self.profiler, seq_addr)
+        start = time.perf_counter()
+
+        error_op_id = None
+        try:
+            return self.reader.read_sequence_from_addr(
+                seq_addr, _ProfileObserver(observer, self.run))
+        except sd3.seq.reader.ReadException as e:
+            error_op_id = e.op_id
+            raise
+        finally:
+            self.run.end(error_op_id)
+            self.run = None
+
+            stats = self.profiler.get_sequence_stats(seq_addr)
+            stats.time += time.perf_counter() - start
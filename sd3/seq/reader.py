@@ -1,11 +1,9 @@
 import logging
 import sd3.rom
-import sd3.tree
+import sd3.tree_registry
 import sd3.bitutils
 import sd3.seq.ops
-
-
-_PTR_BASE = 0xF80000
+import sd3.seq.index
 
 
 class ReadException(Exception):
@@ -15,28 +13,38 @@ class ReadException(Exception):
 
 
 class Observer:
+    # bit_position is the position in the control stream when the operation
+    # starts. The end of the stream is notified as the operation 0.
+    def op_started(self, op_id, bit_position):
+        pass
+
     def text_decoded(self, decoded):
         pass
 
+    # Called for each text sub-block referenced by a text, nested ones
+    # included, before the text_decoded of the text
+    def fragment_referenced(self, sub_idx):
+        pass
+
+
+def wants_op_events(observer):
+    # Operation notifications cost a bit position per operation: they are
+    # only sent to the observers implementing op_started
+    return type(observer).op_started is not Observer.op_started
+
+
+def get_sequence_addr(rom, idx):
+    return sd3.seq.index.get_addr(rom, idx)
+
 
 class Reader:
     def __init__(self, rom):
         self.rom = rom
-        self.tree = sd3.tree.build_ctrl_tree(self.rom)
-        self.op_map = sd3.seq.ops.get_op_map(self.rom)
+        self.tree = sd3.tree_registry.get_ctrl_tree(self.rom)
+        self.op_table = sd3.seq.ops.compile_op_table(self.rom)
 
     def get_sequence_addr(self, idx):
-        # Get bank
-        if idx < 0x600:
-            bank = 0xF9
-        elif idx < 0xA00:
-            bank = 0xFA
-        elif idx < 0xC00:
-            bank = 0xFB
-        else:
-            bank = 0xF8
-
-        return self.rom.read_addr_from_ptr(_PTR_BASE, idx, bank)
+        return get_sequence_addr(self.rom, idx)
 
     def _build_seq_reader(self, addr):
         bitreader = sd3.bitutils.BitReader.from_rom_u16_big(self.rom, addr)
@@ -46,7 +54,7 @@ class Reader:
             logging.debug("seq_reader: got %04X", v)
             return v
 
-        return reader_cb
+        return (bitreader, reader_cb)
 
     def read_sequence(self, idx, observer):
         # Configure rom read
@@ -54,11 +62,22 @@ class Reader:
         return self.read_sequence_from_addr(seq_addr, observer)
 
     def read_sequence_from_addr(self, seq_addr, observer):
-        seq_reader = self._build_seq_reader(seq_addr)
+        bitreader, seq_reader = self._build_seq_reader(seq_addr)
+
+        entries = self.op_table.entries
+        decode = self.tree.decode
+        fixed = sd3.seq.ops.OpKind.fixed
+
+        op_started = None
+        if wants_op_events(observer):
+            op_started = observer.op_started
 
         # Decode control stream
         next_ctrl_byte = None
         while True:
+            if op_started is not None:
+                bit_position = bitreader.bit_position()
+
             if next_ctrl_byte is not None:
                 op_id = next_ctrl_byte
                 next_ctrl_byte = None
@@ -68,14 +87,22 @@ class Reader:
                 op_id = seq_reader() & 0xFF
                 logging.debug("Ctrl byte: 0x%04X (from ctrl stream)", op_id)
 
+            if op_started is not None:
+                op_started(op_id, bit_position)
+
             if op_id == 0:
                 logging.debug("End of stream")
                 break
 
-            op_cb = self.op_map[op_id]
+            kind, arg_count, op_cb = entries[op_id]
 
             try:
-                next_ctrl_byte = op_cb(op_id, seq_reader, observer)
+                if kind is fixed:
+                    # Skip the arguments without calling the handler
+                    for _ in range(arg_count):
+                        decode(bitreader)
+                else:
+                    next_ctrl_byte = op_cb(op_id, seq_reader, observer)
             except Exception:
                 logging.error("Operation code %02X processing failed", op_id)
                 raise ReadException(op_id)
@@ -1,6 +1,7 @@
 import logging
+from collections import OrderedDict
 import sd3.rom
-import sd3.tree
+import sd3.tree_registry
 import sd3.bitutils
 
 
@@ -13,6 +14,15 @@ _SUB_TREE_SECOND_IDX = 3
 _SUBBLOCK_BASE = 0xF89800
 _SUBBLOCK_BANK = 0xF8
 
+# Characters from this one are references to sub-blocks
+_SUBBLOCK_FIRST_CHAR = 0x040C
+
+# Characters are 12 bits values
+_SUBBLOCK_COUNT = 0x1000 - _SUBBLOCK_FIRST_CHAR
+
+# Maximum number of decoded sub-blocks kept by a reader
+_FRAGMENT_CACHE_SIZE = 256
+
 
 class _TxtReader:
     def __init__(self, bitreader, tree, parent=None):
@@ -20,6 +30,10 @@ class _TxtReader:
         self.tree = tree
         self.parent = parent
 
+        # (sub-block index, start in the decoded list, start in the
+        # references list) of a sub reader
+        self.fragment = None
+
     def read_char(self, tree_idx):
         return self.tree[tree_idx].decode(self.bitreader)
 
@@ -39,15 +53,22 @@ class Reader:
         self.rom = sd3.rom.Rom.from_rom(rom)
 
         self.txt_main_tree = [
-            sd3.tree.build_txt_tree(self.rom, _MAIN_TREE_FIRST_IDX),
-            sd3.tree.build_txt_tree(self.rom, _MAIN_TREE_SECOND_IDX)
+            sd3.tree_registry.get_txt_tree(self.rom, _MAIN_TREE_FIRST_IDX),
+            sd3.tree_registry.get_txt_tree(self.rom, _MAIN_TREE_SECOND_IDX)
         ]
 
         self.txt_sub_tree = [
-            sd3.tree.build_txt_tree(self.rom, _SUB_TREE_FIRST_IDX),
-            sd3.tree.build_txt_tree(self.rom, _SUB_TREE_SECOND_IDX)
+            sd3.tree_registry.get_txt_tree(self.rom, _SUB_TREE_FIRST_IDX),
+            sd3.tree_registry.get_txt_tree(self.rom, _SUB_TREE_SECOND_IDX)
         ]
 
+        # Sub-blocks are shared by many dialogs: their fully decoded
+        # characters and the nested sub-blocks they reference are kept in a
+        # LRU cache
+        self.fragments = OrderedDict()
+        self.fragment_hits = 0
+        self.fragment_misses = 0
+
     def _build_main_txt_reader(self, seq_reader):
         def bitreader_provider():
             high = seq_reader() & 0xFF
@@ -59,20 +80,50 @@ class Reader:
 
         return _TxtReader(bitreader, self.txt_main_tree)
 
-    def _build_sub_txt_reader(self, idx, parent):
-        idx -= 0x040C
-
-        addr = self.rom.read_addr_from_ptr(
-            _SUBBLOCK_BASE, idx, _SUBBLOCK_BANK)
+    def _build_sub_txt_reader(self, sub_idx, parent):
+        addr = int(self.rom.get_ptr_table(
+            _SUBBLOCK_BASE, _SUBBLOCK_COUNT, _SUBBLOCK_BANK)[sub_idx])
         logging.debug("Jump to: %X", addr)
 
         bitreader = sd3.bitutils.BitReader.from_rom_u16_big(self.rom, addr)
 
         return _TxtReader(bitreader, self.txt_sub_tree, parent)
 
+    def _read_fragment(self, sub_idx, txt_reader, decoded, refs):
+        # Give the reader to continue the decode with
+        refs.append(sub_idx)
+
+        fragment = self.fragments.get(sub_idx)
+        if fragment is not None:
+            self.fragments.move_to_end(sub_idx)
+            self.fragment_hits += 1
+
+            chars, nested_refs = fragment
+            decoded.extend(chars)
+            refs.extend(nested_refs)
+            return txt_reader
+
+        self.fragment_misses += 1
+
+        sub_reader = self._build_sub_txt_reader(sub_idx, txt_reader)
+        sub_reader.fragment = (sub_idx, len(decoded), len(refs))
+
+        return sub_reader
+
+    def _add_fragment(self, sub_reader, decoded, refs):
+        sub_idx, start, refs_start = sub_reader.fragment
+
+        self.fragments[sub_idx] = (tuple(decoded[start:]),
+                                   tuple(refs[refs_start:]))
+        if len(self.fragments) > _FRAGMENT_CACHE_SIZE:
+            self.fragments.popitem(last=False)
+
     def __call__(self, op_id, seq_reader, observer):
         decoded = []
 
+        # Referenced sub-blocks
+        refs = []
+
         # Setup main text reader
         main_txt_reader = self._build_main_txt_reader(seq_reader)
 
@@ -86,6 +137,9 @@ class Reader:
             char = txt_reader.read_char(tree_idx=0)
 
             if char == 0:
+                if txt_reader.fragment is not None:
+                    self._add_fragment(txt_reader, decoded, refs)
+
                 last_reader = txt_reader
                 txt_reader = txt_reader.get_parent()
             elif char < 0x10:
@@ -96,11 +150,16 @@ class Reader:
                     char &= 0xFF
                     decoded.append(char)
                 else:
-                    txt_reader = self._build_sub_txt_reader(char, txt_reader)
+                    txt_reader = self._read_fragment(
+                        char - _SUBBLOCK_FIRST_CHAR, txt_reader, decoded,
+                        refs)
             else:
                 decoded.append(char)
 
         logging.debug("Partial decode: %s", decoded)
+
+        for sub_idx in refs:
+            observer.fragment_referenced(sub_idx)
         observer.text_decoded(decoded)
 
         return last_reader.get_pending_byte()
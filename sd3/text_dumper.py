@@ -1,23 +1,63 @@
+import os
 import enum
+import json
+import array
+import struct
+import hashlib
 import logging
+import collections
+import concurrent.futures
 from collections import namedtuple
+import sd3.rom
+import sd3.cache_utils
+import sd3.fragment_index
+import sd3.seq.cache
+import sd3.seq.index
 import sd3.seq.reader
 import sd3.text_table
+import sd3.tree_registry
 
-_SEQ_COUNT = 0x1000
+SEQ_COUNT = sd3.seq.index.SEQ_COUNT
+
+# Number of sequences sent at once to a worker
+_CHUNK_SIZE = 32
+
+# Number of chunks decoded in advance by each worker
+_CHUNKS_PER_JOB = 4
+
+_MANIFEST_VERSION = 1
 
 
 class _SeqObserver(sd3.seq.reader.Observer):
     def __init__(self):
         self.decoded = []
+        self.ops = []
+        self.fragments = []
+
+    def op_started(self, op_id, bit_position):
+        self.ops.append((op_id, bit_position, len(self.decoded)))
 
     def text_decoded(self, decoded):
         self.decoded.append(decoded)
 
+    def fragment_referenced(self, sub_idx):
+        self.fragments.append((sub_idx, len(self.decoded)))
+
 
-class _DecodeStatus(enum.Enum):
+class SequenceStatus(enum.Enum):
     ok = 1
     empty = 2
+    error = 3
+
+
+# A decoded sequence. The blocks decoded before an error are kept, op_id is
+# the operation that failed. ops are the (op_id, bit_position, block_count)
+# of the read operations, block_count being the number of blocks decoded
+# before the operation. fragments are the (sub_idx, block_count) of the text
+# sub-blocks referenced by the blocks.
+SequenceRecord = namedtuple("SequenceRecord",
+                            ["idx", "addr", "blocks", "status", "op_id",
+                             "ops", "fragments"])
 
 
 class DumpStats:
@@ -35,84 +75,525 @@ class DumpStats:
             self.opcode_errors[opcode].append(idx)
 
 
-class _Dumper:
-    def __init__(self, rom, tbl_path, output_path):
-        self.decoder = sd3.seq.reader.Reader(rom)
-
-        self.tbl = sd3.text_table.Table()
-        self.tbl.load(tbl_path)
-
-        self.output_path = output_path
-        self.out = None
-
-    def _write_txt(self, txt, out):
-        i = 0
-        while i < len(txt):
-            c = txt[i]
-
-            if c >= 0x20:
-                out.write("%s" % self.tbl.decode_char(c))
-                i += 1
-            elif c == 0x19:
-                out.write("[Character:%02X]" % txt[i+1])
-                i += 2
-            elif c == 0x17:
-                out.write("\n")
-                i += 1
-            else:
-                out.write("[0x%02X]" % c)
-                i += 1
-
-    def _read_seq(self, idx, seq_addr, out):
-        logging.info("Decoding %04X", idx)
-
-        # The read sequence can fail if an operation code is unknown
-        obs = _SeqObserver()
-        self.decoder.read_sequence_from_addr(seq_addr, obs)
-
-        # Some blocks are empty
-        if not obs.decoded:
-            return _DecodeStatus.empty
-
-        out.write("Block 0x%04X" % idx)
-        for i, txt in enumerate(obs.decoded):
-            out.write("\nSublock %d\n" % i)
-            self._write_txt(txt, out)
-
-        out.write("\nEnd of block %04X\n\n" % idx)
-        return _DecodeStatus.ok
-
-    def run(self):
-        known_seq_addr = set()
-        stats = DumpStats()
-        out = open(self.output_path, "w")
-
-        for idx in range(_SEQ_COUNT):
-            seq_addr = self.decoder.get_sequence_addr(idx)
-            if seq_addr in known_seq_addr:
-                logging.info("Skip %04X (already known)", idx)
-                continue
+def _decode_seq(decoder, idx, seq_addr):
+    logging.info("Decoding %04X", idx)
+
+    # The read sequence can fail if an operation code is unknown
+    obs = _SeqObserver()
+    try:
+        decoder.read_sequence_from_addr(seq_addr, obs)
+    except sd3.seq.reader.ReadException as e:
+        return SequenceRecord(idx, seq_addr, obs.decoded,
+                              SequenceStatus.error, e.op_id, obs.ops,
+                              obs.fragments)
+
+    # Some blocks are empty
+    if not obs.decoded:
+        return SequenceRecord(idx, seq_addr, obs.decoded,
+                              SequenceStatus.empty, None, obs.ops,
+                              obs.fragments)
+
+    return SequenceRecord(idx, seq_addr, obs.decoded, SequenceStatus.ok,
+                          None, obs.ops, obs.fragments)
+
+
+def _record_from_cache(idx, seq_addr, entry):
+    if entry.op_id is not None:
+        status = SequenceStatus.error
+    elif not entry.blocks:
+        status = SequenceStatus.empty
+    else:
+        status = SequenceStatus.ok
+
+    return SequenceRecord(idx, seq_addr, entry.blocks, status, entry.op_id,
+                          entry.ops, entry.fragments)
+
+
+def _record_to_cache(record):
+    return sd3.seq.cache.CachedSequence(record.blocks, record.op_id,
+                                        record.ops, record.fragments)
+
+
+# Decoder of a worker process. The trees are built once per worker.
+_worker_decoder = None
+
+
+def _init_worker(rom_path, conv_addr, cache_dir):
+    global _worker_decoder
+
+    sd3.tree_registry.set_cache_dir(cache_dir)
+
+    rom = sd3.rom.Rom.from_path(rom_path, conv_addr)
+    _worker_decoder = sd3.seq.reader.Reader(rom)
+
+
+def _decode_chunk_in_worker(chunk):
+    return [_decode_seq(_worker_decoder, idx, seq_addr)
+            for idx, seq_addr in chunk]
+
+
+class _SequenceIterator:
+    def __init__(self, rom, indexes, jobs, cache_dir):
+        self.rom = rom
+        self.indexes = list(indexes)
+
+        # The decoder is built on demand: it is not needed if every
+        # sequence is in the cache
+        self.decoder = None
+
+        self.cache_dir = cache_dir
+        if cache_dir is not None:
+            self.cache = sd3.seq.cache.SequenceCache.for_rom(cache_dir, rom)
+        else:
+            self.cache = None
+
+        self.jobs = jobs
+        if self.jobs > 1 and rom.path is None:
+            logging.warning("ROM has no path, parallel decode disabled")
+            self.jobs = 1
+
+    def _get_seq_list(self):
+        seq_index = sd3.seq.index.SequenceIndex.from_rom(self.rom)
+        seq_list = list(seq_index.iter_unique(self.indexes))
+
+        logging.info("%d sequences, %d aliases skipped", len(seq_list),
+                     len(self.indexes) - len(seq_list))
+
+        return seq_list
+
+    def _decode_serial(self, seq_list):
+        for idx, seq_addr in seq_list:
+            if self.decoder is None:
+                self.decoder = sd3.seq.reader.Reader(self.rom)
+
+            yield _decode_seq(self.decoder, idx, seq_addr)
+
+    def _decode_parallel(self, seq_list):
+        chunks = [seq_list[i:i+_CHUNK_SIZE]
+                  for i in range(0, len(seq_list), _CHUNK_SIZE)]
+
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.jobs,
+                initializer=_init_worker,
+                initargs=(self.rom.path, self.rom.conv_addr,
+                          self.cache_dir)) as executor:
+            # Only a few chunks are submitted in advance: results are not
+            # accumulated if the consumer is slower than the workers
+            pending = collections.deque()
+            next_chunk = 0
 
             try:
-                read_res = self._read_seq(idx, seq_addr, out)
-                if read_res == _DecodeStatus.ok:
-                    stats.seq_ok += 1
-                elif read_res == _DecodeStatus.empty:
-                    stats.seq_empty += 1
+                while pending or next_chunk < len(chunks):
+                    while (next_chunk < len(chunks) and
+                           len(pending) < _CHUNKS_PER_JOB * self.jobs):
+                        pending.append(executor.submit(
+                            _decode_chunk_in_worker, chunks[next_chunk]))
+                        next_chunk += 1
+
+                    yield from pending.popleft().result()
+            finally:
+                # The consumer may stop before the end
+                for future in pending:
+                    future.cancel()
+
+    def _decode(self, seq_list):
+        if self.jobs > 1:
+            return self._decode_parallel(seq_list)
+        else:
+            return self._decode_serial(seq_list)
+
+    def _decode_cached(self, seq_list):
+        # Only decode the sequences missing from the cache
+        missing_list = [(idx, seq_addr) for idx, seq_addr in seq_list
+                        if self.cache.get(seq_addr) is None]
+        logging.info("%d sequences to decode, %d from cache",
+                     len(missing_list), len(seq_list) - len(missing_list))
+
+        records = self._decode(missing_list)
+
+        try:
+            for idx, seq_addr in seq_list:
+                entry = self.cache.get(seq_addr)
+                if entry is not None:
+                    yield _record_from_cache(idx, seq_addr, entry)
                 else:
-                    raise Exception("Unexpected read result %s" % read_res)
-            except sd3.seq.reader.ReadException as e:
-                stats.record_read_error(e.op_id, idx)
-                stats.seq_error += 1
+                    record = next(records)
+                    self.cache.put(seq_addr, _record_to_cache(record))
+                    yield record
+        finally:
+            records.close()
+            self.cache.save()
+
+    def __iter__(self):
+        seq_list = self._get_seq_list()
+        if self.cache is not None:
+            return self._decode_cached(seq_list)
+        else:
+            return self._decode(seq_list)
+
+
+def iter_sequences(rom, indexes=None, jobs=1, cache_dir=None):
+    # Records are given in index order. An index is skipped if its address
+    # was already given by a previous index.
+    if indexes is None:
+        indexes = range(SEQ_COUNT)
+
+    return iter(_SequenceIterator(rom, indexes, jobs, cache_dir))
+
+
+def format_txt(tbl, txt):
+    out = []
+
+    i = 0
+    while i < len(txt):
+        c = txt[i]
+
+        if c >= 0x20:
+            out.append("%s" % tbl.decode_char(c))
+            i += 1
+        elif c == 0x19:
+            out.append("[Character:%02X]" % txt[i+1])
+            i += 2
+        elif c == 0x17:
+            out.append("\n")
+            i += 1
+        else:
+            out.append("[0x%02X]" % c)
+            i += 1
+
+    return "".join(out)
+
+
+def get_table_codes(txt):
+    # Codes rendered with the table, as in format_txt
+    codes = set()
+
+    i = 0
+    while i < len(txt):
+        c = txt[i]
+
+        if c >= 0x20:
+            codes.add(c)
+        elif c == 0x19:
+            i += 1
+
+        i += 1
+
+    return codes
+
+
+def _get_blocks_sha1(blocks):
+    return hashlib.sha1(json.dumps(blocks).encode("utf-8")).hexdigest()
+
+
+class _TextRenderer:
+    # Renders the blocks of the sequences. With a manifest, the texts of the
+    # previous run are reused, unless the blocks of the sequence or the
+    # table entries they use changed.
+    def __init__(self, tbl, manifest_path=None):
+        self.tbl = tbl
+        self.manifest_path = manifest_path
+
+        self.previous = {}
+        self.entries = {}
+        self.reused_count = 0
+
+        if manifest_path is not None:
+            self._load()
+
+    def _load(self):
+        manifest = sd3.cache_utils.load_json(self.manifest_path, "manifest",
+                                             _MANIFEST_VERSION)
+        if manifest is None:
+            return
+
+        previous_tbl = {int(code, 16): char
+                        for code, char in manifest["table"].items()}
+        current_tbl = self.tbl.get_entries()
+
+        changed_codes = set()
+        for code in set(previous_tbl.keys()) | set(current_tbl.keys()):
+            if previous_tbl.get(code) != current_tbl.get(code):
+                changed_codes.add(code)
+
+        for seq_addr, entry in manifest["sequences"].items():
+            if changed_codes.isdisjoint(entry["codes"]):
+                self.previous[int(seq_addr)] = entry
+
+    def render(self, record):
+        blocks_sha1 = _get_blocks_sha1(record.blocks)
+
+        entry = self.previous.get(record.addr)
+        if entry is not None and entry["blocks_sha1"] == blocks_sha1:
+            self.reused_count += 1
+        else:
+            codes = set()
+            for txt in record.blocks:
+                codes |= get_table_codes(txt)
+
+            entry = {
+                "blocks_sha1": blocks_sha1,
+                "codes": sorted(codes),
+                "text": [format_txt(self.tbl, txt) for txt in record.blocks],
+            }
+
+        self.entries[record.addr] = entry
+        return entry["text"]
+
+    def save(self):
+        if self.manifest_path is None:
+            return
+
+        logging.info("%d sequences rendered, %d reused",
+                     len(self.entries) - self.reused_count,
+                     self.reused_count)
+
+        manifest = {
+            "version": _MANIFEST_VERSION,
+            "table": {"%04X" % code: char
+                      for code, char in self.tbl.get_entries().items()},
+            "sequences": {str(seq_addr): entry
+                          for seq_addr, entry in self.entries.items()},
+        }
+
+        sd3.cache_utils.save_json(self.manifest_path, manifest)
+
+
+def _record_to_dict(texts, record):
+    return {
+        "idx": record.idx,
+        "addr": record.addr,
+        "status": record.status.name,
+        "op_id": record.op_id,
+        "blocks": record.blocks,
+        "text": texts,
+        "ops": [{"op_id": op_id, "bit_position": bit_position,
+                 "block_count": block_count}
+                for op_id, bit_position, block_count in record.ops],
+    }
+
+
+class _TxtWriter:
+    def __init__(self, renderer, path):
+        self.renderer = renderer
+        self.out = open(path, "w")
+
+    def write(self, record):
+        # Only sequences with text are written
+        if record.status != SequenceStatus.ok:
+            return
+
+        self.out.write("Block 0x%04X" % record.idx)
+        for i, txt in enumerate(self.renderer.render(record)):
+            self.out.write("\nSublock %d\n" % i)
+            self.out.write(txt)
+
+        self.out.write("\nEnd of block %04X\n\n" % record.idx)
+
+    def close(self):
+        self.out.close()
+
+
+class _JsonlWriter:
+    def __init__(self, renderer, path):
+        self.renderer = renderer
+        self.out = open(path, "w")
+
+    def write(self, record):
+        texts = self.renderer.render(record)
+        self.out.write(json.dumps(_record_to_dict(texts, record)))
+        self.out.write("\n")
+
+    def close(self):
+        self.out.close()
+
+
+# Binary export: a header, then each record prefixed by its size.
+#
+# A record is made of _BIN_RECORD, then for each block its symbol count,
+# its symbols (u16) and its UTF-8 text prefixed by its size, then the
+# operations (_BIN_OP).
+_BIN_MAGIC = b"SD3X"
+_BIN_VERSION = 1
+
+_BIN_HEADER = struct.Struct("<4sH")
+_BIN_SIZE = struct.Struct("<I")
+_BIN_RECORD = struct.Struct("<HIBHHH")
+_BIN_BLOCK = struct.Struct("<H")
+_BIN_TEXT = struct.Struct("<I")
+_BIN_OP = struct.Struct("<BIH")
+
+# Stored instead of the failing operation id for sequences decoded
+# without error
+_BIN_NO_ERROR = 0xFFFF
+
+
+class _BinaryWriter:
+    def __init__(self, renderer, path):
+        self.renderer = renderer
+        self.out = open(path, "wb")
+        self.out.write(_BIN_HEADER.pack(_BIN_MAGIC, _BIN_VERSION))
+
+    def write(self, record):
+        op_id = _BIN_NO_ERROR if record.op_id is None else record.op_id
+
+        data = bytearray(_BIN_RECORD.pack(
+            record.idx, record.addr, record.status.value, op_id,
+            len(record.blocks), len(record.ops)))
+
+        texts = self.renderer.render(record)
+        for txt, rendered in zip(record.blocks, texts):
+            data += _BIN_BLOCK.pack(len(txt))
+            data += array.array("H", txt).tobytes()
+
+            encoded = rendered.encode("utf-8")
+            data += _BIN_TEXT.pack(len(encoded))
+            data += encoded
+
+        for op in record.ops:
+            data += _BIN_OP.pack(*op)
+
+        self.out.write(_BIN_SIZE.pack(len(data)))
+        self.out.write(data)
+
+    def close(self):
+        self.out.close()
+
+
+def _read_binary_record(data):
+    idx, addr, status, op_id, block_count, op_count = \
+        _BIN_RECORD.unpack_from(data, 0)
+    offset = _BIN_RECORD.size
+
+    blocks = []
+    texts = []
+    for _ in range(block_count):
+        length = _BIN_BLOCK.unpack_from(data, offset)[0]
+        offset += _BIN_BLOCK.size
+
+        block = array.array("H")
+        block.frombytes(data[offset:offset+length*block.itemsize])
+        offset += length * block.itemsize
+        blocks.append(block.tolist())
+
+        length = _BIN_TEXT.unpack_from(data, offset)[0]
+        offset += _BIN_TEXT.size
+        texts.append(data[offset:offset+length].decode("utf-8"))
+        offset += length
+
+    ops = []
+    for _ in range(op_count):
+        op = _BIN_OP.unpack_from(data, offset)
+        offset += _BIN_OP.size
+
+        ops.append({"op_id": op[0], "bit_position": op[1],
+                    "block_count": op[2]})
+
+    return {
+        "idx": idx,
+        "addr": addr,
+        "status": SequenceStatus(status).name,
+        "op_id": None if op_id == _BIN_NO_ERROR else op_id,
+        "blocks": blocks,
+        "text": texts,
+        "ops": ops,
+    }
+
+
+def read_binary_export(path):
+    # Gives the records as they are written in the JSONL export
+    with open(path, "rb") as f:
+        magic, version = _BIN_HEADER.unpack(f.read(_BIN_HEADER.size))
+        if magic != _BIN_MAGIC or version != _BIN_VERSION:
+            raise Exception("Invalid binary export %s" % path)
+
+        while True:
+            size = f.read(_BIN_SIZE.size)
+            if not size:
+                break
+
+            size = _BIN_SIZE.unpack(size)[0]
+            yield _read_binary_record(f.read(size))
+
+
+_WRITERS = {
+    "txt": _TxtWriter,
+    "jsonl": _JsonlWriter,
+    "bin": _BinaryWriter,
+}
+
+FORMATS = list(_WRITERS.keys())
+
+
+def _write_records(records, writer, indexer=None):
+    stats = DumpStats()
+
+    for record in records:
+        if record.status == SequenceStatus.ok:
+            stats.seq_ok += 1
+        elif record.status == SequenceStatus.empty:
+            stats.seq_empty += 1
+        elif record.status == SequenceStatus.error:
+            stats.record_read_error(record.op_id, record.idx)
+            stats.seq_error += 1
+        else:
+            raise Exception("Unexpected read result %s" % record.status)
+
+        writer.write(record)
+        stats.seq_count += 1
+
+        if indexer is not None:
+            indexer.add(record)
+
+    return stats
+
+
+def dump(rom, tbl_path, output_path, jobs=1, cache_dir=None, fmt="txt"):
+    records = iter_sequences(rom, jobs=jobs, cache_dir=cache_dir)
+
+    tbl = sd3.text_table.Table()
+    tbl.load(tbl_path)
+
+    # The rendered texts are kept with the decoded sequences
+    manifest_path = None
+    if cache_dir is not None:
+        manifest_name = "text-%s.json" % rom.get_sha1()
+        manifest_path = os.path.join(cache_dir, manifest_name)
+
+    # So are the references to the text sub-blocks
+    indexer = None
+    if cache_dir is not None:
+        indexer = sd3.fragment_index.Indexer(rom)
+
+    renderer = _TextRenderer(tbl, manifest_path)
+    writer = _WRITERS[fmt](renderer, output_path)
+    try:
+        stats = _write_records(records, writer, indexer)
+    finally:
+        writer.close()
+
+    renderer.save()
+    if indexer is not None:
+        indexer.index.save(sd3.fragment_index.get_index_path(cache_dir, rom))
+
+    return stats
 
-            known_seq_addr.add(seq_addr)
-            stats.seq_count += 1
 
-        out.close()
+def get_fragment_index(rom, jobs=1, cache_dir=None):
+    # The index saved by the last dump is used. If missing, the sequences
+    # are decoded to build it.
+    path = None
+    if cache_dir is not None:
+        path = sd3.fragment_index.get_index_path(cache_dir, rom)
+        index = sd3.fragment_index.FragmentIndex.load(path)
+        if index is not None:
+            return index
 
-        return stats
+    indexer = sd3.fragment_index.Indexer(rom)
+    for record in iter_sequences(rom, jobs=jobs, cache_dir=cache_dir):
+        indexer.add(record)
 
+    if path is not None:
+        indexer.index.save(path)
 
-def dump(rom, tbl_path, output_path):
-    dumper = _Dumper(rom, tbl_path, output_path)
-    return dumper.run()
+    return indexer.index
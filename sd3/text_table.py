@@ -16,3 +16,6 @@ class Table:
 
     def decode_char(self, char):
         return self._entries[char]
+
+    def get_entries(self):
+        return dict(self._entries)
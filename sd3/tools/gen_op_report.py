@@ -2,6 +2,7 @@ import os
 import logging
 from collections import namedtuple
 import sd3.disasm.cpu
+import sd3.disasm.routine_db
 from sd3.disasm.attributes import Attr
 from sd3.disasm.addr_modes import AddrMode
 import sd3.cfa.graph
@@ -159,8 +160,8 @@ class _RoutineInfo:
 
 
 class _HandlerAnalyser:
-    def __init__(self, cpu_reader, cfg, root_addr):
-        self.cpu_reader = cpu_reader
+    def __init__(self, routine_db, cfg, root_addr):
+        self.routine_db = routine_db
         self.cfg = cfg
         self.root_addr = root_addr
 
@@ -202,7 +203,7 @@ class _HandlerAnalyser:
     def _build_call_graph(self, handler_info):
         # Build graph root node (subroutine to analyse)
         p = sd3.disasm.cpu.PRegister(X=0, M=0)
-        routine = self.cpu_reader.read_routine(handler_info.addr, p)
+        routine = self.routine_db.get(handler_info.addr, p)
 
         info = self._build_routine_info(routine)
 
@@ -229,8 +230,7 @@ class _HandlerAnalyser:
                 continue
 
             # Read the subroutine
-            routine = self.cpu_reader.read_routine(subcall_addr,
-                                                   subcall.sub_descr.p)
+            routine = self.routine_db.get(subcall_addr, subcall.sub_descr.p)
 
             info = self._build_routine_info(routine)
 
@@ -360,9 +360,11 @@ class _RoutineAddrGenerator:
             routine_info = node.get_data()
             self._add_new_subcalls(routine_info)
 
-def gen_html_report(rom, cfg, output_path):
+def gen_html_report(rom, cfg, output_path, cache_dir=None):
     report = _HtmlReport()
-    cpu_reader = sd3.disasm.cpu.Reader(rom)
+
+    # The handlers share many subroutines: they are disassembled once
+    routine_db = sd3.disasm.routine_db.RoutineDB.for_rom(rom, cache_dir)
 
     # Analyse and build report for all the handler and interesting subroutines
     routine_gen = _RoutineAddrGenerator(rom, cfg)
@@ -375,7 +377,7 @@ def gen_html_report(rom, cfg, output_path):
             continue
 
         # Analyse handler and build html report
-        analyser = _HandlerAnalyser(cpu_reader, cfg, sub_addr)
+        analyser = _HandlerAnalyser(routine_db, cfg, sub_addr)
         handler_info = analyser.run()
 
         handler_report = _HtmlHandlerReport(sub_addr)
@@ -391,6 +393,8 @@ def gen_html_report(rom, cfg, output_path):
         # tracked routine. In this case, append them in the pending list.
         routine_gen.process_handler_info(handler_info)
 
+    routine_db.save()
+
     # Finalize report creation
     report.finalize()
 
@@ -7,8 +7,8 @@ def get_op_list(rom):
     _COUNT = 0x100
     _BANK = 0xC4
 
-    for op_id in range(_COUNT):
-        sub_addr = rom.read_addr_from_ptr(_BASE, op_id, _BANK)
+    sub_addrs = rom.get_ptr_table(_BASE, _COUNT, _BANK)
+    for op_id, sub_addr in enumerate(sub_addrs.tolist()):
         yield (op_id, sub_addr)
 
 def gen_map(rom, output_path):
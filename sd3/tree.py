@@ -1,3 +1,4 @@
+import array
 import logging
 from collections import namedtuple
 
@@ -6,6 +7,13 @@ import sd3.rom
 
 _TreeCfg = namedtuple("_TreeCfg", ["depth_size", "depth_offset", "data_size"])
 
+# Number of bits used to index a decode table
+_TABLE_BITS = 8
+
+# A table entry gives the number of bits used by a code prefix, and either
+# the decoded value (leaf reached) or the node to continue from.
+_TableEntry = namedtuple("_TableEntry", ["length", "value", "node"])
+
 
 class _CtrlTreeDecoder:
     def __init__(self, reader, cfg, depth):
@@ -21,62 +29,176 @@ class _DecodeTreeDecoder:
         self.data_offset = data_offset
 
 
-class Node:
-    def __init__(self):
-        self.value = None
-        self.children = [None, None]
+class Tree:
+    # Nodes are stored in parallel arrays. The root is the node 0: it can't
+    # be a child, so a leaf is a node with 0 as children.
+    def __init__(self, children0, children1, values):
+        self.children = (children0, children1)
+        self.values = values
 
+    @staticmethod
+    def new():
+        return Tree(array.array("H"), array.array("H"), array.array("H"))
 
-class Tree:
-    def __init__(self, root):
-        self.root = root
+    def add_node(self):
+        self.children[0].append(0)
+        self.children[1].append(0)
+        self.values.append(0)
+
+        return len(self.values) - 1
+
+    def set_children(self, node, child0, child1):
+        self.children[0][node] = child0
+        self.children[1][node] = child1
+
+    def set_value(self, node, value):
+        self.values[node] = value
+
+    def is_leaf(self, node):
+        return self.children[0][node] == 0
 
     def decode(self, reader):
-        node = self.root
+        children = self.children
+        node = 0
 
-        while node.value is None:
+        while children[0][node] != 0:
             bit = reader.read_bits(1)
-            node = node.children[bit]
+            node = children[bit][node]
+
+        return self.values[node]
+
+    def compile(self, table_bits=_TABLE_BITS):
+        return CompiledTree(self, table_bits)
+
+    def to_arrays(self):
+        return (self.children[0], self.children[1], self.values)
+
+    @staticmethod
+    def from_arrays(children0, children1, values):
+        return Tree(children0, children1, values)
+
+
+class CompiledTree:
+    def __init__(self, tree, table_bits):
+        self.tree = tree
+        self.table_bits = table_bits
+
+        # Tables are built on demand, indexed by their starting node
+        self.tables = {}
+        self.root_table = self._get_table(0)
+
+    def _build_table(self, node):
+        size = 1 << self.table_bits
+        table = [None] * size
+
+        # Walk the subtree up to table_bits levels. A leaf found at depth d
+        # fills all the 2^(table_bits - d) entries sharing its prefix.
+        stack = [(node, 0, 0)]
+        while stack:
+            current, prefix, depth = stack.pop()
+            is_leaf = self.tree.is_leaf(current)
+
+            if is_leaf or depth == self.table_bits:
+                shift = self.table_bits - depth
+                start = prefix << shift
 
-        return node.value
+                if is_leaf:
+                    entry = _TableEntry(depth, self.tree.values[current], None)
+                else:
+                    entry = _TableEntry(depth, None, current)
+
+                for i in range(start, start + (1 << shift)):
+                    table[i] = entry
+            else:
+                for bit in range(2):
+                    child = self.tree.children[bit][current]
+                    stack.append((child, (prefix << 1) | bit, depth + 1))
+
+        return (node, table)
+
+    def _get_table(self, node):
+        table = self.tables.get(node)
+        if table is None:
+            table = self._build_table(node)
+            self.tables[node] = table
+
+        return table
+
+    def decode(self, reader):
+        if self.tree.is_leaf(0):
+            return self.tree.values[0]
+
+        children = self.tree.children
+        table_bits = self.table_bits
+        node, table = self.root_table
+
+        while True:
+            # The reader may give less bits than requested: we must not
+            # consume data that the bit-by-bit decode wouldn't have read.
+            bits, count = reader.peek_buffered_bits(table_bits)
+            if bits is None:
+                raise Exception("Unexpected end of stream")
+
+            length, value, next_node = table[bits << (table_bits - count)]
+            if length <= count:
+                reader.skip_bits(length)
+
+                if next_node is None:
+                    return value
+
+                node, table = self._get_table(next_node)
+            else:
+                # The code is longer than the available bits: walk them
+                # one by one and continue from the reached node.
+                for i in range(count - 1, -1, -1):
+                    node = children[(bits >> i) & 1][node]
+
+                reader.skip_bits(count)
+                node, table = self._get_table(node)
 
 
 def _get_next_depth(reader, cfg):
     return reader.read_bits(cfg.depth_size) + cfg.depth_offset
 
 
-def _decode_ctrl_tree(decoder, current_depth=0):
-    if current_depth == decoder.depth:
-        node = Node()
-        node.value = decoder.reader.read_bits(decoder.cfg.data_size)
+def _decode_ctrl_tree(decoder):
+    tree = Tree.new()
+
+    # Nodes are built depth first, left child first: the leaf values are
+    # read in this order.
+    stack = [(tree.add_node(), 0)]
+    while stack:
+        node, current_depth = stack.pop()
+
+        if current_depth == decoder.depth:
+            value = decoder.reader.read_bits(decoder.cfg.data_size)
+            tree.set_value(node, value)
 
-        decoder.depth = _get_next_depth(decoder.reader, decoder.cfg)
-    else:
-        current_depth += 1
+            decoder.depth = _get_next_depth(decoder.reader, decoder.cfg)
+        else:
+            current_depth += 1
 
-        node = Node()
-        node.children[0] = _decode_ctrl_tree(decoder, current_depth)
-        node.children[1] = _decode_ctrl_tree(decoder, current_depth)
+            child0 = tree.add_node()
+            child1 = tree.add_node()
+            tree.set_children(node, child0, child1)
 
-    return node
+            stack.append((child1, current_depth))
+            stack.append((child0, current_depth))
+
+    return tree
 
 
 def build_ctrl_tree(rom):
     PTR_ADDR = 0xF82000
     TREE_BANK = 0xF8
-    WORD_SIZE = 16
 
     # Configure ROM reader
     rom.seek(PTR_ADDR)
     addr = (TREE_BANK << 16) | rom.read_u16()
     logging.debug("Build tree at address 0x%06X", addr)
-    rom.seek(addr)
 
     # Configure bit reader
-    def rom_reader():
-        return rom.read_u16(endianess=sd3.rom.BIG_ENDIAN)
-
-    reader = sd3.bitutils.BitReader.from_src(rom_reader, WORD_SIZE)
+    reader = sd3.bitutils.BitReader.from_rom_u16_big(rom, addr)
 
     # Decode config
     reader.read_bits(4)  # Ignore first 4 bits
@@ -95,36 +217,39 @@ def build_ctrl_tree(rom):
     # Configure and run decode
     decoder = _CtrlTreeDecoder(reader, cfg, depth)
 
-    root = _decode_ctrl_tree(decoder)
+    return _decode_ctrl_tree(decoder)
 
-    return Tree(root)
 
-
-def _decode_txt_tree(decoder, idx=1):
+def _decode_txt_tree(decoder):
     U16_SIZE = 2
 
-    if idx >= decoder.data_offset:
-        node = Node()
+    tree = Tree.new()
+
+    stack = [(tree.add_node(), 1)]
+    while stack:
+        node, idx = stack.pop()
 
-        # Go to node
-        addr = decoder.tree_addr + decoder.data_offset + idx
-        decoder.rom.seek(addr)
+        if idx >= decoder.data_offset:
+            # Go to node
+            addr = decoder.tree_addr + decoder.data_offset + idx
+            tree.set_value(node, decoder.rom.read_u8_at(addr))
+        else:
+            # Go to node
+            addr = decoder.tree_addr + U16_SIZE * idx
 
-        node.value = decoder.rom.read_u8()
-    else:
-        node = Node()
+            # Visit children
+            children = []
+            for i in range(2):
+                offset = decoder.rom.read_u8_at(addr + i)
+                next_idx = idx + offset + 1
 
-        # Go to node
-        addr = decoder.tree_addr + U16_SIZE * idx
+                child = tree.add_node()
+                stack.append((child, next_idx))
+                children.append(child)
 
-        # Visit children
-        for i in range(2):
-            decoder.rom.seek(addr + i)
-            offset = decoder.rom.read_u8()
-            next_idx = idx + offset + 1
-            node.children[i] = _decode_txt_tree(decoder, next_idx)
+            tree.set_children(node, *children)
 
-    return node
+    return tree
 
 
 def build_txt_tree(rom, idx):
@@ -139,6 +264,5 @@ def build_txt_tree(rom, idx):
     logging.debug("data_offset=0x%04X", data_offset)
 
     decoder = _DecodeTreeDecoder(rom, tree_addr, data_offset)
-    root = _decode_txt_tree(decoder)
 
-    return Tree(root)
+    return _decode_txt_tree(decoder)
@@ -0,0 +1,160 @@
+import os
+import array
+import struct
+import hashlib
+import logging
+import sd3.rom
+import sd3.cache_utils
+import sd3.tree
+import sd3.bitutils
+
+# Trees used by the game: the control tree and the four text trees
+_CTRL_TREE_KEY = 0xFF
+_TXT_TREE_COUNT = 4
+
+_MAGIC = b"SD3T"
+_FORMAT_VERSION = 1
+
+_HEADER = struct.Struct("<4sHH")
+_TREE_HEADER = struct.Struct("<BI")
+
+_TREE_KEYS = set(range(_TXT_TREE_COUNT)) | {_CTRL_TREE_KEY}
+
+# The trees depend on the ROM and on the code building them: the tree
+# addresses and the node reads of sd3.tree, the bit reads of sd3.bitutils
+# and the tree keys of this module
+_BUILDER_FILES = [
+    sd3.bitutils.__file__,
+    sd3.tree.__file__,
+    __file__,
+]
+
+_builder_version = None
+
+
+def get_builder_version():
+    global _builder_version
+
+    if _builder_version is None:
+        sha1 = hashlib.sha1()
+
+        for path in _BUILDER_FILES:
+            with open(path, "rb") as f:
+                sha1.update(f.read())
+
+        _builder_version = sha1.hexdigest()
+
+    return _builder_version
+
+
+class TreeRegistry:
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+
+        # Compiled trees, indexed by ROM SHA-1 then by tree key
+        self.trees = {}
+
+    def _get_cache_path(self, sha1):
+        return os.path.join(self.cache_dir, "trees-%s-%s.bin" %
+                            (sha1, get_builder_version()))
+
+    @staticmethod
+    def _unpack(data):
+        magic, version, count = _HEADER.unpack_from(data, 0)
+        if magic != _MAGIC or version != _FORMAT_VERSION:
+            return None
+
+        trees = {}
+        offset = _HEADER.size
+        for _ in range(count):
+            key, node_count = _TREE_HEADER.unpack_from(data, offset)
+            offset += _TREE_HEADER.size
+
+            arrays = []
+            for _ in range(3):
+                a = array.array("H")
+                size = node_count * a.itemsize
+                if offset + size > len(data):
+                    raise ValueError("Truncated tree %02X" % key)
+
+                a.frombytes(data[offset:offset+size])
+                offset += size
+                arrays.append(a)
+
+            trees[key] = sd3.tree.Tree.from_arrays(*arrays)
+
+        if offset != len(data):
+            raise ValueError("Unexpected data after the trees")
+
+        if set(trees.keys()) != _TREE_KEYS:
+            raise ValueError("Unexpected tree keys")
+
+        return trees
+
+    def _save(self, path, trees):
+        out = bytearray(_HEADER.pack(_MAGIC, _FORMAT_VERSION, len(trees)))
+
+        for key, tree in trees.items():
+            arrays = tree.to_arrays()
+            out += _TREE_HEADER.pack(key, len(arrays[0]))
+
+            for a in arrays:
+                out += a.tobytes()
+
+        sd3.cache_utils.write_atomic(path, out)
+
+    @staticmethod
+    def _build(rom):
+        rom = sd3.rom.Rom.from_rom(rom)
+
+        trees = {_CTRL_TREE_KEY: sd3.tree.build_ctrl_tree(rom)}
+        for idx in range(_TXT_TREE_COUNT):
+            trees[idx] = sd3.tree.build_txt_tree(rom, idx)
+
+        return trees
+
+    def _get_trees(self, rom):
+        sha1 = rom.get_sha1()
+
+        compiled = self.trees.get(sha1)
+        if compiled is not None:
+            return compiled
+
+        trees = None
+        if self.cache_dir is not None:
+            path = self._get_cache_path(sha1)
+            # A corrupt or truncated file is a cache miss
+            trees = sd3.cache_utils.load(path, self._unpack, "tree cache")
+
+        if trees is None:
+            logging.debug("Build trees of ROM %s", sha1)
+            trees = self._build(rom)
+
+            if self.cache_dir is not None:
+                self._save(path, trees)
+
+        compiled = {key: tree.compile() for key, tree in trees.items()}
+        self.trees[sha1] = compiled
+
+        return compiled
+
+    def get_ctrl_tree(self, rom):
+        return self._get_trees(rom)[_CTRL_TREE_KEY]
+
+    def get_txt_tree(self, rom, idx):
+        return self._get_trees(rom)[idx]
+
+
+_registry = TreeRegistry()
+
+
+def set_cache_dir(cache_dir):
+    _registry.cache_dir = cache_dir
+
+
+def get_ctrl_tree(rom):
+    return _registry.get_ctrl_tree(rom)
+
+
+def get_txt_tree(rom, idx):
+    return _registry.get_txt_tree(rom, idx)
@@ -0,0 +1,70 @@
+import io
+import unittest
+import sd3.rom
+import sd3.disasm.cpu
+from sd3.disasm.attributes import Attr
+from sd3.disasm.addr_modes import AddrMode, TargetKind
+import tests.trace_tools
+
+
+class TestDecodeTable(unittest.TestCase):
+    def setUp(self):
+        data = bytes(tests.trace_tools.get_rom_size())
+        rom = sd3.rom.Rom.from_file(io.BytesIO(data), sd3.rom.HighRomConv)
+        self.reader = sd3.disasm.cpu.Reader(rom)
+
+    def test_entries(self):
+        for M in range(2):
+            for X in range(2):
+                p = sd3.disasm.cpu.PRegister(X=X, M=M)
+                table = self.reader.get_decode_table(p)
+                self.assertEqual(len(table), 0x100)
+
+                for code, entry in enumerate(table):
+                    opcode = self.reader.opcode_map.get(code)
+                    if opcode is None:
+                        self.assertIsNone(entry)
+                        continue
+
+                    self.assertIs(entry.opcode, opcode)
+                    self.assertEqual(entry.addr_mode.mode, opcode.addr_mode)
+                    self.assertEqual(
+                        entry.param_len,
+                        entry.addr_mode.get_param_len(opcode, p))
+                    self.assertEqual(entry.attr_mask, opcode.attr_mask)
+                    self.assertIs(entry.target_kind,
+                                  entry.addr_mode.target_kind)
+
+                    if entry.addr_mode.mode in (AddrMode.none,
+                                                AddrMode.accumulator):
+                        self.assertIsNone(entry.param_len)
+                        self.assertIsNone(entry.read_param)
+
+    def test_target_kind(self):
+        table = self.reader.get_decode_table(
+            sd3.disasm.cpu.PRegister(X=1, M=1))
+        # BRA, JSR abs, JSL long, JSR (abs,X)
+        expected = [
+            (0x80, TargetKind.relative),
+            (0x20, TargetKind.bank),
+            (0x22, TargetKind.long),
+            (0xFC, TargetKind.indirect),
+        ]
+        for code, kind in expected:
+            self.assertIs(table[code].target_kind, kind)
+
+    def test_p_state(self):
+        # LDA #imm depends on M, LDX #imm on X
+        for M, X, lda_len, ldx_len in [(0, 0, 2, 2), (0, 1, 2, 1),
+                                       (1, 0, 1, 2), (1, 1, 1, 1)]:
+            p = sd3.disasm.cpu.PRegister(X=X, M=M)
+            table = self.reader.get_decode_table(p)
+
+            self.assertEqual(table[0xA9].param_len, lda_len)
+            self.assertEqual(table[0xA2].param_len, ldx_len)
+
+    def test_attr_mask(self):
+        for opcode in self.reader.opcode_map.values():
+            for attr in Attr:
+                self.assertEqual(bool(opcode.attr_mask & (1 << attr.value)),
+                                 attr in opcode.attrs)
@@ -0,0 +1,76 @@
+import io
+import tempfile
+import unittest
+import sd3.rom
+import sd3.disasm.cpu
+import sd3.disasm.routine_db
+import tests.trace_tools
+
+_ROUTINE_ADDR = 0xC10000
+_SUB_ADDR = 0xC12000
+_INVALID_ADDR = 0xC13000
+
+
+def _get_rom():
+    data = bytearray(tests.trace_tools.get_rom_size())
+
+    def write(addr, code):
+        offset = sd3.rom.HighRomConv.snes_to_rom(addr)
+        data[offset:offset+len(code)] = code
+
+    # JSR $2000 ; RTS
+    write(_ROUTINE_ADDR, bytes.fromhex("20002060"))
+    # REP #$20 ; RTS
+    write(_SUB_ADDR, bytes.fromhex("C22060"))
+    # STP is unknown
+    write(_INVALID_ADDR, bytes.fromhex("DB"))
+
+    return sd3.rom.Rom.from_file(io.BytesIO(bytes(data)),
+                                 sd3.rom.HighRomConv)
+
+
+class TestRoutineDB(unittest.TestCase):
+    def setUp(self):
+        self.rom = _get_rom()
+
+    def test_get(self):
+        routine_db = sd3.disasm.routine_db.RoutineDB(self.rom)
+
+        p = sd3.disasm.cpu.PRegister(X=1, M=1)
+        routine = routine_db.get(_SUB_ADDR, p)
+
+        # P isn't updated, and the routine is read once
+        self.assertEqual((p.X, p.M), (1, 1))
+        self.assertIs(routine_db.get(_SUB_ADDR, p), routine)
+        self.assertIsNot(
+            routine_db.get(_SUB_ADDR, sd3.disasm.cpu.PRegister(X=0, M=0)),
+            routine)
+
+        with self.assertRaises(Exception):
+            routine_db.get(_INVALID_ADDR, p)
+        self.assertIn((_INVALID_ADDR, 1, 1), routine_db.errors)
+
+    def test_explore(self):
+        routine_db = sd3.disasm.routine_db.RoutineDB(self.rom)
+
+        p = sd3.disasm.cpu.PRegister(X=0, M=0)
+        self.assertEqual(routine_db.explore(_ROUTINE_ADDR, p), 2)
+        self.assertSetEqual(set(routine_db.routines.keys()),
+                            {(_ROUTINE_ADDR, 0, 0), (_SUB_ADDR, 0, 0)})
+
+    def test_save_load(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            routine_db = sd3.disasm.routine_db.RoutineDB.for_rom(self.rom,
+                                                                 cache_dir)
+            p = sd3.disasm.cpu.PRegister(X=0, M=0)
+            routine_db.explore(_ROUTINE_ADDR, p)
+            routine_db.save()
+
+            routine_db = sd3.disasm.routine_db.RoutineDB.for_rom(self.rom,
+                                                                 cache_dir)
+            self.assertEqual(len(routine_db.routines), 2)
+
+            routine = routine_db.get(_ROUTINE_ADDR, p)
+            self.assertListEqual([str(instr) for instr in routine.instructions],
+                                 ["C10000 JSR $2000 [C12000]", "C10003 RTS"])
+            self.assertFalse(routine_db.dirty)
@@ -0,0 +1,96 @@
+import io
+import unittest
+import sd3.rom
+import sd3.disasm.cpu
+import sd3.disasm.sweep
+import sd3.disasm.routine_db
+import tests.trace_tools
+
+_CODE_ADDR = 0xC10000
+_RESYNC_ADDR = 0xC12000
+
+
+def _get_rom():
+    data = bytearray(tests.trace_tools.get_rom_size())
+
+    def write(addr, code):
+        offset = sd3.rom.HighRomConv.snes_to_rom(addr)
+        data[offset:offset+len(code)] = code
+
+    # LDA #$1234 ; SEP #$20 ; LDA #$12 ; STP ; BRA -3
+    write(_CODE_ADDR, bytes.fromhex("A93412E220A912DB80FD"))
+    # LDA $60EA, or an unknown byte before NOP ; RTS
+    write(_RESYNC_ADDR, bytes.fromhex("ADEA60"))
+
+    return sd3.rom.Rom.from_file(io.BytesIO(bytes(data)),
+                                 sd3.rom.HighRomConv)
+
+
+class TestSweep(unittest.TestCase):
+    def setUp(self):
+        self.rom = _get_rom()
+        self.p = sd3.disasm.cpu.PRegister(X=0, M=0)
+
+    def test_sweep(self):
+        index = sd3.disasm.sweep.sweep(self.rom, _CODE_ADDR, _CODE_ADDR + 10,
+                                       self.p)
+
+        self.assertListEqual([addr - _CODE_ADDR for addr in index.addrs],
+                             [0, 3, 5, 7, 8])
+        self.assertListEqual(list(index.lengths), [3, 2, 2, 1, 2])
+        self.assertListEqual(
+            [index.is_data(idx) for idx in range(len(index))],
+            [False, False, False, True, False])
+
+        self.assertListEqual(
+            [str(index.get_instruction(idx)) for idx in (0, 2, 4)],
+            ["C10000 LDA #$1234", "C10005 LDA #$12",
+             "C10008 BRA $FD [C10007]"])
+        self.assertIsNone(index.get_instruction(3))
+
+        # The sweep P isn't the caller one
+        self.assertEqual(self.p.M, 0)
+
+    def test_find(self):
+        index = sd3.disasm.sweep.sweep(self.rom, _CODE_ADDR, _CODE_ADDR + 10,
+                                       self.p)
+
+        self.assertEqual(index.find(_CODE_ADDR), 0)
+        self.assertEqual(index.find(_CODE_ADDR + 2), 0)
+        self.assertEqual(index.find(_CODE_ADDR + 4), 1)
+        self.assertEqual(index.find(_CODE_ADDR + 9), 4)
+        self.assertIsNone(index.find(_CODE_ADDR - 1))
+        self.assertIsNone(index.find(_CODE_ADDR + 10))
+
+    def test_truncated(self):
+        # The last instruction doesn't fit in the range
+        index = sd3.disasm.sweep.sweep(self.rom, _CODE_ADDR, _CODE_ADDR + 2,
+                                       self.p)
+        self.assertListEqual(list(index.lengths), [1, 1])
+        self.assertTrue(index.is_data(0))
+
+    def test_unmapped(self):
+        for bank in (0x7E, 0x100):
+            with self.assertRaises(Exception):
+                sd3.disasm.sweep.sweep_bank(self.rom, bank, self.p)
+
+        with self.assertRaises(Exception):
+            sd3.disasm.sweep.sweep(self.rom, 0xBFFFFE, _CODE_ADDR, self.p)
+
+    def test_routine_db(self):
+        routine_db = sd3.disasm.routine_db.RoutineDB(self.rom)
+
+        index = sd3.disasm.sweep.sweep(self.rom, _RESYNC_ADDR,
+                                       _RESYNC_ADDR + 3, self.p, routine_db)
+        self.assertListEqual(list(index.lengths), [3])
+        self.assertFalse(index.is_code(0))
+
+        routine_db.get(_RESYNC_ADDR + 1, self.p)
+
+        index = sd3.disasm.sweep.sweep(self.rom, _RESYNC_ADDR,
+                                       _RESYNC_ADDR + 3, self.p, routine_db)
+        self.assertListEqual(list(index.lengths), [1, 1, 1])
+        self.assertListEqual(
+            [(index.is_code(idx), index.is_data(idx))
+             for idx in range(len(index))],
+            [(False, True), (True, False), (True, False)])
@@ -0,0 +1,79 @@
+import io
+import tempfile
+import unittest
+import sd3.rom
+import sd3.disasm.cpu
+import sd3.disasm.xrefs
+import sd3.disasm.routine_db
+import tests.trace_tools
+from sd3.disasm.xrefs import Xref, XrefKind
+
+_ROUTINE_ADDR = 0xC10000
+_SUB_ADDR = 0xC12000
+_OTHER_ADDR = 0xC13000
+
+
+def _get_rom():
+    data = bytearray(tests.trace_tools.get_rom_size())
+
+    def write(addr, code):
+        offset = sd3.rom.HighRomConv.snes_to_rom(addr)
+        data[offset:offset+len(code)] = code
+
+    # JSR $2000 ; LDA $1234 ; LDA $123456 ; BEQ +1 ; NOP ; JMP $0010 ; RTS
+    write(_ROUTINE_ADDR, bytes.fromhex("200020AD3412AF563412F001EA4C100060"))
+    # RTS
+    write(_SUB_ADDR, bytes.fromhex("60"))
+    # JSL $C12000 ; RTL
+    write(_OTHER_ADDR, bytes.fromhex("220020C16B"))
+
+    return sd3.rom.Rom.from_file(io.BytesIO(bytes(data)),
+                                 sd3.rom.HighRomConv)
+
+
+class TestXrefs(unittest.TestCase):
+    def setUp(self):
+        self.rom = _get_rom()
+        self.routine_db = sd3.disasm.routine_db.RoutineDB(self.rom)
+        self.p = sd3.disasm.cpu.PRegister(X=0, M=0)
+
+    def test_xrefs(self):
+        self.routine_db.explore(_ROUTINE_ADDR, self.p)
+
+        xref_index = sd3.disasm.xrefs.XrefIndex()
+        self.assertEqual(xref_index.update(self.routine_db), 2)
+
+        self.assertListEqual(xref_index.get(_SUB_ADDR),
+                             [Xref(0xC10000, XrefKind.call)])
+        self.assertListEqual(xref_index.get(0xC11234),
+                             [Xref(0xC10003, XrefKind.data)])
+        self.assertListEqual(xref_index.get(0x123456),
+                             [Xref(0xC10006, XrefKind.data)])
+        self.assertListEqual(xref_index.get(0xC1000D),
+                             [Xref(0xC1000A, XrefKind.branch)])
+        self.assertListEqual(xref_index.get(0xC10010),
+                             [Xref(0xC1000D, XrefKind.jump)])
+        self.assertListEqual(xref_index.get(0xC1000C), [])
+
+        self.assertListEqual(xref_index.get(_SUB_ADDR, XrefKind.data), [])
+
+    def test_update(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            self.routine_db.explore(_ROUTINE_ADDR, self.p)
+
+            xref_index = sd3.disasm.xrefs.XrefIndex.for_rom(self.rom,
+                                                            cache_dir)
+            self.assertEqual(xref_index.update(self.routine_db), 2)
+            xref_index.save()
+
+            # Only the new routine is read
+            self.routine_db.explore(_OTHER_ADDR, self.p)
+
+            xref_index = sd3.disasm.xrefs.XrefIndex.for_rom(self.rom,
+                                                            cache_dir)
+            self.assertEqual(xref_index.update(self.routine_db), 1)
+            self.assertEqual(xref_index.update(self.routine_db), 0)
+
+            self.assertListEqual(xref_index.get(_SUB_ADDR),
+                                 [Xref(0xC10000, XrefKind.call),
+                                  Xref(0xC13000, XrefKind.call)])
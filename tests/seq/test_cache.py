@@ -0,0 +1,127 @@
+import hashlib
+import tempfile
+import unittest
+import sd3.rom
+import sd3.seq.cache
+import sd3.seq.ops
+import sd3.seq.reader
+import tests.text_data
+import tests.trace_tools
+
+
+class _SeqObserver(sd3.seq.reader.Observer):
+    def __init__(self):
+        self.decoded = []
+        self.events = []
+
+    def op_started(self, op_id, bit_position):
+        self.events.append(("op", op_id, bit_position))
+
+    def text_decoded(self, decoded):
+        self.decoded.append(decoded)
+        self.events.append(("text", decoded))
+
+    def fragment_referenced(self, sub_idx):
+        self.events.append(("fragment", sub_idx))
+
+
+class TestSequenceCache(unittest.TestCase):
+    def setUp(self):
+        f = tests.trace_tools.FileMock(tests.trace_tools.get_rom_size(),
+                                       tests.text_data.decode_dump)
+        self.rom = sd3.rom.Rom.from_file(f, sd3.rom.HighRomConv)
+
+    def test_save_load(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = sd3.seq.cache.SequenceCache.for_rom(cache_dir, self.rom)
+            cache.put(0xF91234, sd3.seq.cache.CachedSequence(
+                [[0x10, 0x3FF], [], [0x20]], None,
+                [(0x58, 0, 0), (0x5E, 0x12345, 1), (0, 0x20000, 3)],
+                [(0x123, 0), (0x45, 2)]))
+            cache.put(0xF95678, sd3.seq.cache.CachedSequence(
+                [[0x11]], 0x65, [(0x65, 40, 1)], []))
+            cache.save()
+
+            cache = sd3.seq.cache.SequenceCache.for_rom(cache_dir, self.rom)
+            self.assertEqual(cache.get(0xF91234),
+                             ([[0x10, 0x3FF], [], [0x20]], None,
+                              [(0x58, 0, 0), (0x5E, 0x12345, 1),
+                               (0, 0x20000, 3)],
+                              [(0x123, 0), (0x45, 2)]))
+            self.assertEqual(cache.get(0xF95678),
+                             ([[0x11]], 0x65, [(0x65, 40, 1)], []))
+            self.assertIsNone(cache.get(0xF90000))
+
+    def test_changed_handler(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = sd3.seq.cache.SequenceCache.for_rom(cache_dir, self.rom)
+            cache.put(0xF91234, sd3.seq.cache.CachedSequence(
+                [[0x20]], None, [(0x58, 0, 0), (0, 30, 1)], []))
+            cache.put(0xF95678, sd3.seq.cache.CachedSequence(
+                [[0x21]], None, [(0x5E, 0, 0), (0, 30, 1)], []))
+
+            # Simulate an edit of the handler of 0x58
+            cache.handler_versions[0x58] = bytes(20)
+            cache.save()
+
+            cache = sd3.seq.cache.SequenceCache.for_rom(cache_dir, self.rom)
+            self.assertIsNone(cache.get(0xF91234))
+            self.assertIsNotNone(cache.get(0xF95678))
+
+    def test_fixed_length_versions(self):
+        # The source of a fixed length handler includes its decorator, so
+        # its argument count is part of its version
+        versions = sd3.seq.cache.get_handler_versions()
+
+        handler = sd3.seq.ops.get_handlers()[0x03]
+        source = "@_fixed_length(%d)\n" % handler.arg_count
+        source += "def %s(op_id, seq_reader, observer):\n" % handler.__name__
+        source += "    pass\n"
+
+        self.assertEqual(versions[0x03],
+                         hashlib.sha1(source.encode("utf-8")).digest())
+
+    def test_cached_reader(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = sd3.seq.cache.SequenceCache.for_rom(cache_dir, self.rom)
+            reader = sd3.seq.cache.CachedReader(self.rom, cache)
+
+            # First read decodes the sequence
+            observer = _SeqObserver()
+            reader.read_sequence(tests.text_data.decode_idx, observer)
+            self.assertListEqual(observer.decoded,
+                                 tests.text_data.decode_result)
+            events = observer.events
+            cache.save()
+
+            # Second read only uses the cache
+            cache = sd3.seq.cache.SequenceCache.for_rom(cache_dir, self.rom)
+            reader = sd3.seq.cache.CachedReader(self.rom, cache)
+
+            observer = _SeqObserver()
+            reader.read_sequence(tests.text_data.decode_idx, observer)
+            self.assertListEqual(observer.decoded,
+                                 tests.text_data.decode_result)
+            self.assertListEqual(observer.events, events)
+            self.assertIsNone(reader.reader)
+
+    def test_cached_error(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = sd3.seq.cache.SequenceCache.for_rom(cache_dir, self.rom)
+
+        cache.put(0xF91234, sd3.seq.cache.CachedSequence(
+            [[0x20]], 0x65, [(0x58, 0, 0), (0x65, 30, 1)], [(0x12, 0)]))
+        reader = sd3.seq.cache.CachedReader(self.rom, cache)
+
+        observer = _SeqObserver()
+        with self.assertRaises(sd3.seq.reader.ReadException) as ctx:
+            reader.read_sequence_from_addr(0xF91234, observer)
+
+        self.assertEqual(ctx.exception.op_id, 0x65)
+        self.assertListEqual(observer.events, [
+            ("op", 0x58, 0), ("fragment", 0x12), ("text", [0x20]),
+            ("op", 0x65, 30)])
+
+
+if __name__ == '__main__':
+    unittest.main()
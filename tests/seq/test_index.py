@@ -0,0 +1,87 @@
+import io
+import random
+import struct
+import unittest
+import sd3.rom
+import sd3.seq.index
+import sd3.seq.reader
+import tests.trace_tools
+
+
+def _get_rom(ptrs):
+    data = bytearray(tests.trace_tools.get_rom_size())
+
+    offset = sd3.rom.HighRomConv.snes_to_rom(sd3.seq.index.PTR_BASE)
+    data[offset:offset + 2 * len(ptrs)] = struct.pack("<%dH" % len(ptrs),
+                                                      *ptrs)
+
+    return sd3.rom.Rom.from_file(io.BytesIO(data), sd3.rom.HighRomConv)
+
+
+class TestSequenceIndex(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(1)
+
+        # Few distinct pointers to get aliases in every bank
+        self.ptrs = [rnd.choice([0x1000, 0x2000, 0x3000])
+                     for _ in range(sd3.seq.index.SEQ_COUNT)]
+        self.rom = _get_rom(self.ptrs)
+        self.index = sd3.seq.index.SequenceIndex.from_rom(self.rom)
+
+    def test_addr(self):
+        self.assertEqual(len(self.index), sd3.seq.index.SEQ_COUNT)
+
+        for idx in range(sd3.seq.index.SEQ_COUNT):
+            self.assertEqual(self.index.get_addr(idx),
+                             sd3.seq.reader.get_sequence_addr(self.rom, idx))
+
+    def test_aliases(self):
+        expected = {}
+        for idx in range(sd3.seq.index.SEQ_COUNT):
+            expected.setdefault(self.index.get_addr(idx), []).append(idx)
+
+        for idx in range(sd3.seq.index.SEQ_COUNT):
+            aliases = expected[self.index.get_addr(idx)]
+            self.assertEqual(self.index.get_aliases(self.index.get_addr(idx)),
+                             aliases)
+            self.assertEqual(self.index.get_main_idx(idx), aliases[0])
+
+        self.assertEqual(self.index.get_aliases(0x123456), [])
+
+    def _get_unique(self, indexes):
+        unique = []
+        seen = set()
+        for idx in indexes:
+            addr = self.index.get_addr(idx)
+            if addr not in seen:
+                seen.add(addr)
+                unique.append((idx, addr))
+
+        return unique
+
+    def test_iter_unique(self):
+        indexes = range(sd3.seq.index.SEQ_COUNT)
+        self.assertEqual(list(self.index.iter_unique()),
+                         self._get_unique(indexes))
+
+        # Across a bank change
+        indexes = range(0x5F0, 0x610)
+        self.assertEqual(list(self.index.iter_unique(indexes)),
+                         self._get_unique(indexes))
+
+    def test_iter_unique_range(self):
+        count = sd3.seq.index.SEQ_COUNT
+        for indexes in (range(count - 1, count + 1), [-1, 0]):
+            with self.assertRaises(ValueError):
+                list(self.index.iter_unique(indexes))
+
+        self.assertEqual(list(self.index.iter_unique([])), [])
+
+    def test_bank(self):
+        self.assertEqual(sd3.seq.index.SequenceIndex.get_bank(0), 0xF9)
+        self.assertEqual(sd3.seq.index.SequenceIndex.get_bank(0x600), 0xFA)
+        self.assertEqual(sd3.seq.index.SequenceIndex.get_bank(0xBFF), 0xFB)
+        self.assertEqual(sd3.seq.index.SequenceIndex.get_bank(0xFFF), 0xF8)
+
+        with self.assertRaises(Exception):
+            sd3.seq.index.SequenceIndex.get_bank(0x1000)
@@ -0,0 +1,59 @@
+import unittest
+import sd3.rom
+import sd3.seq.ops
+import sd3.seq.reader
+import tests.text_data
+import tests.trace_tools
+
+
+class _OpObserver(sd3.seq.reader.Observer):
+    def __init__(self):
+        self.op_ids = []
+
+    def op_started(self, op_id, bit_position):
+        self.op_ids.append(op_id)
+
+
+class TestOpTable(unittest.TestCase):
+    def setUp(self):
+        f = tests.trace_tools.FileMock(tests.trace_tools.get_rom_size(),
+                                       tests.text_data.decode_dump)
+        self.rom = sd3.rom.Rom.from_file(f, sd3.rom.HighRomConv)
+
+    def test_fixed_length(self):
+        table = sd3.seq.ops.compile_op_table(self.rom)
+
+        # The handler of a fixed operation must read as many values as
+        # skipped by the reader
+        for op_id, entry in enumerate(table.entries):
+            if entry.kind != sd3.seq.ops.OpKind.fixed:
+                continue
+
+            read = []
+            next_ctrl_byte = entry.handler(op_id, lambda: read.append(0),
+                                           sd3.seq.reader.Observer())
+
+            self.assertIsNone(next_ctrl_byte)
+            self.assertEqual(len(read), entry.arg_count,
+                             "Operation %02X" % op_id)
+
+    def test_text_ops(self):
+        table = sd3.seq.ops.compile_op_table(self.rom)
+
+        for op_id in [0x58, 0x5E]:
+            self.assertEqual(table.entries[op_id].kind,
+                             sd3.seq.ops.OpKind.handler)
+
+    def test_op_events(self):
+        decoder = sd3.seq.reader.Reader(self.rom)
+
+        # Observers without op_started don't get the operations
+        self.assertFalse(
+            sd3.seq.reader.wants_op_events(sd3.seq.reader.Observer()))
+
+        observer = _OpObserver()
+        self.assertTrue(sd3.seq.reader.wants_op_events(observer))
+
+        decoder.read_sequence(tests.text_data.decode_idx, observer)
+        self.assertEqual(observer.op_ids[-1], 0)
+        self.assertGreater(len(observer.op_ids), 1)
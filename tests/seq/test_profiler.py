@@ -0,0 +1,75 @@
+import os
+import json
+import tempfile
+import unittest
+import sd3.rom
+import sd3.seq.profiler
+import sd3.seq.reader
+import tests.text_data
+import tests.trace_tools
+
+
+class _SeqObserver(sd3.seq.reader.Observer):
+    def __init__(self):
+        self.decoded = []
+        self.ops = []
+
+    def op_started(self, op_id, bit_position):
+        self.ops.append((op_id, bit_position))
+
+    def text_decoded(self, decoded):
+        self.decoded.append(decoded)
+
+
+class TestProfiler(unittest.TestCase):
+    def setUp(self):
+        f = tests.trace_tools.FileMock(tests.trace_tools.get_rom_size(),
+                                       tests.text_data.decode_dump)
+        self.rom = sd3.rom.Rom.from_file(f, sd3.rom.HighRomConv)
+
+    def test_profile(self):
+        profiler = sd3.seq.profiler.Profiler()
+        decoder = sd3.seq.reader.Reader(self.rom)
+        reader = sd3.seq.profiler.ProfiledReader(decoder, profiler)
+
+        observer = _SeqObserver()
+        reader.read_sequence(tests.text_data.decode_idx, observer)
+
+        # The profiled observer still gets the events
+        self.assertListEqual(observer.decoded, tests.text_data.decode_result)
+
+        expected = {}
+        for op_id, _ in observer.ops[:-1]:
+            expected[op_id] = expected.get(op_id, 0) + 1
+
+        self.assertEqual({op_id: stats.count
+                          for op_id, stats in profiler.ops.items()},
+                         expected)
+
+        seq_addr = decoder.get_sequence_addr(tests.text_data.decode_idx)
+        seq_stats = profiler.sequences[seq_addr]
+        self.assertEqual(seq_stats.op_count, len(observer.ops) - 1)
+        self.assertEqual(seq_stats.bits, observer.ops[-1][1])
+        self.assertEqual(sum(stats.bits for stats in profiler.ops.values()),
+                         seq_stats.bits)
+        self.assertEqual(sum(profiler.fragments.values()), seq_stats.jumps)
+        self.assertIsNone(seq_stats.error_op_id)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            json_path = os.path.join(tmp_dir, "profile.json")
+            profiler.write_json(json_path)
+            with open(json_path) as f:
+                data = json.load(f)
+
+            self.assertEqual(data["sequences"]["%06X" % seq_addr]["op_count"],
+                             seq_stats.op_count)
+
+            collapsed_path = os.path.join(tmp_dir, "profile.txt")
+            profiler.write_collapsed(collapsed_path)
+            with open(collapsed_path) as f:
+                stacks = [line.split() for line in f]
+
+            self.assertEqual(len(stacks), len(profiler.ops))
+            for stack, value in stacks:
+                self.assertTrue(stack.startswith("seq_%06X;op_" % seq_addr))
+                self.assertGreaterEqual(int(value), 0)
@@ -1,20 +1,9 @@
+import random
+import struct
 import unittest
+import sd3.rom
 import sd3.bitutils
-
-
-class _U16Generator:
-    def __init__(self, values):
-        self.values = values
-        self.idx = 0
-
-    def __call__(self):
-        if self.idx < len(self.values):
-            v = self.values[self.idx]
-            self.idx += 1
-        else:
-            v = None
-
-        return v
+import tests.trace_tools
 
 
 class TestBitReader(unittest.TestCase):
@@ -25,7 +14,7 @@ class TestBitReader(unittest.TestCase):
             0b1100110111101111
         ]
 
-        self.src = _U16Generator(values)
+        self.src = tests.trace_tools.U16Generator(values)
 
     def tearDown(self):
         self.src = None
@@ -64,5 +53,75 @@ class TestBitReader(unittest.TestCase):
         self.assertIsNone(v)
 
 
+class TestRomBitReader(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(0)
+        self.data = bytearray(rnd.getrandbits(8) for _ in range(256))
+
+        file_mock = tests.trace_tools.FileMock(tests.trace_tools.get_rom_size(),
+                                               {0x100: self.data})
+        self.rom = sd3.rom.Rom.from_file(file_mock, sd3.rom.HighRomConv)
+
+    def _get_u16_reader(self):
+        words = [(self.data[i] << 8) | self.data[i+1]
+                 for i in range(0, len(self.data), 2)]
+
+        return sd3.bitutils.BitReader.from_src(
+            tests.trace_tools.U16Generator(words), 16)
+
+    def test_compat(self):
+        rnd = random.Random(1)
+        reader = sd3.bitutils.BitReader.from_rom_u16_big(self.rom, 0xC00100)
+        ref_reader = self._get_u16_reader()
+
+        position = 0
+        while position < 8 * len(self.data) - 64:
+            count = rnd.randint(1, 20)
+            position += count
+
+            self.assertEqual(reader.read_bits(count),
+                             ref_reader.read_bits(count))
+
+            self.assertEqual(reader.bit_position(), position)
+            self.assertEqual(reader.count, ref_reader.count)
+            self.assertEqual(reader.value, ref_reader.value)
+
+    def test_peek_skip(self):
+        reader = sd3.bitutils.BitReader.from_rom_u16_big(self.rom, 0xC00100)
+        first_bytes = (self.data[0] << 16) | (self.data[1] << 8) | self.data[2]
+
+        self.assertEqual(reader.peek_bits(24), first_bytes)
+        self.assertEqual(reader.bit_position(), 0)
+
+        reader.skip_bits(4)
+        self.assertEqual(reader.bit_position(), 4)
+        self.assertEqual(reader.peek_bits(8), (first_bytes >> 12) & 0xFF)
+        self.assertEqual(reader.read_bits(20), first_bytes & 0xFFFFF)
+        self.assertEqual(reader.bit_position(), 24)
+
+    def test_rom_end(self):
+        # Streams can end in the last bytes of the ROM
+        rom_size = tests.trace_tools.get_rom_size()
+        file_mock = tests.trace_tools.FileMock(rom_size,
+                                               {rom_size - 2: [0xAB, 0xCD]})
+        rom = sd3.rom.Rom.from_file(file_mock, sd3.rom.HighRomConv)
+
+        addr = sd3.rom.HighRomConv.rom_to_snes(rom_size - 2)
+        reader = sd3.bitutils.BitReader.from_rom_u16_big(rom, addr)
+
+        self.assertEqual(reader.peek_bits(24), 0xABCD00)
+        self.assertEqual(reader.read_bits(16), 0xABCD)
+        self.assertEqual(reader.bit_position(), 16)
+
+        # The padding can only be peeked
+        with self.assertRaises(struct.error):
+            reader.read_bits(1)
+
+        reader = sd3.bitutils.BitReader.from_rom_u16_big(rom, addr)
+        reader.skip_bits(12)
+        with self.assertRaises(struct.error):
+            reader.skip_bits(8)
+
+
 if __name__ == '__main__':
     unittest.main()
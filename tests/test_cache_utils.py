@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+import sd3.cache_utils
+
+
+class TestCacheUtils(unittest.TestCase):
+    def test_write_atomic(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "sub", "cache.bin")
+            sd3.cache_utils.write_atomic(path, b"abc")
+            sd3.cache_utils.write_atomic(path, b"de")
+
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), b"de")
+
+            # No temporary file is left
+            self.assertEqual(os.listdir(os.path.dirname(path)),
+                             ["cache.bin"])
+
+    def test_load(self):
+        data = {"version": 2, "values": [1, 2]}
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for ext, save, load in (
+                    ("pickle", sd3.cache_utils.save_pickle,
+                     sd3.cache_utils.load_pickle),
+                    ("json", sd3.cache_utils.save_json,
+                     sd3.cache_utils.load_json)):
+                path = os.path.join(tmp_dir, "cache." + ext)
+                self.assertIsNone(load(path, "cache", 2))
+
+                save(path, data)
+                self.assertEqual(load(path, "cache", 2), data)
+                self.assertIsNone(load(path, "cache", 1))
+
+                # A truncated file is a miss
+                with open(path, "r+b") as f:
+                    f.truncate(5)
+
+                with self.assertLogs(level="WARNING"):
+                    self.assertIsNone(load(path, "cache", 2))
+
+    def test_unpack_error(self):
+        def unpack(data):
+            raise ValueError("Bad data")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "cache.bin")
+            sd3.cache_utils.write_atomic(path, b"abc")
+
+            self.assertEqual(sd3.cache_utils.load(path, bytes, "cache"),
+                             b"abc")
+            with self.assertLogs(level="WARNING"):
+                self.assertIsNone(sd3.cache_utils.load(path, unpack, "cache"))
+
+
+if __name__ == '__main__':
+    unittest.main()
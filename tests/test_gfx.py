@@ -1,4 +1,6 @@
+import io
 import sys
+import random
 import unittest
 import sd3.gfx
 import tests.trace_tools
@@ -19,6 +21,103 @@ class TestReadTile(unittest.TestCase):
             self.assertListEqual(decoded.get_raw_content(), c.decoded)
 
 
+class TestDecodeFont(unittest.TestCase):
+    def test_random(self):
+        COUNT = 500
+        CHAR_SIZE = 25
+
+        rnd = random.Random(0)
+        raw = bytes(rnd.getrandbits(8) for _ in range(COUNT * CHAR_SIZE))
+
+        atlas = sd3.gfx.decode_font(raw, COUNT)
+        self.assertEqual(atlas.shape, (COUNT, 14, 14))
+
+        for i in range(COUNT):
+            raw_char = raw[i*CHAR_SIZE:(i+1)*CHAR_SIZE]
+            tile = sd3.gfx._FontCharReader(raw_char).decode()
+
+            self.assertListEqual(atlas[i].ravel().tolist(),
+                                 tile.get_raw_content())
+
+
+def _get_random_rom():
+    rnd = random.Random(1)
+    data = rnd.randbytes(tests.trace_tools.get_rom_size())
+    return sd3.rom.Rom.from_file(io.BytesIO(data), sd3.rom.HighRomConv)
+
+
+class TestRender(unittest.TestCase):
+    WHITE = (255, 255, 255)
+    BLACK = (0, 0, 0)
+    BLUE = (0, 0, 255)
+
+    def check_char(self, img, tile, start_x, start_y):
+        for x in range(14):
+            for y in range(14):
+                color = self.WHITE if tile[x, y] else self.BLACK
+                self.assertEqual(img.getpixel((start_x+x, start_y+2*y)),
+                                 color)
+                self.assertEqual(img.getpixel((start_x+x, start_y+2*y+1)),
+                                 color)
+
+    def test_dialog(self):
+        rom = _get_random_rom()
+        font_reader = sd3.gfx.FontReader(rom)
+        drawer = sd3.gfx.DialogDrawer(rom)
+
+        # Control codes aren't drawn, 0x3FF is after the font
+        dialog = [[0x20, 0x10, 0x150], [0x3FF]]
+        img = drawer.render(dialog)
+        self.assertEqual(img.size, (2 * 16, 2 * 28))
+
+        self.check_char(img, font_reader.read_char(0x00), 0, 0)
+        self.check_char(img, font_reader.read_char(0x130), 16, 0)
+        self.check_char(img, font_reader.read_char(0x3DF), 0, 28)
+
+        for y in range(56):
+            self.assertEqual(img.getpixel((14, y)), self.BLACK)
+
+    def test_glyph_cache(self):
+        rom = _get_random_rom()
+        font_reader = sd3.gfx.FontReader(rom)
+        cache = sd3.gfx.GlyphCache(font_reader)
+
+        dialog = [[0x20, 0x21, 0x20], [0x21]]
+        img = sd3.gfx.DialogDrawer(rom).render(dialog)
+
+        drawer = sd3.gfx.DialogDrawer(rom, cache)
+        self.assertEqual(drawer.render(dialog).tobytes(), img.tobytes())
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+        # The cache is shared
+        drawer = sd3.gfx.DialogDrawer(rom, cache)
+        self.assertEqual(drawer.render(dialog).tobytes(), img.tobytes())
+        self.assertEqual((cache.hits, cache.misses), (6, 2))
+
+        cache.fill()
+        self.assertEqual(len(cache.tiles), 988)
+
+    def test_font(self):
+        rom = _get_random_rom()
+        font_reader = sd3.gfx.FontReader(rom)
+        img = sd3.gfx.FontImgBuilder(font_reader).render()
+
+        # 16 columns, 62 rows
+        self.assertEqual(img.size, (1 + 15 * 16, 1 + 29 * 62))
+
+        for x in range(img.width):
+            self.assertEqual(img.getpixel((x, 0)), self.BLUE)
+            self.assertEqual(img.getpixel((x, img.height - 1)), self.BLUE)
+
+        for y in range(img.height):
+            self.assertEqual(img.getpixel((0, y)), self.BLUE)
+            self.assertEqual(img.getpixel((img.width - 1, y)), self.BLUE)
+
+        self.check_char(img, font_reader.read_char(0), 1, 1)
+        self.check_char(img, font_reader.read_char(987), 1 + 15 * 11,
+                        1 + 29 * 61)
+
+
 if __name__ == '__main__':
     if len(sys.argv) == 1:
         print("Missing ROM param")
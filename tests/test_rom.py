@@ -1,3 +1,5 @@
+import os
+import tempfile
 import unittest
 import sd3.rom
 import tests.trace_tools
@@ -46,6 +48,62 @@ class TestRom(unittest.TestCase):
         addr = rom.read_addr_from_ptr(0xFEC000, 1640, 0xF8)
         self.assertEqual(addr, 0xF83412)
 
+    def test_read_at(self):
+        data_map = {
+            0x000000: bytearray.fromhex("001122334455"),
+        }
+
+        file_mock = tests.trace_tools.FileMock(tests.trace_tools.get_rom_size(),
+                                               data_map)
+        rom = sd3.rom.Rom.from_file(file_mock, sd3.rom.HighRomConv)
+        rom.seek(0xC00004)
+
+        # Positional reads don't move the cursor
+        self.assertEqual(rom.read_u8_at(0xC00001), 0x11)
+        self.assertEqual(rom.read_u16_at(0xC00002), 0x3322)
+        self.assertEqual(
+            rom.read_u16_at(0xC00002, endianess=sd3.rom.BIG_ENDIAN), 0x2233)
+        self.assertEqual(bytes(rom.read_buf_at(0xC00003, 2)), b"\x33\x44")
+
+        self.assertEqual(rom.tell(), 0xC00004)
+        self.assertEqual(rom.read_u8(), 0x44)
+
+    def test_ptr_table(self):
+        data_map = {
+            0x000000: bytearray.fromhex("3412FFFF0000785600"),
+        }
+
+        file_mock = tests.trace_tools.FileMock(tests.trace_tools.get_rom_size(),
+                                               data_map)
+        rom = sd3.rom.Rom.from_file(file_mock, sd3.rom.HighRomConv)
+
+        table = rom.read_ptr_table(0xC00000, 4, 0xF8)
+        self.assertListEqual(table.tolist(),
+                             [0xF81234, 0xF8FFFF, 0xF80000, 0xF85678])
+        self.assertListEqual(table.tolist(),
+                             [rom.read_addr_from_ptr(0xC00000, i, 0xF8)
+                              for i in range(4)])
+
+        # The cached table is shared by the copies of the ROM
+        table = rom.get_ptr_table(0xC00000, 4, 0xF8)
+        copy = sd3.rom.Rom.from_rom(rom)
+        self.assertIs(copy.get_ptr_table(0xC00000, 4, 0xF8), table)
+        self.assertIsNot(rom.get_ptr_table(0xC00000, 3, 0xF8), table)
+        self.assertFalse(table.flags.writeable)
+
+    def test_from_path(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "rom.smc")
+            with open(path, "wb") as f:
+                f.write(bytes.fromhex("AABBCCDD"))
+
+            rom = sd3.rom.Rom.from_path(path, sd3.rom.HighRomConv)
+            rom.seek(0xC00000)
+
+            self.assertEqual(rom.read_u16(), 0xBBAA)
+            self.assertEqual(rom.read_i8(), -52)
+            self.assertEqual(rom.read_u16_at(0xC00002), 0xDDCC)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -25,6 +25,27 @@ class TestText(unittest.TestCase):
 
         self.assertListEqual(observer.decoded, tests.text_data.decode_result)
 
+    def test_fragment_cache(self):
+        f = tests.trace_tools.FileMock(tests.trace_tools.get_rom_size(),
+                                       tests.text_data.decode_dump)
+        rom = sd3.rom.Rom.from_file(f, sd3.rom.HighRomConv)
+
+        decoder = sd3.seq.reader.Reader(rom)
+        txt_reader = decoder.op_table.entries[0x58].handler
+
+        decoder.read_sequence(tests.text_data.decode_idx,
+                              TestText.SeqObserver())
+        misses = txt_reader.fragment_misses
+        self.assertGreater(misses, 0)
+
+        # The second decode only uses the cached sub-blocks
+        observer = TestText.SeqObserver()
+        decoder.read_sequence(tests.text_data.decode_idx, observer)
+
+        self.assertListEqual(observer.decoded, tests.text_data.decode_result)
+        self.assertEqual(txt_reader.fragment_misses, misses)
+        self.assertGreater(txt_reader.fragment_hits, 0)
+
 
 if __name__ == '__main__':
     if len(sys.argv) == 1:
@@ -0,0 +1,151 @@
+import os
+import json
+import tempfile
+import unittest
+import sd3.rom
+import sd3.fragment_index
+import sd3.text_dumper
+import sd3.text_table
+import tests.text_data
+import tests.trace_tools
+
+_TBL_PATH = os.path.join(os.path.dirname(__file__), "..", "text",
+                         "sd3_table.txt")
+
+
+class TestTextDumper(unittest.TestCase):
+    def setUp(self):
+        f = tests.trace_tools.FileMock(tests.trace_tools.get_rom_size(),
+                                       tests.text_data.decode_dump)
+        self.rom = sd3.rom.Rom.from_file(f, sd3.rom.HighRomConv)
+
+        self.tbl = sd3.text_table.Table()
+        self.tbl.load(_TBL_PATH)
+
+    def get_records(self):
+        return list(sd3.text_dumper.iter_sequences(
+            self.rom, [tests.text_data.decode_idx]))
+
+    def test_iter_sequences(self):
+        records = self.get_records()
+        self.assertEqual(len(records), 1)
+
+        record = records[0]
+        self.assertEqual(record.idx, tests.text_data.decode_idx)
+        self.assertEqual(record.status, sd3.text_dumper.SequenceStatus.ok)
+        self.assertListEqual(record.blocks, tests.text_data.decode_result)
+
+        # The stream ends with the operation 0, after the text
+        op_id, bit_position, block_count = record.ops[-1]
+        self.assertEqual(op_id, 0)
+        self.assertEqual(block_count, len(record.blocks))
+
+        positions = [op[1] for op in record.ops]
+        self.assertListEqual(positions, sorted(positions))
+
+    def test_export(self):
+        records = self.get_records()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            jsonl_path = os.path.join(tmp_dir, "out.jsonl")
+            renderer = sd3.text_dumper._TextRenderer(self.tbl)
+
+            writer = sd3.text_dumper._JsonlWriter(renderer, jsonl_path)
+            sd3.text_dumper._write_records(records, writer)
+            writer.close()
+
+            bin_path = os.path.join(tmp_dir, "out.bin")
+            writer = sd3.text_dumper._BinaryWriter(renderer, bin_path)
+            sd3.text_dumper._write_records(records, writer)
+            writer.close()
+
+            with open(jsonl_path) as f:
+                jsonl_records = [json.loads(line) for line in f]
+
+            bin_records = list(sd3.text_dumper.read_binary_export(bin_path))
+
+        self.assertListEqual(jsonl_records, bin_records)
+
+        record = jsonl_records[0]
+        self.assertEqual(record["addr"], records[0].addr)
+        self.assertListEqual(record["blocks"], tests.text_data.decode_result)
+        self.assertEqual(record["text"][0],
+                         sd3.text_dumper.format_txt(self.tbl,
+                                                    record["blocks"][0]))
+
+    def test_fragment_index(self):
+        records = self.get_records()
+
+        # Nested sub-blocks are referenced after the sub-block using them
+        sub_idxs = [sub_idx for sub_idx, _ in records[0].fragments]
+        start = sub_idxs.index(0x334)
+        self.assertListEqual(sub_idxs[start:start+3], [0x334, 0xBBB, 0x5EB])
+
+        indexer = sd3.fragment_index.Indexer(self.rom)
+        for record in records:
+            indexer.add(record)
+
+        index = indexer.index
+        self.assertListEqual(index.get_fragments(), sorted(set(sub_idxs)))
+        for sub_idx in sub_idxs:
+            self.assertIn(tests.text_data.decode_idx,
+                          index.get_sequences(sub_idx))
+
+        self.assertListEqual(index.get_sequences(0xFFFF), [])
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = sd3.fragment_index.get_index_path(tmp_dir, self.rom)
+            index.save(path)
+
+            loaded = sd3.fragment_index.FragmentIndex.load(path)
+            self.assertEqual(loaded.sequences, index.sequences)
+
+            # An index built with other handlers is ignored
+            with open(path) as f:
+                data = json.load(f)
+
+            data["handlers"] = "0" * 40
+            with open(path, "w") as f:
+                json.dump(data, f)
+
+            self.assertIsNone(sd3.fragment_index.FragmentIndex.load(path))
+
+    def test_manifest(self):
+        def build_record(seq_addr, blocks):
+            return sd3.text_dumper.SequenceRecord(
+                0, seq_addr, blocks, sd3.text_dumper.SequenceStatus.ok,
+                None, [], [])
+
+        records = [
+            build_record(0xF90000, [[0x20, 0x19, 0x21]]),
+            build_record(0xF90010, [[0x21, 0x17, 0x22]]),
+            build_record(0xF90020, [[0x22]]),
+        ]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            manifest_path = os.path.join(tmp_dir, "text.json")
+
+            renderer = sd3.text_dumper._TextRenderer(self.tbl, manifest_path)
+            for record in records:
+                renderer.render(record)
+            renderer.save()
+
+            # Only the sequence using the edited entry is rendered again.
+            # 0x21 in the first sequence is a parameter.
+            self.tbl._entries[0x21] = "?"
+            renderer = sd3.text_dumper._TextRenderer(self.tbl, manifest_path)
+            for record in records:
+                self.assertEqual(renderer.render(record),
+                                 [sd3.text_dumper.format_txt(self.tbl, b)
+                                  for b in record.blocks])
+
+            self.assertEqual(renderer.reused_count, 2)
+
+            # A sequence decoded differently is rendered again
+            renderer = sd3.text_dumper._TextRenderer(self.tbl, manifest_path)
+            renderer.render(build_record(0xF90000, [[0x22]]))
+            self.assertEqual(renderer.reused_count, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import pickle
+import random
+import tempfile
+import unittest
+import sd3.rom
+import sd3.tree
+import sd3.tree_registry
+import sd3.bitutils
+import tests.text_data
+import tests.trace_tools
+
+
+class TestCompiledTree(unittest.TestCase):
+    def setUp(self):
+        f = tests.trace_tools.FileMock(tests.trace_tools.get_rom_size(),
+                                       tests.text_data.decode_dump)
+        self.rom = sd3.rom.Rom.from_file(f, sd3.rom.HighRomConv)
+
+        rnd = random.Random(0)
+        self.words = [rnd.getrandbits(16) for _ in range(512)]
+
+    def _decode_all(self, tree):
+        src = tests.trace_tools.U16Generator(self.words)
+        reader = sd3.bitutils.BitReader.from_src(src, 16)
+
+        # Stop before the end of the stream: the last code may be truncated
+        decoded = []
+        while len(self.words) - src.idx > 1:
+            decoded.append(tree.decode(reader))
+
+        # The bit-by-bit and the table-driven decode must stop at the
+        # same position
+        decoded.append((reader.value, reader.count))
+
+        return decoded
+
+    def _check_tree(self, tree):
+        for table_bits in [1, 4, 8, 12]:
+            compiled = tree.compile(table_bits)
+            self.assertListEqual(self._decode_all(tree),
+                                 self._decode_all(compiled))
+
+    def test_ctrl_tree(self):
+        self._check_tree(sd3.tree.build_ctrl_tree(self.rom))
+
+    def test_txt_tree(self):
+        for idx in range(4):
+            self._check_tree(sd3.tree.build_txt_tree(self.rom, idx))
+
+    def test_pickle(self):
+        tree = sd3.tree.build_ctrl_tree(self.rom)
+        compiled = pickle.loads(pickle.dumps(tree.compile()))
+
+        self.assertListEqual(self._decode_all(tree),
+                             self._decode_all(compiled))
+
+
+class TestTreeRegistry(unittest.TestCase):
+    def setUp(self):
+        f = tests.trace_tools.FileMock(tests.trace_tools.get_rom_size(),
+                                       tests.text_data.decode_dump)
+        self.rom = sd3.rom.Rom.from_file(f, sd3.rom.HighRomConv)
+
+    def test_arrays(self):
+        tree = sd3.tree.build_txt_tree(self.rom, 0)
+        arrays = tree.to_arrays()
+
+        loaded = sd3.tree.Tree.from_arrays(*arrays)
+        self.assertEqual(loaded.to_arrays(), arrays)
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            registry = sd3.tree_registry.TreeRegistry(cache_dir)
+            built = registry.get_txt_tree(self.rom, 2)
+
+            # Trees are built once per ROM
+            self.assertIs(registry.get_txt_tree(self.rom, 2), built)
+
+            # A new registry loads the trees from the cache
+            registry = sd3.tree_registry.TreeRegistry(cache_dir)
+            loaded = registry.get_txt_tree(self.rom, 2)
+
+            self.assertIsNot(loaded, built)
+            self.assertEqual(loaded.tree.to_arrays(), built.tree.to_arrays())
+
+    def test_corrupt_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            registry = sd3.tree_registry.TreeRegistry(cache_dir)
+            built = registry.get_txt_tree(self.rom, 2)
+
+            path = registry._get_cache_path(self.rom.get_sha1())
+            self.assertIn(sd3.tree_registry.get_builder_version(), path)
+
+            # A truncated cache is rebuilt
+            for size in (4, 100):
+                with open(path, "r+b") as f:
+                    f.truncate(size)
+
+                registry = sd3.tree_registry.TreeRegistry(cache_dir)
+                loaded = registry.get_txt_tree(self.rom, 2)
+                self.assertEqual(loaded.tree.to_arrays(),
+                                 built.tree.to_arrays())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -50,6 +50,22 @@ class FileMock:
         return self.data
 
 
+class U16Generator:
+    # Gives the values, then None
+    def __init__(self, values):
+        self.values = values
+        self.idx = 0
+
+    def __call__(self):
+        if self.idx < len(self.values):
+            v = self.values[self.idx]
+            self.idx += 1
+        else:
+            v = None
+
+        return v
+
+
 def get_rom_size():
     return _FILE_SIZE
 